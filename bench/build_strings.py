@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Time building large strings up in loops.
+
+./build_strings.py [-c <count>] [-n <runs>]
+
+Each way of building is timed at a few sizes, so how its time grows with the
+length of the string shows up. "concat" flattens its rope once at the end,
+while "concat, flattened" flattens the string after every concatenation, as
+a string without ropes would have to, which makes it quadratic.
+"interpolate" and "concat parts" build the same short line over and over, the
+way logging does, the first with one interpolation and the second with a
+chain of concatenations. This runs the untranslated interpreter.
+
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ripe import interpreter
+from ripe.compiler import compile_ast
+from ripe.parser import parse
+
+
+LOOPS = [
+    ("concat", """
+s = ""
+(1..%d).each do |i|
+    s = s + "abcdefgh"
+end
+s << ""
+"""),
+    ("append", """
+s = ""
+(1..%d).each do |i|
+    s << "abcdefgh"
+end
+s.length
+"""),
+    ("concat, flattened", """
+s = ""
+(1..%d).each do |i|
+    s = s + "abcdefgh"
+    s << ""
+end
+s.length
+"""),
+    ("interpolate", """
+name = "ripe"
+(1..%d).each do |i|
+    line = "[#{name}] step #{name}: #{name}, then #{name}."
+    line << ""
+end
+"""),
+    ("concat parts", """
+name = "ripe"
+(1..%d).each do |i|
+    line = "[" + name + "] step " + name + ": " + name + ", then " + name + "."
+    line << ""
+end
+"""),
+]
+
+
+def best_of(runs, bc):
+    times = []
+    for _ in xrange(runs):
+        start = time.time()
+        interpreter.run(bc)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--count", type=int, default=2000)
+    parser.add_argument("-n", "--runs", type=int, default=3)
+
+    args = parser.parse_args(argv)
+    counts = [args.count, args.count * 2, args.count * 4]
+
+    print "%-20s" % ("",) + "".join("%12d" % (count,) for count in counts)
+    for name, loop in LOOPS:
+        times = [
+            best_of(args.runs, compile_ast(parse(loop % (count,))))
+            for count in counts
+        ]
+        print "%-20s" % (name,) + "".join("%11.3fs" % (t,) for t in times)
+
+if __name__ == '__main__':
+    main()
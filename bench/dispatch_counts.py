@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Count the instructions dispatched by the untranslated interpreter.
+
+./dispatch_counts.py [<script.rb> ...]
+
+Each script is run with and without the bytecode optimizer. With no scripts,
+a few small loops are used instead.
+
+"""
+
+import argparse
+import inspect
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ripe import interpreter
+from ripe.compiler import compile_ast
+from ripe.parser import parse
+
+
+LOOPS = {
+    "count" : """
+n = 0
+while n != 10000
+    n = n + 1
+end
+""",
+    "nested" : """
+i = 0
+total = 0
+while i != 100
+    j = 0
+    while j != 100
+        total = total + i
+        j = j + 1
+    end
+    i = i + 1
+end
+""",
+}
+
+
+def dispatch_line():
+    lines, start = inspect.getsourcelines(interpreter.execute)
+    for offset, line in enumerate(lines):
+        if "jit_merge_point" in line:
+            return start + offset
+    raise LookupError("Couldn't find the dispatch loop in execute.")
+
+
+def count_dispatches(source, optimize):
+    bc = compile_ast(parse(source), optimize=optimize)
+    code, line = interpreter.execute.func_code, dispatch_line()
+    counts = [0]
+
+    def trace(frame, event, arg):
+        if frame.f_code is not code:
+            return None
+        if event == "line" and frame.f_lineno == line:
+            counts[0] += 1
+        return trace
+
+    sys.settrace(trace)
+    try:
+        interpreter.run(bc)
+    finally:
+        sys.settrace(None)
+    return counts[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scripts", nargs="*")
+
+    args = parser.parse_args(argv)
+    if args.scripts:
+        sources = dict((path, open(path).read()) for path in args.scripts)
+    else:
+        sources = LOOPS
+
+    print "%-20s%12s%12s" % ("", "before", "after")
+    for name, source in sorted(sources.iteritems()):
+        before = count_dispatches(source, optimize=False)
+        after = count_dispatches(source, optimize=True)
+        print "%-20s%12d%12d  (%.0f%%)" % (
+            name, before, after, 100.0 * after / before,
+        )
+
+if __name__ == '__main__':
+    main()
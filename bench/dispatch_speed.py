@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Time interpreter-only instruction dispatch, and the size of code objects.
+
+./dispatch_speed.py [-i <iterations>] [-n <runs>]
+
+This runs the untranslated interpreter, so no JIT is involved. The sizes are
+those the code would have once translated, where a list of characters takes
+a byte per item and a list of integers a machine word.
+
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ripe import interpreter
+from ripe.compiler import compile_ast
+from ripe.parser import parse
+
+
+WORD = 8
+
+LOOP = """
+n = 0
+total = 0
+while n != %d
+    total = total + n
+    n = n + 1
+end
+"""
+
+
+def code_size(bc):
+    if bc.code and isinstance(bc.code[0], str):
+        return len(bc.code)
+    return len(bc.code) * WORD
+
+
+def best_of(runs, bc):
+    times = []
+    for _ in xrange(runs):
+        start = time.time()
+        interpreter.run(bc)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--iterations", type=int, default=100000)
+    parser.add_argument("-n", "--runs", type=int, default=5)
+
+    args = parser.parse_args(argv)
+    bc = compile_ast(parse(LOOP % (args.iterations,)))
+    elapsed = best_of(args.runs, bc)
+
+    print "%d loop iterations\t%.3fs" % (args.iterations, elapsed)
+    print "code size\t\t%d bytes" % (code_size(bc),)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""
+Summarize what the JIT did from a PYPYLOG file.
+
+PYPYLOG=jit-log-opt,jit-summary,jit-backend-counts:ripe.log ./ripe-c script.rb
+./jit_report.py ripe.log
+
+The report is the same one that ./ripe-c --jit-stats prints, except that the
+locations of aborted traces aren't in the log, and that it also says how
+often each loop and bridge was entered (from the jit-backend-counts section).
+
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ripe.jitstats import parse_log
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log")
+
+    args = parser.parse_args(argv)
+    with open(args.log) as log:
+        stats = parse_log(log)
+    sys.stdout.write(stats.report())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Measure parser throughput on large generated sources.
+
+./parser_throughput.py [-l <lines>] [-n <runs>]
+
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ripe.parser import parse
+
+
+def generate(lines):
+    """
+    Generate a source file with roughly the given number of lines.
+
+    """
+
+    chunks = []
+    for i in xrange(0, lines, 8):
+        chunks.append(
+            "a%d = %d\n"
+            "b%d = 0x%x + a%d - 0b101\n"
+            "while a%d != b%d do\n"
+            "    a%d = a%d + 1  # count\n"
+            "end\n"
+            "if a%d == b%d then\n"
+            "    puts 'done'\n"
+            "end\n" % ((i, i) + (i,) * 3 + (i,) * 6)
+        )
+    return "".join(chunks)
+
+
+def best_of(runs, source):
+    times = []
+    for _ in xrange(runs):
+        start = time.time()
+        parse(source)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-l", "--lines", type=int, default=5000)
+    parser.add_argument("-n", "--runs", type=int, default=5)
+
+    args = parser.parse_args(argv)
+    source = generate(args.lines)
+    lines = source.count("\n")
+    elapsed = best_of(args.runs, source)
+
+    print "%d lines, %d bytes" % (lines, len(source))
+    print "%.3fs\t%d lines/s" % (elapsed, lines / elapsed)
+
+if __name__ == '__main__':
+    main()
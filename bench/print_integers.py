@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Time printing lots of integers.
+
+./print_integers.py [-c <count>] [-n <runs>] [-o <path>]
+
+Output goes to /dev/null unless a path is given. This runs the untranslated
+interpreter, so it mostly shows the cost of the output path relative to the
+rest of the loop rather than what a translated ripe-c would manage.
+
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ripe import interpreter, output
+from ripe.compiler import compile_ast
+from ripe.parser import parse
+
+
+LOOP = """
+i = 0
+while i != %d
+    puts i
+    i = i + 1
+end
+"""
+
+
+def best_of(runs, bc, path):
+    times = []
+    for _ in xrange(runs):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        output.stdout.redirect(output.Output(fd).get_stream())
+        try:
+            start = time.time()
+            interpreter.run(bc)
+            output.stdout.flush()
+            times.append(time.time() - start)
+        finally:
+            output.stdout.redirect(None)
+            os.close(fd)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--count", type=int, default=10 ** 6)
+    parser.add_argument("-n", "--runs", type=int, default=3)
+    parser.add_argument("-o", "--output", default=os.devnull)
+
+    args = parser.parse_args(argv)
+    bc = compile_ast(parse(LOOP % (args.count,)))
+    elapsed = best_of(args.runs, bc, args.output)
+
+    print "%d integers\t%.3fs\t%d lines/s" % (
+        args.count, elapsed, args.count / elapsed,
+    )
+
+if __name__ == '__main__':
+    main()
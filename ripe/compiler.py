@@ -1,3 +1,20 @@
+from pypy.rlib.rbigint import rbigint
+
+from ripe.objects import (
+    W_BigInteger,
+    W_Integer,
+    W_Method,
+    W_String,
+    W_Symbol,
+    symbols,
+    w_false,
+    w_nil,
+    w_true,
+    wrap_int,
+    wrap_string,
+)
+
+
 bytecodes = [
     "LOAD_CONSTANT",
     "LOAD_VARIABLE",
@@ -7,35 +24,194 @@ bytecodes = [
     "JUMP_IF_TRUE",
     "JUMP_IF_FALSE",
     "JUMP_BACKWARD",
+    "JUMP_IF_EQ",
+    "JUMP_IF_NOT_EQ",
     "BINARY_ADD",
     "BINARY_SUB",
     "BINARY_EQ",
     "BINARY_NEQ",
     "PUTS",  # XXX
+    "LOAD_SELF",
+    "CALL_METHOD",
+    "RETURN_VALUE",
+    "DEFINE_METHOD",
+    "DEFINE_CLASS",
+    "LOAD_NAMED_CONSTANT",
+    "LOAD_INSTANCE_VARIABLE",
+    "STORE_INSTANCE_VARIABLE",
+    "BUILD_ARRAY",
+    "INDEX_LOAD",
+    "INDEX_STORE",
+    "BUILD_RANGE",
+    "GET_ITER",
+    "FOR_ITER",
+    "LOAD_STRING",
+    "BUILD_STRING",
+
+    # superinstructions, which are only produced by the optimizer
+    "INCR_VARIABLE_BY_CONST",
+    "LOAD_VAR_LOAD_CONST",
 ]
 for i, bytecode in enumerate(bytecodes):
         globals()[bytecode] = i
 
 
+JUMPS = [
+    JUMP_IF_TRUE, JUMP_IF_FALSE, JUMP_BACKWARD, JUMP_IF_EQ, JUMP_IF_NOT_EQ,
+    FOR_ITER,
+]
+
+# Instructions which never continue on to the next one.
+TERMINATORS = [RETURN, RETURN_VALUE, JUMP_BACKWARD]
+
+# How many entries each call site's inline cache holds.
+INLINE_CACHE_SIZE = 4
+
+# Each instruction is packed into a single word, with its opcode in the low
+# bits and its argument in the rest. Superinstructions take their second
+# argument from the word after.
+OPCODE_BITS = 8
+OPCODE_MASK = (1 << OPCODE_BITS) - 1
+INSTRUCTION_SIZES = [1] * len(bytecodes)
+for bytecode in [INCR_VARIABLE_BY_CONST, LOAD_VAR_LOAD_CONST]:
+    INSTRUCTION_SIZES[bytecode] = 2
+
+# How much each instruction changes the depth of the stack, and for jumps,
+# how much they change it when they're taken. CALL_METHOD also pops however
+# many arguments it's called with, and BUILD_ARRAY and BUILD_STRING however
+# many items.
+STACK_EFFECTS = [0] * len(bytecodes)
+JUMP_STACK_EFFECTS = [0] * len(bytecodes)
+for bytecode, effect in [
+    (LOAD_CONSTANT, 1), (LOAD_VARIABLE, 1), (ASSIGN, -1), (DISCARD_TOP, -1),
+    (JUMP_IF_TRUE, -1), (JUMP_IF_FALSE, -1), (JUMP_IF_EQ, -2),
+    (JUMP_IF_NOT_EQ, -2), (BINARY_ADD, -1), (BINARY_SUB, -1),
+    (BINARY_EQ, -1), (BINARY_NEQ, -1), (PUTS, -1), (LOAD_VAR_LOAD_CONST, 2),
+    (LOAD_SELF, 1), (RETURN_VALUE, -1),
+    (DEFINE_METHOD, 1), (LOAD_NAMED_CONSTANT, 1),
+    (LOAD_INSTANCE_VARIABLE, 1), (STORE_INSTANCE_VARIABLE, -1),
+    (BUILD_ARRAY, 1), (INDEX_LOAD, -1), (INDEX_STORE, -2), (BUILD_RANGE, -1),
+    (FOR_ITER, 1), (LOAD_STRING, 1), (BUILD_STRING, 1),
+]:
+    STACK_EFFECTS[bytecode] = effect
+# conditional jumps leave nil in place of what they pop when they're taken
+for bytecode, effect in [
+    (JUMP_IF_TRUE, 0), (JUMP_IF_FALSE, 0), (JUMP_IF_EQ, -1),
+    (JUMP_IF_NOT_EQ, -1), (FOR_ITER, 0),
+]:
+    JUMP_STACK_EFFECTS[bytecode] = effect
+
+# The sequences of instructions which are fused into each superinstruction.
+INCREMENT_SEQUENCE = [LOAD_VARIABLE, LOAD_CONSTANT, BINARY_ADD, ASSIGN]
+LOAD_VAR_LOAD_CONST_SEQUENCE = [LOAD_VARIABLE, LOAD_CONSTANT]
+
+
 BINOP = {
     "+" : BINARY_ADD, "-" : BINARY_SUB, "==" : BINARY_EQ, "!=" : BINARY_NEQ
 }
 
 
 class CompilerContext(object):
-    def __init__(self):
+    """
+    The state of a code object being compiled.
+
+    Instructions are emitted into :attr:`data` as :class:`Instruction`\ s,
+    with jumps' arguments being the index of the instruction they jump to,
+    and are only encoded (and optimized) once compiling is done.
+
+    """
+
+    def __init__(self, filename="<string>"):
+        self.filename = filename
+        self.lineno = 0
+        self.optimize = True
+        self.call_sites = []
+        self.attribute_sites = []
+        self.constant_names = []
         self.data = []
         self.constants = []
+        self.constant_indices = {}
+        self.int_constant_indices = {}
+        self.string_constant_indices = {}
         self.names = []
         self.name_indices = {}
 
+    def chunk_context(self):
+        """
+        Create a context for separately compiled code sharing our variables.
+
+        """
+
+        context = CompilerContext(self.filename)
+        context.optimize = self.optimize
+        context.names = self.names
+        context.name_indices = self.name_indices
+        return context
+
+    def method_context(self):
+        """
+        Create a context for compiling a method or class body, with its own
+        variables.
+
+        """
+
+        context = CompilerContext(self.filename)
+        context.optimize = self.optimize
+        context.lineno = self.lineno
+        return context
+
     def emit(self, bytecode, arg=0):
-        self.data.append(chr(bytecode))
-        self.data.append(chr(arg))
+        self.data.append(Instruction(bytecode, arg, lineno=self.lineno))
+
+    def emit_call(self, name, num_args):
+        """
+        Emit a call, with its own call site, of the receiver and arguments on
+        top of the stack.
+
+        """
+
+        self.call_sites.append(CallSite(symbols.intern(name), num_args))
+        self.data.append(
+            Instruction(
+                CALL_METHOD, len(self.call_sites) - 1, num_args, self.lineno,
+            )
+        )
+
+    def emit_attribute(self, bytecode, name):
+        """
+        Emit a load or store of an instance variable, with its own site.
+
+        """
+
+        self.attribute_sites.append(AttributeSite(symbols.intern(name)))
+        self.emit(bytecode, len(self.attribute_sites) - 1)
+
+    def register_constant_name(self, name):
+        if name in self.constant_names:
+            return self.constant_names.index(name)
+        self.constant_names.append(name)
+        return len(self.constant_names) - 1
 
     def register_constant(self, constant):
-        self.constants.append(constant)
-        return len(self.constants) - 1
+        index = self.constant_indices.get(constant, -1)
+        if index == -1:
+            self.constants.append(constant)
+            index = self.constant_indices[constant] = len(self.constants) - 1
+        return index
+
+    def register_int_constant(self, value):
+        index = self.int_constant_indices.get(value, -1)
+        if index == -1:
+            index = self.register_constant(wrap_int(value))
+            self.int_constant_indices[value] = index
+        return index
+
+    def register_string_constant(self, value):
+        index = self.string_constant_indices.get(value, -1)
+        if index == -1:
+            index = self.register_constant(wrap_string(value))
+            self.string_constant_indices[value] = index
+        return index
 
     def register_variable(self, name):
         if name in self.name_indices:
@@ -44,30 +220,648 @@ class CompilerContext(object):
         return self.name_indices.setdefault(name, len(self.names) - 1)
 
     def create_bytecode(self):
-        return ByteCode(self.data, self.constants[:], len(self.names))
+        instructions = self.data
+        if self.optimize:
+            instructions = optimize_instructions(instructions)
+        return ByteCode(
+            encode(instructions),
+            self.constants[:],
+            len(self.names),
+            stack_depth(instructions),
+            line_table(instructions),
+            self.filename,
+            self.call_sites[:],
+            self.attribute_sites[:],
+            self.constant_names[:],
+        )
+
+
+class CallSite(object):
+    """
+    A place where a method is called, along with its inline cache.
+
+    The cache maps the receiver classes seen there to the methods they
+    found, and is only used when not tracing -- the JIT instead promotes the
+    receiver's class, so that looking the method up gets constant folded.
+
+    """
+
+    _immutable_fields_ = ["w_name", "num_args"]
+
+    def __init__(self, w_name, num_args):
+        self.w_name = w_name
+        self.num_args = num_args
+        self.classes = []
+        self.versions = []
+        self.methods = []
+
+    def lookup(self, w_class):
+        version = w_class.version
+        for i in range(len(self.classes)):
+            if self.classes[i] is w_class:
+                if self.versions[i] is not version:
+                    self.versions[i] = version
+                    self.methods[i] = w_class.lookup(self.w_name)
+                return self.methods[i]
+
+        w_method = w_class.lookup(self.w_name)
+        if len(self.classes) < INLINE_CACHE_SIZE:
+            self.classes.append(w_class)
+            self.versions.append(version)
+            self.methods.append(w_method)
+        return w_method
+
+
+class AttributeSite(object):
+    """
+    A place where an instance variable of self is loaded or stored.
+
+    It caches the last map it saw and where the variable is stored in
+    instances with that map (and for stores of a new variable, the map they
+    move to). Like call sites' caches, it's only used when not tracing, since
+    the JIT promotes maps instead.
+
+    """
+
+    _immutable_fields_ = ["w_name"]
+
+    def __init__(self, w_name):
+        self.w_name = w_name
+        self.map = None
+        self.index = -1
+        self.new_map = None
+
+    def update(self, map):
+        if map is not self.map:
+            self.map = map
+            self.index = map.find(self.w_name)
+            if self.index == -1:
+                self.new_map = map.with_variable(self.w_name)
+
+    def load(self, w_instance):
+        self.update(w_instance.map)
+        if self.index == -1:
+            return w_nil
+        return w_instance.storage[self.index]
+
+    def store(self, w_instance, w_value):
+        self.update(w_instance.map)
+        if self.index == -1:
+            w_instance.add_variable(self.new_map, w_value)
+        else:
+            w_instance.storage[self.index] = w_value
 
 
 class ByteCode(object):
+    """
+    Compiled code, along with the constants and number of variables it uses.
+
+    ``lnotab`` is the line table produced by :func:`line_table`.
 
-    _immutable_fields_ = ['code', 'constants[*]', 'num_vars']
+    """
 
-    def __init__(self, code, constants, num_vars):
+    _immutable_fields_ = [
+        'code[*]', 'constants[*]', 'num_vars', 'max_stack_depth', 'lnotab',
+        'filename', 'line_starts[*]', 'line_numbers[*]', 'call_sites[*]',
+        'attribute_sites[*]', 'constant_names[*]',
+    ]
+
+    def __init__(
+        self, code, constants, num_vars, max_stack_depth, lnotab="",
+        filename="<string>", call_sites=None, attribute_sites=None,
+        constant_names=None,
+    ):
+        if call_sites is None:
+            call_sites = []
+        if attribute_sites is None:
+            attribute_sites = []
+        if constant_names is None:
+            constant_names = []
+        self.call_sites = call_sites
+        self.attribute_sites = attribute_sites
+        self.constant_names = constant_names
         self.code = list(code)
         self.constants = constants
         self.num_vars = num_vars
+        self.max_stack_depth = max_stack_depth
+        self.lnotab = lnotab
+        self.filename = filename
+        self.line_starts, self.line_numbers = decode_line_table(lnotab)
+
+    def line_for(self, pc):
+        """
+        The source line that the instruction at pc came from, or 0.
+
+        """
+
+        starts = self.line_starts
+        low, high = 0, len(starts)
+        while low < high:
+            middle = (low + high) // 2
+            if starts[middle] <= pc:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            return 0
+        return self.line_numbers[low - 1]
+
+    def position(self, pc):
+        return "%s:%d" % (self.filename, self.line_for(pc))
 
     def dump(self):
         lines = []
-        i = 0
-        for i in range(0, len(self.code), 2):
-            c = self.code[i]
-            c2 = self.code[i + 1]
-            lines.append(bytecodes[ord(c)] + " " + str(ord(c2)))
+        pc = 0
+        while pc < len(self.code):
+            opcode, arg = decode_instruction(self.code[pc])
+            line = bytecodes[opcode] + " " + str(arg)
+            if INSTRUCTION_SIZES[opcode] == 2:
+                line += " " + str(self.code[pc + 1])
+            lines.append(line)
+            pc += INSTRUCTION_SIZES[opcode]
         return "\n".join(lines)
 
 
-def compile_ast(ast_node):
-    context = CompilerContext()
+def encode_instruction(opcode, arg):
+    assert arg >= 0
+    return opcode | (arg << OPCODE_BITS)
+
+
+def decode_instruction(word):
+    """
+    Split an instruction word into its opcode and argument.
+
+    """
+
+    return word & OPCODE_MASK, word >> OPCODE_BITS
+
+
+class Instruction(object):
+    """
+    An instruction which hasn't been encoded yet.
+
+    Jumps' arguments are the index of the instruction they jump to, rather
+    than an offset into the encoded code.
+
+    """
+
+    def __init__(self, opcode, arg, arg2=0, lineno=0):
+        self.opcode = opcode
+        self.arg = arg
+        self.arg2 = arg2
+        self.lineno = lineno
+
+    def is_jump(self):
+        return self.opcode in JUMPS
+
+    def stack_effect(self):
+        if self.opcode == CALL_METHOD:
+            return -self.arg2
+        elif self.opcode == BUILD_ARRAY or self.opcode == BUILD_STRING:
+            return 1 - self.arg
+        return STACK_EFFECTS[self.opcode]
+
+
+def encode(instructions):
+    """
+    Encode instructions into words, resolving jump targets to offsets.
+
+    """
+
+    offsets = [0] * (len(instructions) + 1)
+    pc = 0
+    for i, instruction in enumerate(instructions):
+        offsets[i] = pc
+        pc += INSTRUCTION_SIZES[instruction.opcode]
+    offsets[len(instructions)] = pc
+
+    code = []
+    for instruction in instructions:
+        arg = instruction.arg
+        if instruction.is_jump():
+            arg = offsets[arg]
+        code.append(encode_instruction(instruction.opcode, arg))
+        if INSTRUCTION_SIZES[instruction.opcode] == 2:
+            code.append(instruction.arg2)
+    return code
+
+
+def line_table(instructions):
+    """
+    Encode which source line each instruction came from.
+
+    Like CPython's lnotab, the table is a string of pairs of bytes, each
+    giving how far the offset and (signed) line number move on from the
+    previous pair to where the next line starts. Moves too far for a byte
+    are split over several pairs.
+
+    """
+
+    parts = []
+    pc = line = offset = 0
+    for instruction in instructions:
+        if instruction.lineno and instruction.lineno != line:
+            pc_delta = offset - pc
+            line_delta = instruction.lineno - line
+            while pc_delta > 255:
+                parts.append(chr(255) + chr(0))
+                pc_delta -= 255
+            while line_delta > 127:
+                parts.append(chr(pc_delta) + chr(127))
+                pc_delta, line_delta = 0, line_delta - 127
+            while line_delta < -128:
+                parts.append(chr(pc_delta) + chr(128))
+                pc_delta, line_delta = 0, line_delta + 128
+            parts.append(chr(pc_delta) + chr(line_delta & 0xff))
+            pc, line = offset, instruction.lineno
+        offset += INSTRUCTION_SIZES[instruction.opcode]
+    return "".join(parts)
+
+
+def decode_line_table(lnotab):
+    """
+    Decode a line table into the offsets where lines start and their lines.
+
+    """
+
+    starts, lines = [], []
+    pc = line = 0
+    for i in range(0, len(lnotab) - 1, 2):
+        pc += ord(lnotab[i])
+        line_delta = ord(lnotab[i + 1])
+        if line_delta > 127:
+            line_delta -= 256
+        line += line_delta
+        if starts and starts[-1] == pc:
+            lines[-1] = line
+        elif not lines or lines[-1] != line:
+            starts.append(pc)
+            lines.append(line)
+    return starts, lines
+
+
+def stack_depth(instructions):
+    """
+    Find the deepest the stack can get along any path through the code.
+
+    """
+
+    depths = [-1] * (len(instructions) + 1)
+    deepest = 0
+    pending = [(0, 0)]
+    while pending:
+        i, depth = pending.pop()
+        while i < len(instructions) and depths[i] == -1:
+            depths[i] = depth
+            instruction = instructions[i]
+            if instruction.is_jump():
+                pending.append(
+                    (
+                        instruction.arg,
+                        depth + JUMP_STACK_EFFECTS[instruction.opcode],
+                    )
+                )
+            depth += instruction.stack_effect()
+            assert depth >= 0
+            deepest = max(deepest, depth)
+
+            if instruction.opcode in TERMINATORS:
+                break
+            i += 1
+    return deepest
+
+
+def _compact(instructions, keep):
+    """
+    Drop the instructions not marked to keep, fixing up jump targets.
+
+    A jump to a dropped instruction lands on the next one that's kept.
+
+    """
+
+    new_indices = [0] * (len(instructions) + 1)
+    kept = []
+    for i, instruction in enumerate(instructions):
+        new_indices[i] = len(kept)
+        if keep[i]:
+            kept.append(instruction)
+    new_indices[len(instructions)] = len(kept)
+
+    for instruction in kept:
+        if instruction.is_jump():
+            instruction.arg = new_indices[instruction.arg]
+    return kept
+
+
+def thread_jumps(instructions):
+    """
+    Make jumps to unconditional jumps go straight to their final target.
+
+    """
+
+    for instruction in instructions:
+        if not instruction.is_jump():
+            continue
+        # Bounded, so that a jump to itself can't loop forever.
+        for _ in range(len(instructions)):
+            target = instruction.arg
+            if (
+                target >= len(instructions) or
+                instructions[target].opcode != JUMP_BACKWARD or
+                instructions[target].arg == target
+            ):
+                break
+            instruction.arg = instructions[target].arg
+
+
+def remove_unreachable(instructions):
+    reachable = [False] * len(instructions)
+    pending = [0]
+    while pending:
+        i = pending.pop()
+        while i < len(instructions) and not reachable[i]:
+            reachable[i] = True
+            instruction = instructions[i]
+            if instruction.is_jump():
+                pending.append(instruction.arg)
+            if instruction.opcode in TERMINATORS:
+                break
+            i += 1
+    return _compact(instructions, reachable)
+
+
+def _matches(instructions, i, opcodes, targets):
+    if i + len(opcodes) > len(instructions):
+        return False
+    for j in range(len(opcodes)):
+        if instructions[i + j].opcode != opcodes[j]:
+            return False
+        if j and targets[i + j]:
+            return False
+    return True
+
+
+def fuse_superinstructions(instructions):
+    """
+    Replace common sequences of instructions with single superinstructions.
+
+    Sequences which something jumps into the middle of are left alone.
+
+    """
+
+    targets = [False] * (len(instructions) + 1)
+    for instruction in instructions:
+        if instruction.is_jump():
+            targets[instruction.arg] = True
+
+    keep = [True] * len(instructions)
+    i = 0
+    while i < len(instructions):
+        first = instructions[i]
+        if _matches(instructions, i, INCREMENT_SEQUENCE, targets) and (
+            first.arg == instructions[i + 3].arg
+        ):
+            fused, size = INCR_VARIABLE_BY_CONST, len(INCREMENT_SEQUENCE)
+        elif _matches(instructions, i, LOAD_VAR_LOAD_CONST_SEQUENCE, targets):
+            fused = LOAD_VAR_LOAD_CONST
+            size = len(LOAD_VAR_LOAD_CONST_SEQUENCE)
+        else:
+            fused, size = -1, 1
+
+        if fused != -1:
+            instructions[i] = Instruction(
+                fused, first.arg, instructions[i + 1].arg, first.lineno,
+            )
+            for j in range(i + 1, i + size):
+                keep[j] = False
+        else:
+            size = 1
+        i += size
+    return _compact(instructions, keep)
+
+
+def optimize_instructions(instructions):
+    """
+    Run the peephole optimizer over some emitted instructions.
+
+    """
+
+    thread_jumps(instructions)
+    instructions = remove_unreachable(instructions)
+    return fuse_superinstructions(instructions)
+
+
+# Bump this whenever the serialized format or the meaning of any of the
+# bytecodes changes, so that stale caches get recompiled.
+MAGIC = "RIPE"
+BYTECODE_VERSION = 16
+
+INTEGER_CONSTANT = "i"
+BIG_INTEGER_CONSTANT = "b"
+METHOD_CONSTANT = "m"
+STRING_CONSTANT = "s"
+SYMBOL_CONSTANT = "y"
+SINGLETON_CONSTANTS = {"t" : w_true, "f" : w_false, "n" : w_nil}
+
+
+class CorruptBytecode(Exception):
+    pass
+
+
+def _write_uint(parts, value):
+    assert value >= 0
+    parts.append(chr((value >> 24) & 0xff))
+    parts.append(chr((value >> 16) & 0xff))
+    parts.append(chr((value >> 8) & 0xff))
+    parts.append(chr(value & 0xff))
+
+
+def _write_str(parts, value):
+    _write_uint(parts, len(value))
+    parts.append(value)
+
+
+class _Reader(object):
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, length):
+        start = self.pos
+        end = start + length
+        if length < 0 or end > len(self.data):
+            raise CorruptBytecode
+        assert start >= 0
+        self.pos = end
+        return self.data[start:end]
+
+    def read_uint(self):
+        b = self.read(4)
+        return (
+            (ord(b[0]) << 24) | (ord(b[1]) << 16) |
+            (ord(b[2]) << 8) | ord(b[3])
+        )
+
+    def read_str(self):
+        return self.read(self.read_uint())
+
+
+def _read_bigint(reader):
+    """
+    Read a big integer, which should be written out in decimal.
+
+    rbigint doesn't check its input, so anything which isn't decimal digits
+    is rejected before it gets there.
+
+    """
+
+    digits = reader.read_str()
+    start = 0
+    if digits and digits[0] == "-":
+        start = 1
+    if start >= len(digits):
+        raise CorruptBytecode
+    for i in range(start, len(digits)):
+        if not "0" <= digits[i] <= "9":
+            raise CorruptBytecode
+    try:
+        return rbigint.fromdecimalstr(digits)
+    except ValueError:
+        raise CorruptBytecode
+
+
+def dump_bytecode(bc, source_hash):
+    """
+    Serialize some bytecode compiled from source with the given hash.
+
+    """
+
+    parts = [MAGIC]
+    _write_uint(parts, BYTECODE_VERSION)
+    _write_str(parts, source_hash)
+    _write_bytecode(parts, bc)
+    return "".join(parts)
+
+
+def _write_bytecode(parts, bc):
+    _write_uint(parts, bc.num_vars)
+    _write_uint(parts, bc.max_stack_depth)
+    _write_uint(parts, len(bc.code))
+    for word in bc.code:
+        parts.append(chr(word & 0xff))
+        _write_uint(parts, word >> 8)
+    _write_uint(parts, len(bc.constants))
+    for w_constant in bc.constants:
+        if isinstance(w_constant, W_Integer):
+            parts.append(INTEGER_CONSTANT)
+            _write_str(parts, str(w_constant.value))
+        elif isinstance(w_constant, W_BigInteger):
+            parts.append(BIG_INTEGER_CONSTANT)
+            _write_str(parts, w_constant.value.str())
+        elif isinstance(w_constant, W_String):
+            parts.append(STRING_CONSTANT)
+            _write_str(parts, w_constant.str_w())
+        elif isinstance(w_constant, W_Symbol):
+            parts.append(SYMBOL_CONSTANT)
+            _write_str(parts, w_constant.name)
+        elif isinstance(w_constant, W_Method):
+            parts.append(METHOD_CONSTANT)
+            _write_str(parts, w_constant.w_name.name)
+            _write_uint(parts, w_constant.num_params)
+            _write_bytecode(parts, w_constant.bytecode)
+        elif w_constant is w_true:
+            parts.append("t")
+        elif w_constant is w_false:
+            parts.append("f")
+        elif w_constant is w_nil:
+            parts.append("n")
+        else:
+            assert False, "unserializable constant"
+    _write_uint(parts, len(bc.call_sites))
+    for call_site in bc.call_sites:
+        _write_str(parts, call_site.w_name.name)
+        _write_uint(parts, call_site.num_args)
+    _write_uint(parts, len(bc.attribute_sites))
+    for attribute_site in bc.attribute_sites:
+        _write_str(parts, attribute_site.w_name.name)
+    _write_uint(parts, len(bc.constant_names))
+    for name in bc.constant_names:
+        _write_str(parts, name)
+    _write_str(parts, bc.lnotab)
+
+
+def load_bytecode(data, source_hash, filename="<string>"):
+    """
+    Load serialized bytecode, or return None if it's stale or unreadable.
+
+    """
+
+    reader = _Reader(data)
+    try:
+        if reader.read(len(MAGIC)) != MAGIC:
+            return None
+        if reader.read_uint() != BYTECODE_VERSION:
+            return None
+        if reader.read_str() != source_hash:
+            return None
+        bc = _read_bytecode(reader, filename)
+        if reader.pos != len(data):
+            return None
+    except (CorruptBytecode, ValueError):
+        return None
+    return bc
+
+
+def _read_bytecode(reader, filename):
+    num_vars = reader.read_uint()
+    stack_depth = reader.read_uint()
+    code = []
+    for _ in range(reader.read_uint()):
+        low = ord(reader.read(1))
+        code.append(low | (reader.read_uint() << 8))
+    constants = []
+    for _ in range(reader.read_uint()):
+        tag = reader.read(1)
+        if tag == INTEGER_CONSTANT:
+            constants.append(wrap_int(int(reader.read_str())))
+        elif tag == BIG_INTEGER_CONSTANT:
+            constants.append(W_BigInteger(_read_bigint(reader)))
+        elif tag == STRING_CONSTANT:
+            constants.append(wrap_string(reader.read_str()))
+        elif tag == SYMBOL_CONSTANT:
+            constants.append(symbols.intern(reader.read_str()))
+        elif tag == METHOD_CONSTANT:
+            w_name = symbols.intern(reader.read_str())
+            num_params = reader.read_uint()
+            body = _read_bytecode(reader, filename)
+            constants.append(W_Method(w_name, num_params, body))
+        elif tag in SINGLETON_CONSTANTS:
+            constants.append(SINGLETON_CONSTANTS[tag])
+        else:
+            raise CorruptBytecode
+    call_sites = []
+    for _ in range(reader.read_uint()):
+        w_name = symbols.intern(reader.read_str())
+        call_sites.append(CallSite(w_name, reader.read_uint()))
+    attribute_sites = []
+    for _ in range(reader.read_uint()):
+        w_name = symbols.intern(reader.read_str())
+        attribute_sites.append(AttributeSite(w_name))
+    constant_names = []
+    for _ in range(reader.read_uint()):
+        constant_names.append(reader.read_str())
+    lnotab = reader.read_str()
+    return ByteCode(
+        code, constants, num_vars, stack_depth, lnotab, filename, call_sites,
+        attribute_sites, constant_names,
+    )
+
+
+def compile_ast(ast_node, context=None, optimize=True):
+    if context is None:
+        context = CompilerContext()
+    context.optimize = optimize
+    ast_node = ast_node.fold()
     ast_node.compile(context)
     context.emit(RETURN, 0)
     return context.create_bytecode()
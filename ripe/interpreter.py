@@ -1,20 +1,48 @@
 from pypy.rlib import jit
+from pypy.rlib.rmd5 import RMD5
+from pypy.rlib.streamio import open_file_as_stream
 
-from ripe import compiler
+from ripe import compiler, output, profiler
 from ripe.compiler import compile_ast
-from ripe.objects import W_Integer, boolean, w_true, w_false, w_nil
-from ripe.parser import parse
+from ripe.objects import (
+    ArgumentError,
+    NoMethodError,
+    RubyNameError,
+    RubyTypeError,
+    W_Array,
+    W_Class,
+    W_Instance,
+    W_Integer,
+    W_Iterator,
+    W_Method,
+    W_Primitive,
+    W_Range,
+    W_String,
+    boolean,
+    build_string,
+    constants,
+    is_true,
+    symbols,
+    w_main,
+    w_new,
+    w_nil,
+    w_object_class,
+    wrap_array,
+)
+from ripe.lexer import StreamLexer
+from ripe.parser import Compound, Parser, parse
 
 
 class Frame(object):
 
     _virtualizable2_ = ['value_stack[*]', 'value_stack_pos', 'vars[*]']
 
-    def __init__(self, bc):
+    def __init__(self, bc, w_self=w_main):
         self = jit.hint(self, fresh_virtualizable=True, access_directly=True)
-        self.value_stack = [None] * 3  # safe estimate!
+        self.value_stack = [None] * bc.max_stack_depth
         self.vars = [None] * bc.num_vars
         self.value_stack_pos = 0
+        self.w_self = w_self
 
     def push(self, v):
         pos = jit.hint(self.value_stack_pos, promote=True)
@@ -30,9 +58,33 @@ class Frame(object):
         self.value_stack_pos = new_pos
         return v
 
+    def peek(self, depth):
+        pos = jit.hint(self.value_stack_pos, promote=True) - depth - 1
+        assert pos >= 0
+        return self.value_stack[pos]
+
+    def make_room_for(self, bc):
+        """
+        Make room for running more code, with the variables kept so far.
+
+        The variables are reallocated at (at least) double the size when
+        they run out, so a stream of statements each adding a variable only
+        copies them a logarithmic number of times.
+
+        """
+
+        if len(self.value_stack) < bc.max_stack_depth:
+            self.value_stack = [None] * bc.max_stack_depth
+        if len(self.vars) < bc.num_vars:
+            new_vars = [None] * max(bc.num_vars, 2 * len(self.vars))
+            for i in range(len(self.vars)):
+                new_vars[i] = self.vars[i]
+            self.vars = new_vars
+
 
 def get_printable_location(pc, code, bc):
-    return "%s %s" % (compiler.bytecodes[ord(code[pc])], ord(code[pc + 1]))
+    opcode, arg = compiler.decode_instruction(code[pc])
+    return "%s %s %s" % (bc.position(pc), compiler.bytecodes[opcode], arg)
 
 
 driver = jit.JitDriver(
@@ -47,24 +99,282 @@ def add(left, right):
     return left + right
 
 
+def call_method(frame, bc, pc, call_site):
+    """
+    Call a method on the receiver below its arguments on top of the stack.
+
+    Outside of traces the method is found through the call site's inline
+    cache. Traces instead promote the receiver's class, which turns the
+    lookup into a constant guarded by the class and its version.
+
+    """
+
+    num_args = call_site.num_args
+    w_receiver = frame.peek(num_args)
+    w_class = jit.promote(w_receiver.getclass())
+    if jit.we_are_jitted():
+        w_method = w_class.lookup(call_site.w_name)
+    else:
+        w_method = call_site.lookup(w_class)
+    if w_method is None:
+        raise NoMethodError(
+            "undefined method '%s' for an instance of %s at %s" % (
+                call_site.w_name.name, w_class.name, bc.position(pc),
+            )
+        )
+    if w_method is w_new:
+        return new(frame, bc, pc, w_receiver, num_args)
+    elif isinstance(w_method, W_Primitive):
+        return call_primitive(frame, bc, pc, w_method, w_receiver, num_args)
+    return invoke(frame, bc, pc, w_method, w_receiver, num_args)
+
+
+w_initialize_name = symbols.intern("initialize")
+
+
+def new(frame, bc, pc, w_class, num_args):
+    """
+    Create an instance of a class, and initialize it with the arguments.
+
+    """
+
+    assert isinstance(w_class, W_Class)
+    w_instance = W_Instance(w_class)
+    w_initialize = w_class.lookup(w_initialize_name)
+    if w_initialize is None:
+        if num_args != 0:
+            raise ArgumentError(
+                "wrong number of arguments (given %d, expected 0) at %s" % (
+                    num_args, bc.position(pc),
+                )
+            )
+        frame.pop()
+    else:
+        invoke(frame, bc, pc, w_initialize, w_instance, num_args)
+    return w_instance
+
+
+def invoke(frame, bc, pc, w_method, w_self, num_args):
+    """
+    Run a method with the arguments on top of the stack, popping them and
+    the receiver below them.
+
+    """
+
+    assert isinstance(w_method, W_Method)
+    if w_method.num_params != num_args:
+        raise ArgumentError(
+            "wrong number of arguments (given %d, expected %d) at %s" % (
+                num_args, w_method.num_params, bc.position(pc),
+            )
+        )
+
+    method_bc = w_method.bytecode
+    callee = Frame(method_bc, w_self)
+    i = num_args - 1
+    while i >= 0:
+        callee.vars[i] = frame.pop()
+        i -= 1
+    frame.pop()
+    return execute(callee, method_bc)
+
+
+def call_primitive(frame, bc, pc, w_primitive, w_self, num_args):
+    if w_primitive.num_params != num_args:
+        raise ArgumentError(
+            "wrong number of arguments (given %d, expected %d) at %s" % (
+                num_args, w_primitive.num_params, bc.position(pc),
+            )
+        )
+    args_w = pop_items(frame, num_args)
+    frame.pop()
+    return w_primitive.function(w_self, args_w)
+
+
+def pop_items(frame, count):
+    """
+    Pop the given number of objects, returning them in the order pushed.
+
+    """
+
+    items_w = [None] * count
+    i = count - 1
+    while i >= 0:
+        items_w[i] = frame.pop()
+        i -= 1
+    return items_w
+
+
+def index_operands(bc, pc, w_array, w_index):
+    if not isinstance(w_array, W_Array):
+        raise NoMethodError(
+            "undefined method '[]' for an instance of %s at %s" % (
+                w_array.getclass().name, bc.position(pc),
+            )
+        )
+    if not isinstance(w_index, W_Integer):
+        raise RubyTypeError(
+            "no implicit conversion of %s into Integer at %s" % (
+                w_index.getclass().name, bc.position(pc),
+            )
+        )
+    return w_array, w_index.value
+
+
+def build_range(bc, pc, w_start, w_stop, exclusive):
+    if not (
+        isinstance(w_start, W_Integer) and isinstance(w_stop, W_Integer)
+    ):
+        raise RubyTypeError("bad value for range at %s" % (bc.position(pc),))
+    return W_Range(w_start.value, w_stop.value, exclusive)
+
+
+def get_iter(bc, pc, w_object):
+    w_iterator = w_object.iter()
+    if w_iterator is None:
+        raise NoMethodError(
+            "undefined method 'each' for an instance of %s at %s" % (
+                w_object.getclass().name, bc.position(pc),
+            )
+        )
+    return w_iterator
+
+
+def define_class(bc, pc, w_body, w_superclass):
+    """
+    Define a class, or reopen it if it exists, and run its body.
+
+    """
+
+    name = w_body.w_name.name
+    w_class = constants.lookup(name)
+    if w_class is None:
+        if w_superclass is w_nil:
+            w_superclass = w_object_class
+        if not isinstance(w_superclass, W_Class):
+            raise RubyTypeError(
+                "superclass must be a Class at %s" % (bc.position(pc),)
+            )
+        w_class = W_Class(name, w_superclass)
+        constants.define(name, w_class)
+    elif not isinstance(w_class, W_Class):
+        raise RubyTypeError(
+            "%s is not a class at %s" % (name, bc.position(pc))
+        )
+    elif w_superclass is not w_nil and w_superclass is not w_class.superclass:
+        raise RubyTypeError(
+            "superclass mismatch for class %s at %s" % (
+                name, bc.position(pc),
+            )
+        )
+
+    body_bc = w_body.bytecode
+    return execute(Frame(body_bc, w_class), body_bc)
+
+
+def load_instance_variable(frame, site):
+    w_self = frame.w_self
+    if isinstance(w_self, W_Instance) and not jit.we_are_jitted():
+        return site.load(w_self)
+    return w_self.getivar(site.w_name)
+
+
+def store_instance_variable(frame, site, w_value):
+    w_self = frame.w_self
+    if isinstance(w_self, W_Instance) and not jit.we_are_jitted():
+        site.store(w_self, w_value)
+    else:
+        w_self.setivar(site.w_name, w_value)
+
+
 def execute(frame, bc):
     code = bc.code
     pc = 0
     while True:
         driver.jit_merge_point(pc=pc, code=code, bc=bc, frame=frame)
-        c = ord(code[pc])
-        arg = ord(code[pc + 1])
-        pc += 2
+        word = code[pc]
+        c = word & compiler.OPCODE_MASK
+        arg = word >> compiler.OPCODE_BITS
+        if profiler.ENABLED and profiler.profile.active:
+            profiler.profile.instruction(bc, pc, c)
+        pc += 1
         if c == compiler.LOAD_CONSTANT:
             frame.push(bc.constants[arg])
         elif c == compiler.DISCARD_TOP:
             frame.pop()
         elif c == compiler.RETURN:
-            return
+            return w_nil
+        elif c == compiler.RETURN_VALUE:
+            return frame.pop()
+        elif c == compiler.LOAD_SELF:
+            frame.push(frame.w_self)
+        elif c == compiler.CALL_METHOD:
+            frame.push(call_method(frame, bc, pc - 1, bc.call_sites[arg]))
+        elif c == compiler.DEFINE_METHOD:
+            w_method = bc.constants[arg]
+            assert isinstance(w_method, W_Method)
+            frame.w_self.definee().define_method(w_method.w_name, w_method)
+            frame.push(w_nil)
+        elif c == compiler.DEFINE_CLASS:
+            w_body = bc.constants[arg]
+            assert isinstance(w_body, W_Method)
+            w_superclass = frame.pop()
+            frame.push(define_class(bc, pc - 1, w_body, w_superclass))
+        elif c == compiler.LOAD_NAMED_CONSTANT:
+            name = bc.constant_names[arg]
+            w_value = constants.lookup(name)
+            if w_value is None:
+                raise RubyNameError(
+                    "uninitialized constant %s at %s" % (
+                        name, bc.position(pc - 1),
+                    )
+                )
+            frame.push(w_value)
+        elif c == compiler.LOAD_INSTANCE_VARIABLE:
+            site = bc.attribute_sites[arg]
+            frame.push(load_instance_variable(frame, site))
+        elif c == compiler.STORE_INSTANCE_VARIABLE:
+            site = bc.attribute_sites[arg]
+            store_instance_variable(frame, site, frame.pop())
+        elif c == compiler.BUILD_ARRAY:
+            frame.push(wrap_array(pop_items(frame, arg)))
+        elif c == compiler.INDEX_LOAD:
+            w_index, w_array = frame.pop(), frame.pop()
+            w_array, index = index_operands(bc, pc - 1, w_array, w_index)
+            frame.push(w_array.getitem(index))
+        elif c == compiler.INDEX_STORE:
+            w_value, w_index, w_array = frame.pop(), frame.pop(), frame.pop()
+            w_array, index = index_operands(bc, pc - 1, w_array, w_index)
+            w_array.setitem(index, w_value)
+            frame.push(w_value)
+        elif c == compiler.LOAD_STRING:
+            w_string = bc.constants[arg]
+            assert isinstance(w_string, W_String)
+            frame.push(w_string.share())
+        elif c == compiler.BUILD_STRING:
+            frame.push(build_string(pop_items(frame, arg)))
+        elif c == compiler.BUILD_RANGE:
+            w_stop, w_start = frame.pop(), frame.pop()
+            frame.push(build_range(bc, pc - 1, w_start, w_stop, arg != 0))
+        elif c == compiler.GET_ITER:
+            frame.push(get_iter(bc, pc - 1, frame.pop()))
+        elif c == compiler.FOR_ITER:
+            w_iterator = frame.pop()
+            assert isinstance(w_iterator, W_Iterator)
+            if w_iterator.done():
+                frame.push(w_nil)
+                pc = arg
+            else:
+                frame.push(w_iterator.next())
+                frame.push(w_iterator.value())
         elif c == compiler.BINARY_ADD:
             right, left = frame.pop(), frame.pop()
             w_res = left.add(right)
             frame.push(w_res)
+        elif c == compiler.BINARY_SUB:
+            right, left = frame.pop(), frame.pop()
+            w_res = left.sub(right)
+            frame.push(w_res)
         elif c == compiler.BINARY_EQ:
             right, left = frame.pop(), frame.pop()
             w_res = boolean(left.eq(right))
@@ -74,24 +384,136 @@ def execute(frame, bc):
             w_res = boolean(not left.eq(right))
             frame.push(w_res)
         elif c == compiler.JUMP_BACKWARD:
+            if profiler.ENABLED and profiler.profile.active:
+                profiler.profile.loop_iteration(bc, arg)
             pc = arg
+            driver.can_enter_jit(pc=pc, code=code, bc=bc, frame=frame)
         elif c == compiler.JUMP_IF_FALSE:
-            if frame.pop() == w_false:
+            if not is_true(frame.pop()):
                 frame.push(w_nil)  # XXX: Does this belong here?
                 pc = arg
+        elif c == compiler.JUMP_IF_TRUE:
+            if is_true(frame.pop()):
+                frame.push(w_nil)
+                pc = arg
+        elif c == compiler.JUMP_IF_EQ:
+            right, left = frame.pop(), frame.pop()
+            if left.eq(right):
+                frame.push(w_nil)
+                pc = arg
+        elif c == compiler.JUMP_IF_NOT_EQ:
+            right, left = frame.pop(), frame.pop()
+            if not left.eq(right):
+                frame.push(w_nil)
+                pc = arg
         elif c == compiler.PUTS:
             # XXX
-            print frame.pop().inspect()
+            output.stdout.write(frame.pop().to_s())
+            output.stdout.write("\n")
         elif c == compiler.ASSIGN:
             frame.vars[arg] = frame.pop()
         elif c == compiler.LOAD_VARIABLE:
             frame.push(frame.vars[arg])
+        elif c == compiler.INCR_VARIABLE_BY_CONST:
+            constant = code[pc]
+            pc += 1
+            frame.vars[arg] = frame.vars[arg].add(bc.constants[constant])
+        elif c == compiler.LOAD_VAR_LOAD_CONST:
+            constant = code[pc]
+            pc += 1
+            frame.push(frame.vars[arg])
+            frame.push(bc.constants[constant])
         else:
             assert False, compiler.bytecodes[c]
 
 
-def interpret(source):
-    bc = compile_ast(parse(source))
+def run(bc):
     frame = Frame(bc)
     execute(frame, bc)
     return frame
+
+
+def interpret(source):
+    return run(compile_ast(parse(source)))
+
+
+def interpret_stream(stream, filename="<stream>"):
+    """
+    Interpret source from a stream, one top-level statement at a time.
+
+    Each statement is compiled and run as soon as it has been read, so that
+    only one statement's worth of source, AST and bytecode is live at once.
+    They all run in the same frame, which grows as variables are added.
+
+    """
+
+    parser = Parser(StreamLexer(stream))
+    variables = compiler.CompilerContext(filename)
+    frame = None
+    while True:
+        statement = parser.parse_next_statement()
+        if statement is None:
+            return frame
+        bc = compile_ast(Compound([statement]), variables.chunk_context())
+        if frame is None:
+            frame = Frame(bc)
+        else:
+            frame.make_room_for(bc)
+        execute(frame, bc)
+
+
+def cache_path_for(path):
+    """
+    The path that the compiled bytecode for a source file is cached at.
+
+    """
+
+    dot, slash = path.rfind("."), path.rfind("/")
+    if dot > slash + 1:
+        path = path[:dot]
+    return path + ".ripec"
+
+
+def compile_file(path, source):
+    """
+    Compile the source from the given path, reusing its cached bytecode.
+
+    Sources whose path is the same as their cache's (because they end in
+    ``.ripec`` themselves) aren't cached, rather than being overwritten.
+
+    """
+
+    cache_path = cache_path_for(path)
+    if cache_path == path:
+        return compile_ast(parse(source), compiler.CompilerContext(path))
+    source_hash = RMD5(source).digest()
+
+    try:
+        f = open_file_as_stream(cache_path, "rb")
+        try:
+            bc = compiler.load_bytecode(f.readall(), source_hash, path)
+        finally:
+            f.close()
+    except OSError:
+        bc = None
+
+    if bc is None:
+        bc = compile_ast(parse(source), compiler.CompilerContext(path))
+        try:
+            f = open_file_as_stream(cache_path, "wb")
+            try:
+                f.write(compiler.dump_bytecode(bc, source_hash))
+            finally:
+                f.close()
+        except OSError:
+            pass  # we just won't have a cache next time
+    return bc
+
+
+def interpret_file(path):
+    f = open_file_as_stream(path)
+    try:
+        source = f.readall()
+    finally:
+        f.close()
+    return run(compile_file(path, source))
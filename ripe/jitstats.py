@@ -0,0 +1,191 @@
+"""
+Statistics about what the JIT compiled, and what it gave up on.
+
+They're collected while running by the hooks which targetripe's jitpolicy
+installs, or can be recovered afterwards from a ``PYPYLOG`` file with
+:func:`parse_log`. Either way, locations are labeled the same way as the
+JIT labels them, with :func:`ripe.interpreter.get_printable_location`.
+
+"""
+
+import re
+
+from ripe.profiler import Entry, report_entries
+
+
+# The names the JIT's summary uses for each reason for aborting a trace.
+ABORT_REASONS = {
+    "ABORT_TOO_LONG" : "trace too long",
+    "ABORT_BRIDGE" : "compiling",
+    "ABORT_ESCAPE" : "vable escape",
+    "ABORT_BAD_LOOP" : "bad loop",
+    "ABORT_FORCE_QUASIIMMUT" : "force quasi-immut",
+}
+
+UNKNOWN_LOCATION = "<unknown>"
+
+
+class JitStats(object):
+    """
+    Counts of the loops and bridges compiled and the traces aborted.
+
+    A bridge is compiled for a guard once it has failed often enough, so the
+    bridges compiled for each loop show where its guards are failing.
+
+    How many times the machine code for each loop and bridge was entered is
+    only known from a log (the hooks aren't told), so those counts are only
+    reported when there are some.
+
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.loops = {}
+        self.bridges = {}
+        self.aborts = {}
+        self.abort_locations = {}
+        self.loop_entries = {}
+        self.bridge_entries = {}
+
+    def loop_compiled(self, location):
+        self.loops[location] = self.loops.get(location, 0) + 1
+
+    def bridge_compiled(self, location):
+        self.bridges[location] = self.bridges.get(location, 0) + 1
+
+    def loop_entered(self, location, count=1):
+        self.loop_entries[location] = (
+            self.loop_entries.get(location, 0) + count
+        )
+
+    def bridge_entered(self, location, count=1):
+        self.bridge_entries[location] = (
+            self.bridge_entries.get(location, 0) + count
+        )
+
+    def aborted(self, reason, location=UNKNOWN_LOCATION, count=1):
+        self.aborts[reason] = self.aborts.get(reason, 0) + count
+        self.abort_locations[location] = (
+            self.abort_locations.get(location, 0) + count
+        )
+
+    def report(self):
+        lines = [
+            "Loops compiled: %d" % (_total(self.loops),),
+            "Bridges compiled: %d" % (_total(self.bridges),),
+            "Traces aborted: %d" % (_total(self.aborts),),
+        ]
+        _report_counts(lines, self.aborts)
+        lines.append("Loops by location:")
+        _report_counts(lines, self.loops)
+        lines.append("Bridges (guards failing often) by location:")
+        _report_counts(lines, self.bridges)
+        lines.append("Aborted traces by location:")
+        _report_counts(lines, self.abort_locations)
+        if self.loop_entries or self.bridge_entries:
+            lines.append("Loop entries by location:")
+            _report_counts(lines, self.loop_entries)
+            lines.append("Bridge entries by location:")
+            _report_counts(lines, self.bridge_entries)
+        return "\n".join(lines) + "\n"
+
+
+def _total(counts):
+    total = 0
+    for count in counts.itervalues():
+        total += count
+    return total
+
+
+def _report_counts(lines, counts):
+    entries = [
+        Entry(count, description)
+        for description, count in counts.iteritems()
+    ]
+    report_entries(lines, entries, len(entries))
+
+
+stats = JitStats()
+
+
+SECTION_START = re.compile(r"^\[[0-9a-f]+\] \{([\w-]+)$")
+SECTION_END = re.compile(r"^\[[0-9a-f]+\] ([\w-]+)\}$")
+LOOP = re.compile(r"^# Loop (\d+) \((.*)\) : .* with \d+ ops$")
+BRIDGE = re.compile(r"^# bridge out of Guard (\w+) with \d+ ops$")
+GUARD = re.compile(r"descr=<Guard(\w+)>")
+ABORT = re.compile(r"^abort: (.+):\s*(\d+)$")
+COUNT = re.compile(r"^(entry|bridge) (\d+):(\d+)$")
+
+
+def parse_log(lines):
+    """
+    Recover statistics from the lines of a ``PYPYLOG`` file.
+
+    The log needs at least the ``jit-log-opt`` and ``jit-summary`` sections,
+    e.g. ``PYPYLOG=jit-log-opt,jit-summary:ripe.log``. Traces aborted only
+    show up in the summary, so their locations aren't known.
+
+    If it also has the ``jit-backend-counts`` section, the number of times
+    each loop and bridge was entered is counted too, by the location of the
+    loop (or of the loop the bridge's guard belongs to).
+
+    """
+
+    result = JitStats()
+    loop_locations = {}
+    guard_locations = {}
+    section = location = None
+    for line in lines:
+        line = line.rstrip("\n")
+        match = SECTION_START.match(line)
+        if match is not None:
+            section = match.group(1)
+            location = None
+            continue
+        if SECTION_END.match(line) is not None:
+            section = None
+            continue
+
+        if section == "jit-log-opt-loop":
+            match = LOOP.match(line)
+            if match is not None:
+                location = match.group(2)
+                loop_locations[match.group(1)] = location
+                result.loop_compiled(location)
+                continue
+        elif section == "jit-log-opt-bridge":
+            match = BRIDGE.match(line)
+            if match is not None:
+                location = guard_locations.get(
+                    match.group(1), UNKNOWN_LOCATION,
+                )
+                result.bridge_compiled(location)
+                continue
+        elif section == "jit-backend-counts":
+            match = COUNT.match(line)
+            if match is not None and int(match.group(3)):
+                kind, number = match.group(1), match.group(2)
+                count = int(match.group(3))
+                if kind == "entry":
+                    result.loop_entered(
+                        loop_locations.get(number, UNKNOWN_LOCATION), count,
+                    )
+                else:
+                    result.bridge_entered(
+                        guard_locations.get(number, UNKNOWN_LOCATION), count,
+                    )
+            continue
+        elif section == "jit-summary":
+            match = ABORT.match(line)
+            if match is not None and int(match.group(2)):
+                result.aborted(match.group(1), count=int(match.group(2)))
+            continue
+        else:
+            continue
+
+        if location is not None:
+            for guard in GUARD.findall(line):
+                guard_locations[guard] = location
+    return result
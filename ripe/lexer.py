@@ -0,0 +1,439 @@
+"""
+A table-driven lexer producing tokens one at a time.
+
+"""
+
+from pypy.rlib.rarithmetic import ovfcheck
+from pypy.rlib.rbigint import rbigint
+
+
+KEYWORDS = dict.fromkeys([
+    "class", "def", "do", "else", "elsif", "end", "if", "puts", "return",
+    "then", "unless", "until", "while",
+])
+
+# Longest first, since the lexer tries them in order.
+OPERATORS = [
+    "...", "==", "!=", "..", "<<", "+", "-", "=", "(", ")", "[", "]", ",", ";",
+    ".", "<", "|",
+]
+
+SEPARATOR = "SEPARATOR"
+IDENTIFIER = "IDENTIFIER"
+INSTANCE_VARIABLE = "INSTANCE_VARIABLE"
+SYMBOL = "SYMBOL"
+INTEGER = "INTEGER"
+SINGLE_QUOTED_STRING = "SINGLE_QUOTED_STRING"
+DOUBLE_QUOTED_STRING = "DOUBLE_QUOTED_STRING"
+EOF = "EOF"
+
+(
+    OTHER, SPACE, NEWLINE, COMMENT, DIGIT, IDENTIFIER_START, AT, QUOTE, COLON,
+) = range(9)
+
+CHAR_CLASSES = [OTHER] * 256
+for c in " \t\f\r":
+    CHAR_CLASSES[ord(c)] = SPACE
+CHAR_CLASSES[ord("\n")] = NEWLINE
+CHAR_CLASSES[ord("#")] = COMMENT
+for c in "0123456789":
+    CHAR_CLASSES[ord(c)] = DIGIT
+for c in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_$":
+    CHAR_CLASSES[ord(c)] = IDENTIFIER_START
+CHAR_CLASSES[ord("@")] = AT
+CHAR_CLASSES[ord("'")] = CHAR_CLASSES[ord('"')] = QUOTE
+CHAR_CLASSES[ord(":")] = COLON
+
+# The value of each character as a digit, or 99 if it isn't one.
+DIGIT_VALUES = [99] * 256
+for i, c in enumerate("0123456789abcdef"):
+    DIGIT_VALUES[ord(c)] = DIGIT_VALUES[ord(c.upper())] = i
+
+# What the character after a backslash stands for in a double quoted string,
+# for those which aren't just themselves.
+ESCAPES = {
+    "n" : "\n", "t" : "\t", "r" : "\r", "0" : "\0", "s" : " ", "e" : "\x1b",
+    "a" : "\a", "b" : "\b", "f" : "\f", "v" : "\v",
+}
+
+# The base selected by the character after a leading 0 in an integer literal.
+INTEGER_PREFIXES = {
+    "b" : 2, "B" : 2, "o" : 8, "O" : 8, "_" : 8, "d" : 10, "D" : 10, "x" : 16,
+    "X" : 16,
+}
+
+
+class SourceError(Exception):
+    """
+    An error at a particular position in some source code.
+
+    """
+
+    def __init__(self, message, lineno, column):
+        self.message = message
+        self.lineno = lineno
+        self.column = column
+
+    def __str__(self):
+        return "%s at line %s, column %s" % (
+            self.message, self.lineno, self.column,
+        )
+
+    def nice_error_message(self, filename="<string>", source=""):
+        lines = ["  File %s, line %s" % (filename, self.lineno)]
+        source_lines = source.split("\n")
+        if 0 < self.lineno <= len(source_lines):
+            lines.append("    " + source_lines[self.lineno - 1])
+            lines.append("    " + " " * (self.column - 1) + "^")
+        lines.append("%s: %s" % (self.__class__.__name__, self.message))
+        return "\n".join(lines)
+
+
+class LexerError(SourceError):
+    pass
+
+
+class Token(object):
+    def __init__(self, kind, value, lineno, column):
+        self.kind = kind
+        self.value = value
+        self.lineno = lineno
+        self.column = column
+
+    def __repr__(self):
+        return "<Token %s %r at %s:%s>" % (
+            self.kind, self.value, self.lineno, self.column,
+        )
+
+
+class Lexer(object):
+    """
+    Split source code into tokens.
+
+    Tokens are produced on demand by :meth:`next_token` rather than all up
+    front. Newlines and ``;`` are significant and are produced as separators.
+
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.pos = 0
+        self.lineno = 1
+        self.line_start = 0
+
+    def error(self, message, pos):
+        return LexerError(message, self.lineno, pos - self.line_start + 1)
+
+    def token(self, kind, start, end):
+        assert start >= 0 and end >= start
+        return Token(
+            kind,
+            self.source[start:end],
+            self.lineno,
+            start - self.line_start + 1,
+        )
+
+    def refill(self):
+        """
+        Read more source once everything so far has been consumed.
+
+        Returns whether there was any more to read.
+
+        """
+
+        return False
+
+    def next_token(self):
+        source = self.source
+        while True:
+            if self.pos >= len(source):
+                if not self.refill():
+                    break
+                source = self.source
+                continue
+
+            start = self.pos
+            char_class = CHAR_CLASSES[ord(source[start])]
+
+            if char_class == SPACE:
+                self.pos += 1
+            elif char_class == COMMENT:
+                end = source.find("\n", start)
+                self.pos = len(source) if end == -1 else end
+            elif char_class == NEWLINE:
+                token = self.token(SEPARATOR, start, start + 1)
+                self.pos += 1
+                self.lineno += 1
+                self.line_start = self.pos
+                return token
+            elif char_class == DIGIT:
+                return self.lex_integer(start)
+            elif char_class == IDENTIFIER_START:
+                end = self.identifier_end(start)
+                token = self.token(IDENTIFIER, start, end)
+                if token.value in KEYWORDS:
+                    token.kind = token.value
+                self.pos = end
+                return token
+            elif char_class == AT:
+                end = self.identifier_end(start + 1)
+                if end == start + 1:
+                    raise self.error("Expected an instance variable name", end)
+                self.pos = end
+                return self.token(INSTANCE_VARIABLE, start, end)
+            elif char_class == COLON:
+                end = self.identifier_end(start + 1)
+                if end == start + 1:
+                    raise self.error("Expected a symbol name", end)
+                self.pos = end
+                return self.token(SYMBOL, start, end)
+            elif char_class == QUOTE:
+                return self.lex_string(start)
+            else:
+                return self.lex_operator(start)
+        return Token(EOF, "", self.lineno, self.pos - self.line_start + 1)
+
+    def identifier_end(self, start):
+        source = self.source
+        end = start
+        while end < len(source):
+            char_class = CHAR_CLASSES[ord(source[end])]
+            if char_class != IDENTIFIER_START and char_class != DIGIT:
+                break
+            end += 1
+        return end
+
+    def lex_integer(self, start):
+        source = self.source
+        base, prefix_length = integer_prefix(source, start)
+        end = start + prefix_length
+        if prefix_length == 2 and (
+            end >= len(source) or DIGIT_VALUES[ord(source[end])] >= base
+        ):
+            raise self.error("Expected digits after the base prefix", end)
+        while end < len(source):
+            char_class = CHAR_CLASSES[ord(source[end])]
+            if char_class != DIGIT and char_class != IDENTIFIER_START:
+                break
+            if DIGIT_VALUES[ord(source[end])] >= base:
+                raise self.error("Invalid digit in integer literal", end)
+            end += 1
+
+        token = self.token(INTEGER, start, end)
+        self.pos = end
+        return token
+
+    def lex_string(self, start):
+        source = self.source
+        quote = source[start]
+        end = string_end(source, start)
+        if end < 0:
+            raise self.error("Unterminated string literal", start)
+
+        if quote == "'":
+            kind = SINGLE_QUOTED_STRING
+        else:
+            kind = DOUBLE_QUOTED_STRING
+        value = source[start + 1:end]
+        self.pos = end + 1
+        return Token(kind, value, self.lineno, start - self.line_start + 1)
+
+    def lex_operator(self, start):
+        source = self.source
+        for operator in OPERATORS:
+            end = start + len(operator)
+            if source[start:end] == operator:
+                self.pos = end
+                if operator == ";":
+                    return self.token(SEPARATOR, start, end)
+                return self.token(operator, start, end)
+        raise self.error("Unexpected character '%s'" % (source[start],), start)
+
+
+class StreamLexer(Lexer):
+    """
+    A lexer which reads its source from a stream a line at a time.
+
+    No token spans more than one line, so only the line currently being
+    tokenized needs to be kept around.
+
+    """
+
+    def __init__(self, stream):
+        Lexer.__init__(self, "")
+        self.stream = stream
+
+    def refill(self):
+        line = self.stream.readline()
+        if not line:
+            return False
+        self.source = line
+        self.pos = self.line_start = 0
+        return True
+
+
+def string_end(source, start):
+    """
+    Find the closing quote of the string literal starting at ``start``.
+
+    Returns -1 if the literal isn't closed before the end of the line. Any
+    interpolations in a double quoted literal are skipped over, even if they
+    contain quotes themselves.
+
+    """
+
+    quote = source[start]
+    pos = start + 1
+    while pos < len(source):
+        c = source[pos]
+        if c == quote:
+            return pos
+        elif c == "\n":
+            return -1
+        elif c == "\\":
+            pos += 1
+        elif quote == '"' and c == "#" and source[pos + 1:pos + 2] == "{":
+            pos = interpolation_end(source, pos + 2)
+            if pos < 0:
+                return -1
+        pos += 1
+    return -1
+
+
+def interpolation_end(source, start):
+    """
+    Find the ``}`` closing an interpolation whose code begins at ``start``.
+
+    Returns -1 if it isn't closed before the end of the line.
+
+    """
+
+    depth = 0
+    pos = start
+    while pos < len(source):
+        c = source[pos]
+        if c == "}":
+            if depth == 0:
+                return pos
+            depth -= 1
+        elif c == "{":
+            depth += 1
+        elif c == "'" or c == '"':
+            pos = string_end(source, pos)
+            if pos < 0:
+                return -1
+        elif c == "\n":
+            return -1
+        pos += 1
+    return -1
+
+
+def interpolation_bounds(literal):
+    """
+    Find the code interpolated into a double quoted string literal.
+
+    Returns the start and end of each piece of code, one after the other,
+    so an empty list means there's nothing to interpolate. Escaping the
+    ``#`` (``\\#{``) leaves the braces as they are.
+
+    """
+
+    bounds = []
+    pos = 0
+    while pos < len(literal):
+        c = literal[pos]
+        if c == "\\":
+            pos += 2
+            continue
+        elif c == "#" and literal[pos + 1:pos + 2] == "{":
+            end = interpolation_end(literal, pos + 2)
+            assert end >= 0
+            bounds.append(pos + 2)
+            bounds.append(end)
+            pos = end
+        pos += 1
+    return bounds
+
+
+def integer_prefix(literal, start):
+    """
+    Find the base of an integer literal and the length of its base prefix.
+
+    """
+
+    if literal[start] != "0" or start + 1 >= len(literal):
+        return 10, 0
+    second = literal[start + 1]
+    if CHAR_CLASSES[ord(second)] == DIGIT:
+        return 8, 1
+    base = INTEGER_PREFIXES.get(second, 0)
+    if base == 0:
+        return 10, 0
+    return base, 2
+
+
+def integer_value(literal):
+    """
+    The value of an integer literal, which may have a base prefix.
+
+    Raises an OverflowError if it doesn't fit in a machine word.
+
+    """
+
+    base, start = integer_prefix(literal, 0)
+    value = 0
+    for i in range(start, len(literal)):
+        value = ovfcheck(value * base + DIGIT_VALUES[ord(literal[i])])
+    return value
+
+
+def bigint_value(literal):
+    """
+    The value of an integer literal of any size, as an rbigint.
+
+    """
+
+    base, start = integer_prefix(literal, 0)
+    w_base = rbigint.fromint(base)
+    value = rbigint.fromint(0)
+    for i in range(start, len(literal)):
+        digit = rbigint.fromint(DIGIT_VALUES[ord(literal[i])])
+        value = value.mul(w_base).add(digit)
+    return value
+
+
+def single_quoted_value(literal):
+    """
+    The value of a single quoted string literal, where only backslashes and
+    quotes can be escaped.
+
+    """
+
+    result = []
+    i = 0
+    while i < len(literal):
+        c = literal[i]
+        if c == "\\" and i + 1 < len(literal) and literal[i + 1] in "\\'":
+            i += 1
+            c = literal[i]
+        result.append(c)
+        i += 1
+    return "".join(result)
+
+
+def double_quoted_value(literal):
+    """
+    The value of a double quoted string literal, with its escapes replaced.
+
+    """
+
+    result = []
+    i = 0
+    while i < len(literal):
+        c = literal[i]
+        if c == "\\" and i + 1 < len(literal):
+            i += 1
+            c = ESCAPES.get(literal[i], literal[i])
+        result.append(c)
+        i += 1
+    return "".join(result)
@@ -1,30 +1,222 @@
-class W_Object(object):
+from pypy.rlib import jit, rerased
+from pypy.rlib.rarithmetic import ovfcheck
+from pypy.rlib.rbigint import rbigint
+
+
+# Whether to count allocations of integers, to see how many the small integer
+# cache saves. Should be False when translating.
+COUNT_ALLOCATIONS = False
+
+
+class AllocationCounts(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.integers = 0
+        self.big_integers = 0
+
+
+allocations = AllocationCounts()
+
+
+class RubyError(Exception):
+    """
+    An error in a running program, like calling a method that doesn't exist.
+
+    """
+
+    # The name of the error in Ruby, where it differs from this class'.
+    ruby_name = None
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+    def nice_error_message(self):
+        name = self.ruby_name
+        if name is None:
+            name = self.__class__.__name__
+        return "%s: %s" % (name, self.message)
+
+
+class NoMethodError(RubyError):
+    pass
+
+
+class ArgumentError(RubyError):
+    pass
+
+
+class FrozenError(RubyError):
     pass
 
 
+class RubyNameError(RubyError):
+    ruby_name = "NameError"
+
+
+class RubyTypeError(RubyError):
+    ruby_name = "TypeError"
+
+
+class RubyIndexError(RubyError):
+    ruby_name = "IndexError"
+
+
+class W_Object(object):
+    def getclass(self):
+        return w_object_class
+
+    def definee(self):
+        """
+        The class which methods defined with this object as self go on.
+
+        """
+
+        return self.getclass()
+
+    def to_s(self):
+        """
+        This object as a string, as ``puts`` prints it.
+
+        """
+
+        return self.inspect()
+
+    def add(self, other):
+        raise NoMethodError(
+            "undefined method '+' for an instance of %s" % (
+                self.getclass().name,
+            )
+        )
+
+    def sub(self, other):
+        raise NoMethodError(
+            "undefined method '-' for an instance of %s" % (
+                self.getclass().name,
+            )
+        )
+
+    def eq(self, other):
+        return self is other
+
+    def iter(self):
+        """
+        An iterator over this object's items, or None if it has none.
+
+        """
+
+        return None
+
+    def getivar(self, w_name):
+        return w_nil
+
+    def setivar(self, w_name, w_value):
+        raise FrozenError(
+            "can't modify frozen %s: %s" % (
+                self.getclass().name, self.inspect(),
+            )
+        )
+
+
 class W_Integer(W_Object):
+    """
+    An integer which fits in a machine word.
+
+    Arithmetic which overflows produces a :class:`W_BigInteger` instead.
+
+    """
+
+    _immutable_fields_ = ["value"]
+
     def __init__(self, value):
+        if COUNT_ALLOCATIONS:
+            allocations.integers += 1
         self.value = value
 
+    def getclass(self):
+        return w_integer_class
+
+    def bigint(self):
+        return rbigint.fromint(self.value)
+
     def add(self, other):
-        if not isinstance(other, W_Integer):
-            raise TypeError
-        return W_Integer(self.value + other.value)
+        if isinstance(other, W_Integer):
+            try:
+                return wrap_int(ovfcheck(self.value + other.value))
+            except OverflowError:
+                return W_BigInteger(self.bigint().add(other.bigint()))
+        elif isinstance(other, W_BigInteger):
+            return wrap_bigint(self.bigint().add(other.value))
+        raise not_an_integer(other)
+
+    def sub(self, other):
+        if isinstance(other, W_Integer):
+            try:
+                return wrap_int(ovfcheck(self.value - other.value))
+            except OverflowError:
+                return W_BigInteger(self.bigint().sub(other.bigint()))
+        elif isinstance(other, W_BigInteger):
+            return wrap_bigint(self.bigint().sub(other.value))
+        raise not_an_integer(other)
 
     def eq(self, other):
-        if not isinstance(other, W_Integer):
-            raise TypeError
-        return self.value == other.value
+        if isinstance(other, W_Integer):
+            return self.value == other.value
+        elif isinstance(other, W_BigInteger):
+            return self.bigint().eq(other.value)
+        return False
 
     def inspect(self):
         # XXX
         return str(self.value)
 
 
+class W_BigInteger(W_Object):
+    """
+    An integer too large to fit in a machine word.
+
+    Results which fit in one again are demoted back to a :class:`W_Integer`.
+
+    """
+
+    _immutable_fields_ = ["value"]
+
+    def __init__(self, value):
+        if COUNT_ALLOCATIONS:
+            allocations.big_integers += 1
+        self.value = value
+
+    def getclass(self):
+        return w_integer_class
+
+    def add(self, other):
+        return wrap_bigint(self.value.add(bigint_of(other)))
+
+    def sub(self, other):
+        return wrap_bigint(self.value.sub(bigint_of(other)))
+
+    def eq(self, other):
+        if not isinstance(other, W_Integer) and (
+            not isinstance(other, W_BigInteger)
+        ):
+            return False
+        return self.value.eq(bigint_of(other))
+
+    def inspect(self):
+        return self.value.str()
+
+
 class W_TrueClass(W_Object):
     def __repr__(self):
         return "<w_true>"
 
+    def getclass(self):
+        return w_true_class
+
     def inspect(self):
         return "true"
 
@@ -33,6 +225,9 @@ class W_FalseClass(W_Object):
     def __repr__(self):
         return "<w_false>"
 
+    def getclass(self):
+        return w_false_class
+
     def inspect(self):
         return "false"
 
@@ -41,14 +236,951 @@ class W_NilClass(W_Object):
     def __repr__(self):
         return "<w_nil>"
 
+    def getclass(self):
+        return w_nil_class
+
     def inspect(self):
         return "nil"
 
+    def to_s(self):
+        return ""
+
+
+class W_Symbol(W_Object):
+    """
+    A name, of which there is only ever one of each.
+
+    Symbols are interned by the :class:`SymbolTable`, so two are equal only
+    if they're the same object, which makes comparing them, or looking them
+    up in a dictionary, a pointer comparison rather than a comparison of
+    their characters.
+
+    """
+
+    _immutable_fields_ = ["name"]
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "<W_Symbol %s>" % (self.name,)
+
+    def getclass(self):
+        return w_symbol_class
+
+    def inspect(self):
+        return ":%s" % (self.name,)
+
+    def to_s(self):
+        return self.name
+
+
+class SymbolTable(object):
+    """
+    The symbol for each name that has been used.
+
+    """
+
+    def __init__(self):
+        self.symbols = {}
+
+    @jit.elidable
+    def intern(self, name):
+        w_symbol = self.symbols.get(name, None)
+        if w_symbol is None:
+            w_symbol = self.symbols[name] = W_Symbol(name)
+        return w_symbol
+
+
+class VersionTag(object):
+    pass
+
+
+class Map(object):
+    """
+    The layout of the instance variables of instances of a class.
+
+    Instances with the same instance variables, added in the same order,
+    share a map, which maps each variable's name (a symbol) to where it is
+    stored in the instances. Maps never change -- adding a variable to an
+    instance moves it to another map instead -- so the JIT can promote an
+    instance's map and constant fold looking variables up in it.
+
+    """
+
+    _immutable_fields_ = ["w_class", "indices", "transitions"]
+
+    def __init__(self, w_class):
+        self.w_class = w_class
+        self.indices = {}
+        self.transitions = {}
+
+    @jit.elidable
+    def find(self, w_name):
+        """
+        Where the named variable is stored, or -1 if it isn't.
+
+        """
+
+        return self.indices.get(w_name, -1)
+
+    @jit.elidable
+    def with_variable(self, w_name):
+        """
+        The map instances move to when the named variable is added to them.
+
+        """
+
+        new_map = self.transitions.get(w_name, None)
+        if new_map is None:
+            new_map = Map(self.w_class)
+            new_map.indices.update(self.indices)
+            new_map.indices[w_name] = len(self.indices)
+            self.transitions[w_name] = new_map
+        return new_map
+
+
+class W_Class(W_Object):
+    """
+    A class, which methods are looked up on.
+
+    Methods are keyed by their names' symbols. Each class has a version,
+    which is replaced whenever its methods (or those of a superclass)
+    change, so that lookups can be cached by version.
+
+    """
+
+    _immutable_fields_ = ["name", "superclass", "version?", "instance_map"]
+
+    def __init__(self, name, superclass):
+        self.name = name
+        self.superclass = superclass
+        self.methods = {}
+        self.subclasses = []
+        self.version = VersionTag()
+        self.instance_map = Map(self)
+        if superclass is not None:
+            superclass.subclasses.append(self)
+
+    def getclass(self):
+        return w_class_class
+
+    def inspect(self):
+        return self.name
+
+    def definee(self):
+        return self
+
+    def define_method(self, w_name, w_method):
+        self.methods[w_name] = w_method
+        self.changed()
+
+    def changed(self):
+        self.version = VersionTag()
+        for subclass in self.subclasses:
+            subclass.changed()
+
+    def lookup(self, w_name):
+        """
+        Find the method with the given name, or return None.
+
+        """
+
+        w_class = jit.promote(self)
+        return w_class._lookup(w_name, jit.promote(w_class.version))
+
+    @jit.elidable
+    def _lookup(self, w_name, version):
+        w_class = self
+        while w_class is not None:
+            w_method = w_class.methods.get(w_name, None)
+            if w_method is not None:
+                return w_method
+            w_class = w_class.superclass
+        return None
+
+
+class W_Method(W_Object):
+    """
+    A method defined in Ruby, whose body has been compiled to bytecode.
+
+    """
+
+    _immutable_fields_ = ["w_name", "num_params", "bytecode"]
+
+    def __init__(self, w_name, num_params, bytecode):
+        self.w_name = w_name
+        self.num_params = num_params
+        self.bytecode = bytecode
+
+    def inspect(self):
+        return "#<Method: %s>" % (self.w_name.name,)
+
+
+class W_Primitive(W_Object):
+    """
+    A method which the interpreter implements itself, like ``Class#new``.
+
+    Most are implemented by a function, which is called with the receiver
+    and a list of the arguments, and which :func:`primitive` defines.
+
+    """
+
+    _immutable_fields_ = ["w_name", "num_params", "function"]
+
+    def __init__(self, w_name, num_params=0, function=None):
+        self.w_name = w_name
+        self.num_params = num_params
+        self.function = function
+
+    def inspect(self):
+        return "#<Method: %s>" % (self.w_name.name,)
+
+
+class W_Instance(W_Object):
+    """
+    An instance of a class defined in Ruby.
+
+    Its instance variables are stored in a list, laid out by its map.
+
+    """
+
+    def __init__(self, w_class):
+        self.map = w_class.instance_map
+        self.storage = []
+
+    def getclass(self):
+        return jit.promote(self.map).w_class
+
+    def inspect(self):
+        return "#<%s>" % (self.getclass().name,)
+
+    def getivar(self, w_name):
+        index = jit.promote(self.map).find(w_name)
+        if index == -1:
+            return w_nil
+        return self.storage[index]
+
+    def setivar(self, w_name, w_value):
+        map = jit.promote(self.map)
+        index = map.find(w_name)
+        if index == -1:
+            self.add_variable(map.with_variable(w_name), w_value)
+        else:
+            self.storage[index] = w_value
+
+    def add_variable(self, new_map, w_value):
+        self.map = new_map
+        self.storage.append(w_value)
+
+
+class W_Main(W_Instance):
+    """
+    The object that top-level code runs as.
+
+    """
+
+    def inspect(self):
+        return "main"
+
+
+class W_Array(W_Object):
+    """
+    An array, whose items are stored however its strategy decides.
+
+    Arrays of nothing but integers store them unboxed, and switch to storing
+    objects the first time anything else is put in them.
+
+    """
+
+    def __init__(self, strategy, storage):
+        self.strategy = strategy
+        self.storage = storage
+
+    def getclass(self):
+        return w_array_class
+
+    def inspect(self):
+        items = [self.getitem(i).inspect() for i in range(self.length())]
+        return "[%s]" % (", ".join(items),)
+
+    def length(self):
+        return jit.promote(self.strategy).length(self)
+
+    def getitem(self, index):
+        length = self.length()
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            return w_nil
+        return jit.promote(self.strategy).getitem(self, index)
+
+    def setitem(self, index, w_value):
+        length = self.length()
+        if index < 0:
+            index += length
+            if index < 0:
+                raise RubyIndexError(
+                    "index %d too small for array; minimum: -%d" % (
+                        index - length, length,
+                    )
+                )
+        if index < length:
+            jit.promote(self.strategy).setitem(self, index, w_value)
+            return
+        while self.length() < index:
+            self.append(w_nil)
+        self.append(w_value)
+
+    def append(self, w_value):
+        jit.promote(self.strategy).append(self, w_value)
+
+    def concat(self, w_other):
+        jit.promote(self.strategy).extend(self, w_other)
+
+    def dup(self):
+        return jit.promote(self.strategy).dup(self)
+
+    def iter(self):
+        return W_ArrayIterator(self, 0)
+
+    def switch_to_objects(self):
+        items_w = self.strategy.items(self)
+        self.strategy = object_strategy
+        self.storage = object_strategy.erase(items_w)
+
+
+class ArrayStrategy(object):
+    """
+    How an array's items are stored.
+
+    Strategies are singletons, and an array's storage is erased, so that its
+    type can differ depending on its strategy.
+
+    """
+
+    def length(self, w_array):
+        raise NotImplementedError
+
+    def getitem(self, w_array, index):
+        raise NotImplementedError
+
+    def setitem(self, w_array, index, w_value):
+        raise NotImplementedError
+
+    def append(self, w_array, w_value):
+        raise NotImplementedError
+
+    def extend(self, w_array, w_other):
+        raise NotImplementedError
+
+    def items(self, w_array):
+        """
+        The array's items, boxed.
+
+        """
+
+        raise NotImplementedError
+
+    def dup(self, w_array):
+        raise NotImplementedError
+
+
+class IntegerArrayStrategy(ArrayStrategy):
+    """
+    Store items as a list of unboxed machine integers.
+
+    """
+
+    erase, unerase = rerased.new_erasing_pair("integers")
+    erase = staticmethod(erase)
+    unerase = staticmethod(unerase)
+
+    def length(self, w_array):
+        return len(self.unerase(w_array.storage))
+
+    def getitem(self, w_array, index):
+        return wrap_int(self.unerase(w_array.storage)[index])
+
+    def setitem(self, w_array, index, w_value):
+        if isinstance(w_value, W_Integer):
+            self.unerase(w_array.storage)[index] = w_value.value
+        else:
+            w_array.switch_to_objects()
+            w_array.strategy.setitem(w_array, index, w_value)
+
+    def append(self, w_array, w_value):
+        if isinstance(w_value, W_Integer):
+            self.unerase(w_array.storage).append(w_value.value)
+        else:
+            w_array.switch_to_objects()
+            w_array.strategy.append(w_array, w_value)
+
+    def extend(self, w_array, w_other):
+        if w_other.strategy is self:
+            self.unerase(w_array.storage).extend(
+                self.unerase(w_other.storage),
+            )
+        else:
+            w_array.switch_to_objects()
+            w_array.strategy.extend(w_array, w_other)
+
+    def items(self, w_array):
+        return [wrap_int(value) for value in self.unerase(w_array.storage)]
+
+    def dup(self, w_array):
+        return W_Array(self, self.erase(self.unerase(w_array.storage)[:]))
+
+
+class ObjectArrayStrategy(ArrayStrategy):
+    """
+    Store items as a list of objects, which is what anything else needs.
+
+    """
+
+    erase, unerase = rerased.new_erasing_pair("objects")
+    erase = staticmethod(erase)
+    unerase = staticmethod(unerase)
+
+    def length(self, w_array):
+        return len(self.unerase(w_array.storage))
+
+    def getitem(self, w_array, index):
+        return self.unerase(w_array.storage)[index]
+
+    def setitem(self, w_array, index, w_value):
+        self.unerase(w_array.storage)[index] = w_value
+
+    def append(self, w_array, w_value):
+        self.unerase(w_array.storage).append(w_value)
+
+    def extend(self, w_array, w_other):
+        self.unerase(w_array.storage).extend(w_other.strategy.items(w_other))
+
+    def items(self, w_array):
+        return self.unerase(w_array.storage)[:]
+
+    def dup(self, w_array):
+        return W_Array(self, self.erase(self.unerase(w_array.storage)[:]))
+
+
+integer_strategy = IntegerArrayStrategy()
+object_strategy = ObjectArrayStrategy()
+
+
+class W_String(W_Object):
+    """
+    A mutable string of bytes.
+
+    Its contents are either a flat buffer of characters, or a rope of the
+    strings concatenated to make it, which is only flattened once the
+    characters are needed. That way, building a string up with ``+`` takes
+    linear rather than quadratic time.
+
+    A buffer can be shared between strings, like copies of a string
+    literal, until one of them mutates it, which copies it first.
+
+    """
+
+    def __init__(self, node, shared=False):
+        self.node = node
+        self.shared = shared
+
+    def getclass(self):
+        return w_string_class
+
+    def inspect(self):
+        return '"%s"' % (escape(self.str_w()),)
+
+    def to_s(self):
+        return self.str_w()
+
+    def str_w(self):
+        return "".join(self.chars())
+
+    def length(self):
+        return self.node.length()
+
+    def chars(self):
+        """
+        The characters of this string, which mustn't be modified.
+
+        """
+
+        node = self.node
+        if isinstance(node, ConcatNode):
+            node = self.node = FlatNode(node.flatten())
+            self.shared = False
+        assert isinstance(node, FlatNode)
+        return node.chars
+
+    def mutable_chars(self):
+        chars = self.chars()
+        if self.shared:
+            chars = chars[:]
+            self.node = FlatNode(chars)
+            self.shared = False
+        return chars
+
+    def share(self):
+        """
+        A copy of this string, sharing its buffer until either is mutated.
+
+        """
+
+        self.shared = True
+        return W_String(self.node, shared=True)
+
+    def add(self, other):
+        w_other = string_of(other)
+        self.shared = w_other.shared = True
+        return W_String(ConcatNode(self.node, w_other.node), shared=True)
+
+    def append(self, w_other):
+        other_chars = w_other.chars()
+        self.mutable_chars().extend(other_chars)
+
+    def eq(self, other):
+        if not isinstance(other, W_String):
+            return False
+        return self.length() == other.length() and (
+            self.chars() == other.chars()
+        )
+
+
+class StringNode(object):
+    """
+    Part of a string: either a buffer of characters or a concatenation.
+
+    """
+
+    def length(self):
+        raise NotImplementedError
+
+
+class FlatNode(StringNode):
+    def __init__(self, chars):
+        self.chars = chars
+
+    def length(self):
+        return len(self.chars)
+
+
+class ConcatNode(StringNode):
+    """
+    Two strings concatenated, whose buffers are shared and never change.
+
+    """
+
+    _immutable_fields_ = ["left", "right", "size"]
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.size = left.length() + right.length()
+
+    def length(self):
+        return self.size
+
+    def flatten(self):
+        """
+        Copy the characters of every part of the rope into one new buffer.
+
+        Ropes built up one piece at a time are as deep as they are long, so
+        this walks them with a stack of its own rather than recursing.
+
+        """
+
+        chars = ["\0"] * self.size
+        pos = 0
+        pending = [self.right, self.left]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, ConcatNode):
+                pending.append(node.right)
+                pending.append(node.left)
+            else:
+                assert isinstance(node, FlatNode)
+                for c in node.chars:
+                    chars[pos] = c
+                    pos += 1
+        return chars
+
+
+def escape(value):
+    """
+    Escape a string, the way inspecting it does.
+
+    """
+
+    result = []
+    for c in value:
+        if c == '"' or c == "\\":
+            result.append("\\" + c)
+        elif c == "\n":
+            result.append("\\n")
+        elif c == "\t":
+            result.append("\\t")
+        else:
+            result.append(c)
+    return "".join(result)
+
+
+class W_Range(W_Object):
+    """
+    A range of integers, which are only produced as they're needed.
+
+    """
+
+    _immutable_fields_ = ["start", "stop", "exclusive"]
+
+    def __init__(self, start, stop, exclusive):
+        self.start = start
+        self.stop = stop
+        self.exclusive = exclusive
+
+    def getclass(self):
+        return w_range_class
+
+    def inspect(self):
+        if self.exclusive:
+            return "%d...%d" % (self.start, self.stop)
+        return "%d..%d" % (self.start, self.stop)
+
+    def end(self):
+        """
+        The integer after the last one in the range.
+
+        """
+
+        if self.exclusive:
+            return self.stop
+        return self.stop + 1
+
+    def length(self):
+        return max(0, self.end() - self.start)
+
+    def to_array(self):
+        values = [0] * self.length()
+        for i in range(len(values)):
+            values[i] = self.start + i
+        return W_Array(integer_strategy, integer_strategy.erase(values))
+
+    def iter(self):
+        return W_RangeIterator(self.start, self.end())
+
+
+class W_Iterator(W_Object):
+    """
+    An iterator, used to loop over something with ``each``.
+
+    Iterators never change. Advancing one makes a new iterator instead, so
+    in a loop, where only the latest one is live, the JIT can remove them
+    entirely.
+
+    """
+
+    def done(self):
+        raise NotImplementedError
+
+    def value(self):
+        raise NotImplementedError
+
+    def next(self):
+        raise NotImplementedError
+
+
+class W_RangeIterator(W_Iterator):
+    _immutable_fields_ = ["current", "stop"]
+
+    def __init__(self, current, stop):
+        self.current = current
+        self.stop = stop
+
+    def done(self):
+        return self.current >= self.stop
+
+    def value(self):
+        return wrap_int(self.current)
+
+    def next(self):
+        return W_RangeIterator(self.current + 1, self.stop)
+
+
+class W_ArrayIterator(W_Iterator):
+    _immutable_fields_ = ["w_array", "index"]
+
+    def __init__(self, w_array, index):
+        self.w_array = w_array
+        self.index = index
+
+    def done(self):
+        return self.index >= self.w_array.length()
+
+    def value(self):
+        return self.w_array.getitem(self.index)
+
+    def next(self):
+        return W_ArrayIterator(self.w_array, self.index + 1)
+
+
+class Constants(object):
+    """
+    The constants defined at the top level, like the names of classes.
+
+    Like a class' methods, they're versioned so that looking them up can be
+    constant folded.
+
+    """
+
+    _immutable_fields_ = ["version?"]
+
+    def __init__(self):
+        self.values = {}
+        self.version = VersionTag()
+
+    def define(self, name, w_value):
+        self.values[name] = w_value
+        self.version = VersionTag()
+
+    def lookup(self, name):
+        """
+        Find the constant with the given name, or return None.
+
+        """
+
+        constants = jit.promote(self)
+        return constants._lookup(name, jit.promote(constants.version))
+
+    @jit.elidable
+    def _lookup(self, name, version):
+        return self.values.get(name, None)
+
 
 w_nil, w_true, w_false = W_NilClass(), W_TrueClass(), W_FalseClass()
 
+w_object_class = W_Class("Object", None)
+w_class_class = W_Class("Class", w_object_class)
+w_integer_class = W_Class("Integer", w_object_class)
+w_true_class = W_Class("TrueClass", w_object_class)
+w_false_class = W_Class("FalseClass", w_object_class)
+w_nil_class = W_Class("NilClass", w_object_class)
+w_array_class = W_Class("Array", w_object_class)
+w_range_class = W_Class("Range", w_object_class)
+w_string_class = W_Class("String", w_object_class)
+w_symbol_class = W_Class("Symbol", w_object_class)
+
+w_main = W_Main(w_object_class)
+
+symbols = SymbolTable()
+
+w_new = W_Primitive(symbols.intern("new"), -1)
+w_class_class.define_method(w_new.w_name, w_new)
+
+constants = Constants()
+for w_class in [
+    w_object_class, w_class_class, w_integer_class, w_true_class,
+    w_false_class, w_nil_class, w_array_class, w_range_class,
+    w_string_class, w_symbol_class,
+]:
+    constants.define(w_class.name, w_class)
+
+
+def primitive(w_class, name, num_params):
+    """
+    Define a method on the class, implemented by the decorated function.
+
+    """
+
+    def define(function):
+        w_name = symbols.intern(name)
+        w_class.define_method(
+            w_name, W_Primitive(w_name, num_params, function),
+        )
+        return function
+    return define
+
+
+def array_of(w_value):
+    if not isinstance(w_value, W_Array):
+        raise RubyTypeError(
+            "no implicit conversion of %s into Array" % (
+                w_value.getclass().name,
+            )
+        )
+    return w_value
+
+
+@primitive(w_array_class, "length", 0)
+@primitive(w_array_class, "size", 0)
+def array_length(w_self, args_w):
+    return wrap_int(array_of(w_self).length())
+
+
+@primitive(w_array_class, "dup", 0)
+def array_dup(w_self, args_w):
+    return array_of(w_self).dup()
+
+
+@primitive(w_array_class, "concat", 1)
+def array_concat(w_self, args_w):
+    w_array = array_of(w_self)
+    w_array.concat(array_of(args_w[0]))
+    return w_array
+
+
+def range_of(w_value):
+    if not isinstance(w_value, W_Range):
+        raise RubyTypeError(
+            "no implicit conversion of %s into Range" % (
+                w_value.getclass().name,
+            )
+        )
+    return w_value
+
+
+def string_of(w_value):
+    if not isinstance(w_value, W_String):
+        raise RubyTypeError(
+            "no implicit conversion of %s into String" % (
+                w_value.getclass().name,
+            )
+        )
+    return w_value
+
+
+@primitive(w_string_class, "length", 0)
+@primitive(w_string_class, "size", 0)
+def string_length(w_self, args_w):
+    return wrap_int(string_of(w_self).length())
+
+
+@primitive(w_string_class, "<<", 1)
+def string_append(w_self, args_w):
+    w_string = string_of(w_self)
+    w_string.append(string_of(args_w[0]))
+    return w_string
+
+
+@primitive(w_string_class, "dup", 0)
+def string_dup(w_self, args_w):
+    return string_of(w_self).share()
+
+
+@primitive(w_range_class, "to_a", 0)
+def range_to_a(w_self, args_w):
+    return range_of(w_self).to_array()
+
+
+@primitive(w_range_class, "size", 0)
+def range_size(w_self, args_w):
+    return wrap_int(range_of(w_self).length())
+
 
 def boolean(value):
     if value:
         return w_true
     return w_false
+
+
+def is_true(w_value):
+    return w_value is not w_false and w_value is not w_nil
+
+
+# Integers which are common enough to be worth allocating only once.
+SMALL_INTEGERS = [W_Integer(i) for i in range(256)]
+
+
+def wrap_int(value):
+    """
+    Wrap an integer, reusing a preallocated one if it's small.
+
+    Traces don't use the cache, since there the boxes of fresh integers can
+    usually be removed entirely.
+
+    """
+
+    if not jit.we_are_jitted() and 0 <= value < len(SMALL_INTEGERS):
+        return SMALL_INTEGERS[value]
+    return W_Integer(value)
+
+
+def bigint_of(w_value):
+    if isinstance(w_value, W_Integer):
+        return w_value.bigint()
+    elif isinstance(w_value, W_BigInteger):
+        return w_value.value
+    raise not_an_integer(w_value)
+
+
+def not_an_integer(w_value):
+    return RubyTypeError(
+        "%s can't be coerced into Integer" % (w_value.getclass().name,)
+    )
+
+
+def wrap_bigint(value):
+    """
+    Wrap an arbitrary precision integer, in a W_Integer if it fits in one.
+
+    """
+
+    try:
+        return wrap_int(value.toint())
+    except OverflowError:
+        return W_BigInteger(value)
+
+
+def wrap_string(value):
+    return W_String(FlatNode([c for c in value]))
+
+
+def build_string(items_w):
+    """
+    Join the string forms of some objects into one new string.
+
+    The result's buffer is allocated at its final size up front and each
+    part is copied into it once, rather than concatenating them pairwise.
+
+    """
+
+    texts = [""] * len(items_w)
+    size = 0
+    for i in range(len(items_w)):
+        w_item = items_w[i]
+        if isinstance(w_item, W_String):
+            size += w_item.length()
+        else:
+            texts[i] = w_item.to_s()
+            size += len(texts[i])
+
+    chars = ["\0"] * size
+    pos = 0
+    for i in range(len(items_w)):
+        w_item = items_w[i]
+        if isinstance(w_item, W_String):
+            for c in w_item.chars():
+                chars[pos] = c
+                pos += 1
+        else:
+            for c in texts[i]:
+                chars[pos] = c
+                pos += 1
+    return W_String(FlatNode(chars))
+
+
+def wrap_array(items_w):
+    """
+    Wrap a list of objects, storing them unboxed if they're all integers.
+
+    """
+
+    for w_item in items_w:
+        if not isinstance(w_item, W_Integer):
+            return W_Array(object_strategy, object_strategy.erase(items_w))
+    values = [0] * len(items_w)
+    for i in range(len(items_w)):
+        w_item = items_w[i]
+        assert isinstance(w_item, W_Integer)
+        values[i] = w_item.value
+    return W_Array(integer_strategy, integer_strategy.erase(values))
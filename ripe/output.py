@@ -0,0 +1,60 @@
+"""
+Buffered output for what programs print.
+
+"""
+
+import os
+
+from pypy.rlib import jit
+from pypy.rlib.streamio import fdopen_as_stream
+
+
+BUFFER_SIZE = 64 * 1024
+
+
+class Output(object):
+    """
+    Writes to a file descriptor through a large buffer.
+
+    The buffer is flushed whenever it fills up and by :meth:`flush`, which
+    should be called before exiting. If the descriptor is a terminal, it's
+    line buffered instead, so that output shows up as it's printed.
+
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.stream = None
+
+    def get_stream(self):
+        if self.stream is None:
+            if os.isatty(self.fd):
+                buffering = 1
+            else:
+                buffering = BUFFER_SIZE
+            self.stream = fdopen_as_stream(self.fd, "w", buffering)
+        return self.stream
+
+    @jit.dont_look_inside
+    def write(self, data):
+        self.get_stream().write(data)
+
+    @jit.dont_look_inside
+    def flush(self):
+        if self.stream is not None:
+            self.stream.flush()
+
+    def redirect(self, stream):
+        """
+        Write to the given stream instead, or back to the descriptor if None.
+
+        Any stream with ``write`` and ``flush`` will do, which lets tests
+        capture output.
+
+        """
+
+        self.flush()
+        self.stream = stream
+
+
+stdout = Output(1)
@@ -1,37 +1,151 @@
-from pypy.rlib.parsing.ebnfparse import parse_ebnf, make_parse_function
-from pypy.rlib.parsing.tree import RPythonVisitor
-import py
-
-from ripe import compiler, ripedir
-from ripe.objects import W_Integer
-
-grammar = py.path.local(ripedir).join("grammar.txt").read("rt")
-regexs, rules, ToAST = parse_ebnf(grammar)
-_parse = make_parse_function(regexs, rules, eof=True)
-
-
-BASES = {"BINARY" : 2, "OCTAL" : 8, "DECIMAL" : 10, "HEX" : 16}
+from pypy.rlib.rarithmetic import ovfcheck
+
+from ripe import compiler
+from ripe.lexer import (
+    DOUBLE_QUOTED_STRING,
+    EOF,
+    IDENTIFIER,
+    INSTANCE_VARIABLE,
+    INTEGER,
+    SEPARATOR,
+    SINGLE_QUOTED_STRING,
+    SYMBOL,
+    Lexer,
+    SourceError,
+    bigint_value,
+    double_quoted_value,
+    integer_value,
+    interpolation_bounds,
+    single_quoted_value,
+)
+from ripe.objects import (
+    W_Method,
+    boolean,
+    symbols,
+    w_false,
+    w_nil,
+    w_true,
+    wrap_bigint,
+)
+
+
+PSEUDO_VARIABLES = {"nil" : w_nil, "true" : w_true, "false" : w_false}
+
+# Whether a node's value is known to be truthy or falsy when compiling.
+UNKNOWN, FALSY, TRUTHY = range(3)
+
+# How tightly each binary operator binds -- higher binds tighter.
+BINARY_PRECEDENCE = {
+    ".." : 5, "..." : 5, "==" : 10, "!=" : 10, "<<" : 15, "+" : 20, "-" : 20,
+}
+
+# Tokens which end a block of statements.
+BLOCK_END = dict.fromkeys(["end", "else", "elsif", EOF])
+
+
+class ParseError(SourceError):
+    pass
 
 
 class Node(object):
     """
     An AST node.
 
+    Nodes know the line and column they started at in the source, which are
+    0 for nodes that don't correspond to any particular bit of it.
+
     """
 
+    lineno = 0
+    column = 0
+
     def __eq__(self, other):
         return (
             self.__class__ == other.__class__ and
-            self.__dict__ == other.__dict__
+            self.fields() == other.fields()
         )
 
     def __ne__(self, other):
         return not self == other
 
     def __repr__(self):
-        contents = ("%s=%r" % (k, v) for k, v in self.__dict__.iteritems())
+        contents = ("%s=%r" % (k, v) for k, v in self.fields().iteritems())
         return "<%s %s>" % (self.__class__.__name__, ", ".join(contents))
 
+    def fields(self):
+        """
+        The contents of this node, without its position in the source.
+
+        """
+
+        fields = self.__dict__.copy()
+        fields.pop("lineno", None)
+        fields.pop("column", None)
+        return fields
+
+    def at(self, token):
+        """
+        Record that this node starts at the given token, and return it.
+
+        """
+
+        self.lineno = token.lineno
+        self.column = token.column
+        return self
+
+    def fold(self):
+        """
+        Return an equivalent node with any constant subexpressions evaluated.
+
+        """
+
+        return self
+
+    def as_statement(self):
+        """
+        Return a statement evaluating this node and discarding its value.
+
+        """
+
+        return Expression(self)
+
+    def truthiness(self):
+        """
+        Whether this node is always truthy or falsy, if it's known statically.
+
+        """
+
+        return UNKNOWN
+
+    def compile_jump(self, context, when):
+        """
+        Compile this node as a condition, followed by a jump taken when its
+        truthiness is ``when``.
+
+        If the jump is taken, ``nil`` is left on the stack in place of the
+        condition's value. Returns the position of the jump's target, which
+        needs patching once the target is known.
+
+        """
+
+        self.compile(context)
+        if when:
+            context.emit(compiler.JUMP_IF_TRUE, 0)
+        else:
+            context.emit(compiler.JUMP_IF_FALSE, 0)
+        return len(context.data) - 1
+
+    def compile_value(self, context):
+        """
+        Compile this statement, leaving its value on the stack.
+
+        """
+
+        self.compile(context)
+        context.emit(
+            compiler.LOAD_CONSTANT, context.register_constant(w_nil),
+        )
+
 
 class Compound(Node):
     def __init__(self, statements=None):
@@ -41,8 +155,51 @@ class Compound(Node):
 
     def compile(self, context):
         for statement in self.statements:
+            if statement.lineno:
+                context.lineno = statement.lineno
             statement.compile(context)
 
+    def compile_value(self, context):
+        if not self.statements:
+            Node.compile_value(self, context)
+            return
+        Compound(self.statements[:-1]).compile(context)
+        last = self.statements[-1]
+        if last.lineno:
+            context.lineno = last.lineno
+        last.compile_value(context)
+
+    def fold(self):
+        statements = []
+        for statement in self.statements:
+            folded = statement.fold()
+            if isinstance(folded, Compound):
+                statements.extend(folded.statements)
+            else:
+                if not folded.lineno:
+                    folded.lineno = statement.lineno
+                    folded.column = statement.column
+                statements.append(folded)
+        return Compound(statements)
+
+    def fold_value(self):
+        """
+        Fold, but without dropping the last statement, whose value is used.
+
+        """
+
+        if not self.statements:
+            return self
+        folded = Compound(self.statements[:-1]).fold()
+        last = self.statements[-1]
+        if isinstance(last, Expression):
+            value = Expression(last.expr.fold())
+            value.lineno, value.column = last.lineno, last.column
+            folded.statements.append(value)
+        else:
+            folded.statements.extend(Compound([last]).fold().statements)
+        return folded
+
 
 class Expression(Node):
     def __init__(self, expr):
@@ -52,6 +209,12 @@ class Expression(Node):
         self.expr.compile(context)
         context.emit(compiler.DISCARD_TOP)
 
+    def compile_value(self, context):
+        self.expr.compile(context)
+
+    def fold(self):
+        return self.expr.fold().as_statement()
+
 
 class Assign(Node):
     def __init__(self, name, expr):
@@ -60,7 +223,21 @@ class Assign(Node):
 
     def compile(self, context):
         self.expr.compile(context)
-        context.emit(compiler.ASSIGN, context.register_variable(self.name))
+        if is_instance_variable(self.name):
+            context.emit_attribute(
+                compiler.STORE_INSTANCE_VARIABLE, self.name,
+            )
+        else:
+            context.emit(
+                compiler.ASSIGN, context.register_variable(self.name),
+            )
+
+    def compile_value(self, context):
+        self.compile(context)
+        Variable(self.name).compile(context)
+
+    def fold(self):
+        return Assign(self.name, self.expr.fold())
 
 
 class Variable(Node):
@@ -68,9 +245,62 @@ class Variable(Node):
         self.name = name
 
     def compile(self, context):
-        context.emit(
-            compiler.LOAD_VARIABLE, context.register_variable(self.name),
-        )
+        if is_instance_variable(self.name):
+            context.emit_attribute(
+                compiler.LOAD_INSTANCE_VARIABLE, self.name,
+            )
+        elif is_constant(self.name):
+            context.emit(
+                compiler.LOAD_NAMED_CONSTANT,
+                context.register_constant_name(self.name),
+            )
+        else:
+            context.emit(
+                compiler.LOAD_VARIABLE, context.register_variable(self.name),
+            )
+
+    def fold(self):
+        if self.name == "self":
+            return Self()
+        w_value = PSEUDO_VARIABLES.get(self.name, None)
+        if w_value is not None:
+            return Constant(w_value)
+        return self
+
+
+class Self(Node):
+    def compile(self, context):
+        context.emit(compiler.LOAD_SELF)
+
+    def truthiness(self):
+        return TRUTHY
+
+
+class Call(Node):
+    """
+    A method call, on self if there's no receiver.
+
+    """
+
+    def __init__(self, receiver, name, args):
+        self.receiver = receiver
+        self.name = name
+        self.args = args
+
+    def compile(self, context):
+        if self.receiver is None:
+            context.emit(compiler.LOAD_SELF)
+        else:
+            self.receiver.compile(context)
+        for arg in self.args:
+            arg.compile(context)
+        context.emit_call(self.name, len(self.args))
+
+    def fold(self):
+        receiver = self.receiver
+        if receiver is not None:
+            receiver = receiver.fold()
+        return Call(receiver, self.name, [arg.fold() for arg in self.args])
 
 
 class BinOp(Node):
@@ -84,6 +314,34 @@ class BinOp(Node):
         self.right.compile(context)
         context.emit(compiler.BINOP[self.op])
 
+    def fold(self):
+        left, right = self.left.fold(), self.right.fold()
+        if isinstance(left, Int) and isinstance(right, Int):
+            if self.op == "==":
+                return Constant(boolean(left.value == right.value))
+            elif self.op == "!=":
+                return Constant(boolean(left.value != right.value))
+            try:
+                if self.op == "+":
+                    return Int(ovfcheck(left.value + right.value))
+                elif self.op == "-":
+                    return Int(ovfcheck(left.value - right.value))
+            except OverflowError:
+                pass
+        return BinOp(left, self.op, right)
+
+    def compile_jump(self, context, when):
+        if self.op != "==" and self.op != "!=":
+            return Node.compile_jump(self, context, when)
+
+        # Compare and branch in one go, without making a boolean in between.
+        self.left.compile(context)
+        self.right.compile(context)
+        if (self.op == "==") == when:
+            context.emit(compiler.JUMP_IF_EQ, 0)
+        else:
+            context.emit(compiler.JUMP_IF_NOT_EQ, 0)
+        return len(context.data) - 1
 
 
 class Int(Node):
@@ -91,22 +349,125 @@ class Int(Node):
         self.value = value
 
     def compile(self, context):
-        w_self = W_Integer(self.value)
-        context.emit(compiler.LOAD_CONSTANT, context.register_constant(w_self))
+        context.emit(
+            compiler.LOAD_CONSTANT, context.register_int_constant(self.value),
+        )
+
+    def truthiness(self):
+        return TRUTHY
+
+
+class Constant(Node):
+    """
+    An already evaluated value, produced by folding constant expressions.
+
+    """
+
+    def __init__(self, w_value):
+        self.w_value = w_value
+
+    def compile(self, context):
+        context.emit(
+            compiler.LOAD_CONSTANT, context.register_constant(self.w_value),
+        )
 
-    def neg(self):
-        return self.__class__(-self.value)
+    def truthiness(self):
+        if self.w_value is w_false or self.w_value is w_nil:
+            return FALSY
+        return TRUTHY
 
 
 class SingleQString(Node):
     def __init__(self, value):
         self.value = value
 
+    def compile(self, context):
+        context.emit(
+            compiler.LOAD_STRING,
+            context.register_string_constant(single_quoted_value(self.value)),
+        )
+
+    def truthiness(self):
+        return TRUTHY
+
 
 class DoubleQString(Node):
     def __init__(self, value):
         self.value = value
 
+    def compile(self, context):
+        context.emit(
+            compiler.LOAD_STRING,
+            context.register_string_constant(double_quoted_value(self.value)),
+        )
+
+    def truthiness(self):
+        return TRUTHY
+
+
+class Symbol(Node):
+    def __init__(self, name):
+        self.name = name
+
+    def compile(self, context):
+        context.emit(
+            compiler.LOAD_CONSTANT,
+            context.register_constant(symbols.intern(self.name)),
+        )
+
+    def truthiness(self):
+        return TRUTHY
+
+
+class Interpolation(Node):
+    """
+    A double quoted string with code interpolated into it.
+
+    ``texts`` are the (raw) pieces of the literal around each piece of
+    code, so there's one more of them than there are ``codes``. The result
+    is built by one BUILD_STRING, which copies each part into a buffer of
+    the right size rather than concatenating them one after another.
+
+    """
+
+    def __init__(self, texts, codes):
+        self.texts = texts
+        self.codes = codes
+
+    def compile(self, context):
+        count = 0
+        for i, code in enumerate(self.codes):
+            count += self.compile_text(context, self.texts[i])
+            code.compile_value(context)
+            count += 1
+        count += self.compile_text(context, self.texts[-1])
+        context.emit(compiler.BUILD_STRING, count)
+
+    def compile_text(self, context, text):
+        """
+        Load a piece of the literal, unless it's empty.
+
+        It's only ever copied, so the constant itself can be loaded, without
+        the copy that LOAD_STRING makes.
+
+        """
+
+        if not text:
+            return 0
+        context.emit(
+            compiler.LOAD_CONSTANT,
+            context.register_string_constant(double_quoted_value(text)),
+        )
+        return 1
+
+    def fold(self):
+        return Interpolation(
+            self.texts, [code.fold_value() for code in self.codes],
+        )
+
+    def truthiness(self):
+        return TRUTHY
+
 
 class If(Node):
     def __init__(self, condition, body):
@@ -114,11 +475,21 @@ class If(Node):
         self.body = body
 
     def compile(self, context):
-        self.condition.compile(context)
-        context.emit(compiler.JUMP_IF_FALSE, 0)
-        jmp_pos = len(context.data) - 1
-        self.body.compile(context)
-        context.data[jmp_pos] = chr(len(context.data))
+        # if the jump is taken, it leaves nil as the value instead
+        jmp_pos = self.condition.compile_jump(context, False)
+        self.body.compile_value(context)
+        context.data[jmp_pos].arg = len(context.data)
+
+    def fold(self):
+        return If(self.condition.fold(), self.body.fold_value())
+
+    def as_statement(self):
+        truthiness = self.condition.truthiness()
+        if truthiness == TRUTHY:
+            return self.body
+        elif truthiness == FALSY:
+            return Compound()
+        return Expression(self)
 
 
 class Unless(Node):
@@ -127,11 +498,21 @@ class Unless(Node):
         self.body = body
 
     def compile(self, context):
-        self.condition.compile(context)
-        context.emit(compiler.JUMP_IF_TRUE, 0)
-        jmp_pos = len(context.data) - 1
-        self.body.compile(context)
-        context.data[jmp_pos] = chr(len(context.data))
+        # if the jump is taken, it leaves nil as the value instead
+        jmp_pos = self.condition.compile_jump(context, True)
+        self.body.compile_value(context)
+        context.data[jmp_pos].arg = len(context.data)
+
+    def fold(self):
+        return Unless(self.condition.fold(), self.body.fold_value())
+
+    def as_statement(self):
+        truthiness = self.condition.truthiness()
+        if truthiness == TRUTHY:
+            return Compound()
+        elif truthiness == FALSY:
+            return self.body
+        return Expression(self)
 
 
 class While(Node):
@@ -141,12 +522,22 @@ class While(Node):
 
     def compile(self, context):
         start_pos = len(context.data)
-        self.condition.compile(context)
-        context.emit(compiler.JUMP_IF_FALSE, 0)
-        jmp_pos = len(context.data) - 1
+        if self.condition.truthiness() == TRUTHY:
+            self.body.compile(context)
+            context.emit(compiler.JUMP_BACKWARD, start_pos)
+            return
+        jmp_pos = self.condition.compile_jump(context, False)
         self.body.compile(context)
         context.emit(compiler.JUMP_BACKWARD, start_pos)
-        context.data[jmp_pos] = chr(len(context.data))
+        context.data[jmp_pos].arg = len(context.data)
+
+    def fold(self):
+        return While(self.condition.fold(), self.body.fold())
+
+    def as_statement(self):
+        if self.condition.truthiness() == FALSY:
+            return Compound()
+        return Expression(self)
 
 
 class Until(Node):
@@ -156,12 +547,22 @@ class Until(Node):
 
     def compile(self, context):
         start_pos = len(context.data)
-        self.condition.compile(context)
-        context.emit(compiler.JUMP_IF_TRUE, 0)
-        jmp_pos = len(context.data) - 1
+        if self.condition.truthiness() == FALSY:
+            self.body.compile(context)
+            context.emit(compiler.JUMP_BACKWARD, start_pos)
+            return
+        jmp_pos = self.condition.compile_jump(context, True)
         self.body.compile(context)
         context.emit(compiler.JUMP_BACKWARD, start_pos)
-        context.data[jmp_pos] = chr(len(context.data))
+        context.data[jmp_pos].arg = len(context.data)
+
+    def fold(self):
+        return Until(self.condition.fold(), self.body.fold())
+
+    def as_statement(self):
+        if self.condition.truthiness() == TRUTHY:
+            return Compound()
+        return Expression(self)
 
 
 class Puts(Node):
@@ -173,6 +574,122 @@ class Puts(Node):
         self.expr.compile(context)
         context.emit(compiler.PUTS, 0)
 
+    def fold(self):
+        return Puts(self.expr.fold())
+
+
+class Array(Node):
+    def __init__(self, items):
+        self.items = items
+
+    def compile(self, context):
+        for item in self.items:
+            item.compile(context)
+        context.emit(compiler.BUILD_ARRAY, len(self.items))
+
+    def fold(self):
+        return Array([item.fold() for item in self.items])
+
+    def truthiness(self):
+        return TRUTHY
+
+
+class Index(Node):
+    def __init__(self, receiver, index):
+        self.receiver = receiver
+        self.index = index
+
+    def compile(self, context):
+        self.receiver.compile(context)
+        self.index.compile(context)
+        context.emit(compiler.INDEX_LOAD)
+
+    def fold(self):
+        return Index(self.receiver.fold(), self.index.fold())
+
+
+class IndexAssign(Node):
+    def __init__(self, receiver, index, expr):
+        self.receiver = receiver
+        self.index = index
+        self.expr = expr
+
+    def compile(self, context):
+        self.receiver.compile(context)
+        self.index.compile(context)
+        self.expr.compile(context)
+        context.emit(compiler.INDEX_STORE)
+
+    def fold(self):
+        return IndexAssign(
+            self.receiver.fold(), self.index.fold(), self.expr.fold(),
+        )
+
+
+class Range(Node):
+    def __init__(self, start, stop, exclusive):
+        self.start = start
+        self.stop = stop
+        self.exclusive = exclusive
+
+    def compile(self, context):
+        self.start.compile(context)
+        self.stop.compile(context)
+        context.emit(compiler.BUILD_RANGE, int(self.exclusive))
+
+    def fold(self):
+        return Range(self.start.fold(), self.stop.fold(), self.exclusive)
+
+    def truthiness(self):
+        return TRUTHY
+
+
+class Each(Node):
+    """
+    A call to ``each`` with a block, which is compiled into a loop.
+
+    The block's parameter, if it has one, is an ordinary variable.
+
+    """
+
+    def __init__(self, receiver, param, body):
+        self.receiver = receiver
+        self.param = param
+        self.body = body
+
+    def compile(self, context):
+        self.receiver.compile(context)
+        context.emit(compiler.GET_ITER)
+        start_pos = len(context.data)
+        context.emit(compiler.FOR_ITER, 0)
+        if self.param is None:
+            context.emit(compiler.DISCARD_TOP)
+        else:
+            context.emit(
+                compiler.ASSIGN, context.register_variable(self.param),
+            )
+        self.body.compile(context)
+        context.emit(compiler.JUMP_BACKWARD, start_pos)
+        context.data[start_pos].arg = len(context.data)
+
+    def fold(self):
+        return Each(self.receiver.fold(), self.param, self.body.fold())
+
+
+class Return(Node):
+    def __init__(self, expr):
+        self.expr = expr
+
+    def compile(self, context):
+        self.expr.compile(context)
+        context.emit(compiler.RETURN_VALUE)
+
+    def compile_value(self, context):
+        self.compile(context)
+
+    def fold(self):
+        return Return(self.expr.fold())
+
 
 class Method(Node):
     def __init__(self, name, params, body):
@@ -180,117 +697,426 @@ class Method(Node):
         self.params = params
         self.body = body
 
+    def compile(self, context):
+        body_context = context.method_context()
+        for param in self.params:
+            body_context.register_variable(param)
+        self.body.compile_value(body_context)
+        body_context.emit(compiler.RETURN_VALUE)
+        w_method = W_Method(
+            symbols.intern(self.name),
+            len(self.params),
+            body_context.create_bytecode(),
+        )
+        context.emit(
+            compiler.DEFINE_METHOD, context.register_constant(w_method),
+        )
 
-class Transformer(RPythonVisitor):
-    def dispatch(self, node):
-        return getattr(self, "visit_%s" % node.symbol)(node)
+    def fold(self):
+        return Method(self.name, self.params, self.body.fold_value())
 
-    def visit_program(self, node):
-        if not node.children:
-            return Compound()
-        statements, = node.children
-        return self.dispatch(statements)
-
-    def visit_statements(self, node):
-        return Compound([
-            self.dispatch(statement) for statement in node.children
-        ])
-
-    def visit_expression_statement(self, node):
-        expression, = node.children
-        return Expression(self.dispatch(expression))
-
-    def visit_assignment_statement(self, node):
-        variable, obj = node.children[0].children[0].children
-        variable = "".join(v.additional_info for v in variable.children)
-        obj, = obj.children
-        return Assign(variable, self.dispatch(obj))
-
-    def visit_numeric_literal(self, node):
-        number = self.dispatch(node.children[-1])
-        if len(node.children) == 2:
-            sign, _ = node.children
-            if sign.additional_info.count("-") % 2:
-                return number.neg()
-        return number
-
-    def visit_integer_literal(self, node):
-        integer, = node.children
-        base = integer.symbol.split("_", 1)[0]
-
-        value = integer.additional_info
-        value = value[2:] if value.startswith("0") and value != "0" else value
-
-        return Int(int(value, BASES[base]))
-
-    def visit_string_literal(self, node):
-        string, = node.children
-        value = string.additional_info
-        end = len(value) - 1
-        assert end > 0
-        value = value[1:end]
-
-        if string.symbol == "SINGLE_QUOTED_STRING":
-            return SingleQString(value)
-        elif string.symbol == "DOUBLE_QUOTED_STRING":
-            return DoubleQString(value)
-        raise NotImplementedError
-
-    def visit_variable(self, node):
-        name = "".join(v.additional_info for v in node.children)
-        return Variable(name)
-
-    def visit_equality_expression(self, node):
-        left, op, right = node.children
-        return BinOp(
-            self.dispatch(left), op.additional_info, self.dispatch(right)
-        )
 
-    def visit_if_expression(self, node):
-        condition, then = node.children
-        body, = then.children
-        return If(self.dispatch(condition), self.dispatch(body))
-
-    def visit_unless_expression(self, node):
-        condition, then = node.children
-        body, = then.children
-        return Unless(self.dispatch(condition), self.dispatch(body))
-
-    def visit_while_expression(self, node):
-        condition, do = node.children
-        body, = do.children
-        return While(self.dispatch(condition), self.dispatch(body))
-
-    def visit_until_expression(self, node):
-        condition, do = node.children
-        body, = do.children
-        return Until(self.dispatch(condition), self.dispatch(body))
-
-    def visit_puts_statement(self, node):
-        # XXX
-        return Puts(self.dispatch(node.children[0]))
-
-    def visit_method_definition(self, node):
-        name, params_node, body = node.children
-        name, body = name.additional_info, self.dispatch(body)
-
-        if params_node.children:
-            params_list, = params_node.children
-            params = [param.additional_info for param in params_list.children]
+class Class(Node):
+    def __init__(self, name, superclass, body):
+        self.name = name
+        self.superclass = superclass
+        self.body = body
+
+    def compile(self, context):
+        if self.superclass is None:
+            context.emit(
+                compiler.LOAD_CONSTANT, context.register_constant(w_nil),
+            )
         else:
-            params = []
+            self.superclass.compile(context)
+        body_context = context.method_context()
+        self.body.compile_value(body_context)
+        body_context.emit(compiler.RETURN_VALUE)
+        # The body is compiled like a method taking no arguments, which is
+        # run once with the class as self.
+        w_body = W_Method(
+            symbols.intern(self.name), 0, body_context.create_bytecode(),
+        )
+        context.emit(
+            compiler.DEFINE_CLASS, context.register_constant(w_body),
+        )
 
-        return Method(name, params, body)
+    def fold(self):
+        superclass = self.superclass
+        if superclass is not None:
+            superclass = superclass.fold()
+        return Class(self.name, superclass, self.body.fold_value())
+
+
+def is_instance_variable(name):
+    return name[0] == "@"
+
+
+def is_constant(name):
+    return "A" <= name[0] <= "Z"
 
 
-transformer = Transformer()
+class Parser(object):
+    """
+    A recursive descent parser, using precedence climbing for expressions.
+
+    Nodes are built directly as tokens are consumed from the lexer, without
+    any intermediate parse tree.
+
+    """
 
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.current = lexer.next_token()
+
+    def error(self, message, token=None):
+        if token is None:
+            token = self.current
+        return ParseError(message, token.lineno, token.column)
+
+    def advance(self):
+        token = self.current
+        self.current = self.lexer.next_token()
+        return token
+
+    def accept(self, kind):
+        if self.current.kind == kind:
+            self.advance()
+            return True
+        return False
+
+    def expect(self, kind):
+        if self.current.kind != kind:
+            raise self.error(
+                "Expected %s but got %s" % (kind, self.current.kind)
+            )
+        return self.advance()
+
+    def skip_separators(self):
+        while self.current.kind == SEPARATOR:
+            self.advance()
+
+    def parse_program(self):
+        statements = self.parse_statements()
+        if self.current.kind != EOF:
+            raise self.error("Unexpected %s" % (self.current.kind,))
+        return statements
+
+    def parse_next_statement(self):
+        """
+        Parse the next top-level statement, or return None at the end.
+
+        The separator ending the statement is left unconsumed, so that when
+        parsing from a stream, nothing past the statement gets read before
+        it's returned.
+
+        """
+
+        self.skip_separators()
+        if self.current.kind == EOF:
+            return None
+        statement = self.parse_statement()
+        if self.current.kind != EOF and self.current.kind != SEPARATOR:
+            raise self.error("Unexpected %s" % (self.current.kind,))
+        return statement
+
+    def parse_statements(self):
+        statements = []
+        self.skip_separators()
+        while self.current.kind not in BLOCK_END:
+            statements.append(self.parse_statement())
+            if self.current.kind not in BLOCK_END:
+                self.expect(SEPARATOR)
+            self.skip_separators()
+        return Compound(statements)
+
+    def parse_statement(self):
+        token = self.current
+        if token.kind == "puts":
+            # XXX
+            self.advance()
+            return Puts(self.parse_expression()).at(token)
+        elif token.kind == "return":
+            self.advance()
+            kind = self.current.kind
+            if kind == SEPARATOR or kind in BLOCK_END:
+                expr = Constant(w_nil).at(token)
+            else:
+                expr = self.parse_expression()
+            return Return(expr).at(token)
+        elif token.kind == IDENTIFIER or token.kind == INSTANCE_VARIABLE:
+            self.advance()
+            if self.accept("="):
+                return Assign(token.value, self.parse_expression()).at(token)
+            left = self.parse_postfix(self.parse_identifier(token))
+        else:
+            left = self.parse_prefix()
+        left = self.parse_index_assignment(left)
+        return Expression(self.parse_infix(left, 0)).at(token)
+
+    def parse_index_assignment(self, left):
+        if isinstance(left, Index) and self.current.kind == "=":
+            equals = self.advance()
+            return IndexAssign(
+                left.receiver, left.index, self.parse_expression(),
+            ).at(equals)
+        return left
+
+    def parse_expression(self, precedence=0):
+        return self.parse_infix(self.parse_prefix(), precedence)
+
+    def parse_infix(self, left, precedence):
+        while True:
+            token = self.current
+            operator = token.kind
+            binding = BINARY_PRECEDENCE.get(operator, 0)
+            if binding <= precedence:
+                return left
+            self.advance()
+            self.skip_separators()
+            right = self.parse_expression(binding)
+            if operator == ".." or operator == "...":
+                left = Range(left, right, operator == "...").at(token)
+            elif operator == "<<":
+                left = Call(left, operator, [right]).at(token)
+            else:
+                left = BinOp(left, operator, right).at(token)
+
+    def parse_prefix(self):
+        token = self.advance()
+        kind = token.kind
+        if kind == "(":
+            self.skip_separators()
+            expression = self.parse_expression()
+            self.skip_separators()
+            self.expect(")")
+            return self.parse_postfix(expression)
+        elif kind == IDENTIFIER:
+            return self.parse_postfix(self.parse_identifier(token))
+        return self.parse_postfix(self.parse_prefix_node(token).at(token))
+
+    def parse_postfix(self, receiver):
+        """
+        Parse any method calls on or indexing of the receiver, like
+        ``receiver.foo(1)`` or ``receiver[1]``.
+
+        """
+
+        while True:
+            token = self.current
+            if token.kind == ".":
+                self.advance()
+                name = self.expect(IDENTIFIER).value
+                args = self.parse_args()
+                if name == "each" and not args and self.accept("do"):
+                    param, body = self.parse_block()
+                    receiver = Each(receiver, param, body).at(token)
+                else:
+                    receiver = Call(receiver, name, args).at(token)
+            elif token.kind == "[":
+                self.advance()
+                self.skip_separators()
+                index = self.parse_expression()
+                self.skip_separators()
+                self.expect("]")
+                receiver = Index(receiver, index).at(token)
+            else:
+                return receiver
+
+    def parse_identifier(self, token):
+        """
+        An identifier is a call on self if it's followed by arguments.
+
+        """
+
+        if token.kind == IDENTIFIER and self.current.kind == "(":
+            return Call(None, token.value, self.parse_args()).at(token)
+        return Variable(token.value).at(token)
+
+    def parse_block(self):
+        """
+        Parse the parameter and body of a block, after its ``do``.
+
+        """
+
+        param = None
+        if self.accept("|"):
+            param = self.expect(IDENTIFIER).value
+            self.expect("|")
+        body = self.parse_statements()
+        self.expect("end")
+        return param, body
+
+    def parse_args(self):
+        if self.accept("("):
+            return self.parse_list(")")
+        return []
+
+    def parse_list(self, end):
+        """
+        Parse comma separated expressions, up to and including ``end``.
+
+        """
+
+        items = []
+        self.skip_separators()
+        while self.current.kind != end:
+            items.append(self.parse_expression())
+            self.skip_separators()
+            if not self.accept(","):
+                break
+            self.skip_separators()
+        self.expect(end)
+        return items
+
+    def parse_prefix_node(self, token):
+        kind = token.kind
+        if kind == INTEGER:
+            return self.integer(token.value)
+        elif kind == "+" or kind == "-":
+            return self.parse_signed_integer(token)
+        elif kind == IDENTIFIER or kind == INSTANCE_VARIABLE:
+            return Variable(token.value)
+        elif kind == SINGLE_QUOTED_STRING:
+            return SingleQString(token.value)
+        elif kind == DOUBLE_QUOTED_STRING:
+            return self.parse_double_quoted_string(token)
+        elif kind == SYMBOL:
+            return Symbol(token.value[1:])
+        elif kind == "if":
+            condition, body = self.parse_conditional("then")
+            return If(condition, body)
+        elif kind == "unless":
+            condition, body = self.parse_conditional("then")
+            return Unless(condition, body)
+        elif kind == "while":
+            condition, body = self.parse_conditional("do")
+            return While(condition, body)
+        elif kind == "until":
+            condition, body = self.parse_conditional("do")
+            return Until(condition, body)
+        elif kind == "def":
+            return self.parse_method_definition()
+        elif kind == "class":
+            return self.parse_class_definition()
+        elif kind == "[":
+            return Array(self.parse_list("]"))
+        raise self.error("Unexpected %s" % (kind,), token)
+
+    def parse_signed_integer(self, sign):
+        negative = sign.kind == "-"
+        while self.current.kind == "+" or self.current.kind == "-":
+            if self.advance().kind == "-":
+                negative = not negative
+        return self.integer(self.expect(INTEGER).value, negative)
+
+    def integer(self, literal, negative=False):
+        """
+        An integer literal, which becomes a constant if it's too big for Int.
+
+        """
+
+        try:
+            value = integer_value(literal)
+        except OverflowError:
+            big = bigint_value(literal)
+            if negative:
+                big = big.neg()
+            return Constant(wrap_bigint(big))
+        if negative:
+            value = -value
+        return Int(value)
+
+    def parse_conditional(self, keyword):
+        """
+        Parse the condition and body of an ``if``, ``while``, or the like.
+
+        The condition is followed by a separator or the given keyword (or
+        both) before the body, which is terminated by an ``end``.
+
+        """
+
+        condition = self.parse_expression()
+        if not self.accept(keyword):
+            self.expect(SEPARATOR)
+            self.skip_separators()
+            self.accept(keyword)
+        body = self.parse_statements()
+        self.expect("end")
+        return condition, body
+
+    def parse_method_definition(self):
+        name = self.expect(IDENTIFIER).value
+        params = []
+        if self.accept("("):
+            if self.current.kind != ")":
+                params = self.parse_params()
+            self.expect(")")
+        elif self.current.kind == IDENTIFIER:
+            params = self.parse_params()
+        body = self.parse_statements()
+        self.expect("end")
+        return Method(name, params, body)
 
-def parse(source, transformer=transformer):
+    def parse_class_definition(self):
+        name = self.expect(IDENTIFIER)
+        if not is_constant(name.value):
+            raise self.error("Class names must be constants", name)
+        superclass = None
+        if self.accept("<"):
+            superclass = self.parse_expression()
+        body = self.parse_statements()
+        self.expect("end")
+        return Class(name.value, superclass, body)
+
+    def parse_params(self):
+        params = [self.expect(IDENTIFIER).value]
+        while self.accept(","):
+            params.append(self.expect(IDENTIFIER).value)
+        return params
+
+    def parse_double_quoted_string(self, token):
+        literal = token.value
+        bounds = interpolation_bounds(literal)
+        if not bounds:
+            return DoubleQString(literal)
+
+        texts = []
+        codes = []
+        pos = 0
+        for i in range(0, len(bounds), 2):
+            start, end = bounds[i], bounds[i + 1]
+            assert start >= 2
+            texts.append(literal[pos:start - 2])
+            codes.append(self.parse_interpolated_code(token, start, end))
+            pos = end + 1
+        texts.append(literal[pos:])
+        return Interpolation(texts, codes)
+
+    def parse_interpolated_code(self, token, start, end):
+        """
+        Parse the code interpolated between the given bounds of a literal.
+
+        The code gets its own parser, whose positions are offset to where
+        the code is in the source.
+
+        """
+
+        assert end >= start
+        lexer = Lexer(token.value[start:end])
+        lexer.lineno = token.lineno
+        lexer.line_start = -(token.column + start)
+        parser = Parser(lexer)
+        code = parser.parse_statements()
+        if parser.current.kind != EOF:
+            raise parser.error("Unexpected %s" % (parser.current.kind,))
+        return code
+
+
+def parse(source):
     """
     Parse the source code and produce an AST.
 
     """
 
-    ast = ToAST().transform(_parse(source))
-    return transformer.visit_program(ast)
+    return Parser(Lexer(source)).parse_program()
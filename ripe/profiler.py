@@ -0,0 +1,143 @@
+"""
+Count how often each instruction runs and time how long each loop takes.
+
+Profiling is only compiled in if :data:`ENABLED` is set before translating
+(``translate.py targetripe.py --profile``), and is then turned on for a
+particular run with ``./ripe-c --profile``. Otherwise every check for it is
+constant folded away.
+
+"""
+
+import time
+
+from pypy.rlib import jit
+from pypy.rlib.listsort import make_timsort_class
+
+from ripe import compiler
+
+
+ENABLED = False
+
+# How many of the hottest locations to include in a report.
+REPORT_LOCATIONS = 20
+
+
+class Entry(object):
+    def __init__(self, count, description):
+        self.count = count
+        self.description = description
+
+
+class Loop(object):
+    def __init__(self):
+        self.entered = 0.0
+        self.elapsed = 0.0
+        self.iterations = 0
+
+
+class CodeProfile(object):
+    """
+    The counts and loop timings for one piece of bytecode.
+
+    """
+
+    def __init__(self, bc):
+        self.counts = [0] * len(bc.code)
+        self.loops = {}
+        pc = 0
+        while pc < len(bc.code):
+            opcode, arg = compiler.decode_instruction(bc.code[pc])
+            if opcode == compiler.JUMP_BACKWARD:
+                self.loops[arg] = Loop()
+            pc += compiler.INSTRUCTION_SIZES[opcode]
+
+
+class Profile(object):
+    def __init__(self):
+        self.active = False
+        self.reset()
+
+    def reset(self):
+        self.opcode_counts = [0] * len(compiler.bytecodes)
+        self.codes = {}
+
+    def code_profile(self, bc):
+        code_profile = self.codes.get(bc, None)
+        if code_profile is None:
+            code_profile = self.codes[bc] = CodeProfile(bc)
+        return code_profile
+
+    @jit.dont_look_inside
+    def instruction(self, bc, pc, opcode):
+        self.opcode_counts[opcode] += 1
+        code_profile = self.code_profile(bc)
+        code_profile.counts[pc] += 1
+        loop = code_profile.loops.get(pc, None)
+        if loop is not None:
+            loop.entered = time.time()
+
+    @jit.dont_look_inside
+    def loop_iteration(self, bc, header):
+        loop = self.code_profile(bc).loops[header]
+        loop.elapsed += time.time() - loop.entered
+        loop.iterations += 1
+
+    def report(self, describe):
+        """
+        Describe the hottest opcodes, locations and loops, hottest first.
+
+        ``describe`` is called with a pc, code and bytecode to describe each
+        location.
+
+        """
+
+        opcodes = []
+        for opcode, count in enumerate(self.opcode_counts):
+            if count:
+                opcodes.append(Entry(count, compiler.bytecodes[opcode]))
+
+        locations = []
+        loops = []
+        for bc, code_profile in self.codes.iteritems():
+            for pc, count in enumerate(code_profile.counts):
+                if count:
+                    locations.append(Entry(count, describe(pc, bc.code, bc)))
+            for header, loop in code_profile.loops.iteritems():
+                if loop.iterations:
+                    loops.append(
+                        Entry(
+                            loop.iterations,
+                            "%fs  %s" % (
+                                loop.elapsed, describe(header, bc.code, bc),
+                            ),
+                        )
+                    )
+
+        lines = ["Instructions by opcode:"]
+        report_entries(lines, opcodes, len(opcodes))
+        lines.append("Hottest locations:")
+        report_entries(lines, locations, REPORT_LOCATIONS)
+        lines.append("Loops by iterations:")
+        report_entries(lines, loops, len(loops))
+        return "\n".join(lines) + "\n"
+
+
+class _HottestFirst(make_timsort_class()):
+    def lt(self, a, b):
+        return a.count > b.count
+
+
+# How wide the column of counts in a report is.
+COUNT_WIDTH = 12
+
+
+def report_entries(lines, entries, limit):
+    _HottestFirst(entries).sort()
+    for entry in entries[:limit]:
+        # RPython's string formatting doesn't take widths, so pad by hand
+        count = str(entry.count)
+        padding = " " * max(COUNT_WIDTH - len(count), 0)
+        lines.append(padding + count + "  " + entry.description)
+
+
+profile = Profile()
@@ -1,14 +1,20 @@
 from textwrap import dedent
 from unittest import TestCase
+import sys
 
+from ripe import compiler
 from ripe.parser import parse
 from ripe.compiler import compile_ast
+from ripe.objects import symbols, w_false, w_nil, w_true
 
 
 class CompilerTestMixin(object):
+
+    optimize = True
+
     def assertCompiles(self, source, expected):
         source, expected = dedent(source), dedent(expected)
-        bytecode = compile_ast(parse(source))
+        bytecode = compile_ast(parse(source), optimize=self.optimize)
         self.assertEqual(
             [line.strip() for line in expected.splitlines() if line],
             bytecode.dump().splitlines()
@@ -16,6 +22,9 @@ class CompilerTestMixin(object):
 
 
 class TestCompiler(TestCase, CompilerTestMixin):
+
+    optimize = False
+
     def test_basic(self):
         self.assertCompiles(
             "1",
@@ -63,15 +72,15 @@ class TestCompiler(TestCase, CompilerTestMixin):
     def test_while(self):
         self.assertCompiles(
             """
-            while 1
+            while b
                 a = 1
             end
             """,
             """
+            LOAD_VARIABLE 0
+            JUMP_IF_FALSE 5
             LOAD_CONSTANT 0
-            JUMP_IF_FALSE 10
-            LOAD_CONSTANT 1
-            ASSIGN 0
+            ASSIGN 1
             JUMP_BACKWARD 0
             DISCARD_TOP 0
             RETURN 0
@@ -81,15 +90,15 @@ class TestCompiler(TestCase, CompilerTestMixin):
     def test_until(self):
         self.assertCompiles(
             """
-            until 1
+            until b
                 a = 1
             end
             """,
             """
+            LOAD_VARIABLE 0
+            JUMP_IF_TRUE 5
             LOAD_CONSTANT 0
-            JUMP_IF_TRUE 10
-            LOAD_CONSTANT 1
-            ASSIGN 0
+            ASSIGN 1
             JUMP_BACKWARD 0
             DISCARD_TOP 0
             RETURN 0
@@ -105,10 +114,9 @@ class TestCompiler(TestCase, CompilerTestMixin):
             """,
             """
             LOAD_VARIABLE 0
-            JUMP_IF_FALSE 8
+            JUMP_IF_FALSE 3
             LOAD_CONSTANT 0
             DISCARD_TOP 0
-            DISCARD_TOP 0
             RETURN 0
             """
         )
@@ -122,10 +130,819 @@ class TestCompiler(TestCase, CompilerTestMixin):
             """,
             """
             LOAD_VARIABLE 0
-            JUMP_IF_TRUE 8
+            JUMP_IF_TRUE 3
+            LOAD_CONSTANT 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+
+class TestMethods(TestCase, CompilerTestMixin):
+
+    optimize = False
+
+    def test_define_and_call(self):
+        source = dedent("""
+        def foo(x)
+            x + 1
+        end
+        foo(2)
+        """)
+        self.assertCompiles(
+            source,
+            """
+            DEFINE_METHOD 0
+            DISCARD_TOP 0
+            LOAD_SELF 0
+            LOAD_CONSTANT 1
+            CALL_METHOD 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+        bytecode = compile_ast(parse(source), optimize=False)
+        w_method = bytecode.constants[0]
+        self.assertIs(w_method.w_name, symbols.intern("foo"))
+        self.assertEqual(w_method.num_params, 1)
+        self.assertEqual(
+            w_method.bytecode.dump().splitlines(),
+            ["LOAD_VARIABLE 0", "LOAD_CONSTANT 0", "BINARY_ADD 0",
+             "RETURN_VALUE 0"],
+        )
+        [call_site] = bytecode.call_sites
+        self.assertIs(call_site.w_name, symbols.intern("foo"))
+        self.assertEqual(call_site.num_args, 1)
+
+    def test_method_value_is_its_last_statement(self):
+        bytecode = compile_ast(parse("def foo\n    a = 1\nend"))
+        self.assertEqual(
+            bytecode.constants[0].bytecode.dump().splitlines(),
+            ["LOAD_CONSTANT 0", "ASSIGN 0", "LOAD_VARIABLE 0",
+             "RETURN_VALUE 0"],
+        )
+
+    def test_empty_method_returns_nil(self):
+        bytecode = compile_ast(parse("def foo\nend"))
+        w_method = bytecode.constants[0]
+        self.assertEqual(
+            w_method.bytecode.dump().splitlines(),
+            ["LOAD_CONSTANT 0", "RETURN_VALUE 0"],
+        )
+        self.assertEqual(w_method.bytecode.constants, [w_nil])
+
+    def test_call_on_receiver(self):
+        self.assertCompiles(
+            "a.foo(1, 2)",
+            """
+            LOAD_VARIABLE 0
+            LOAD_CONSTANT 0
+            LOAD_CONSTANT 1
+            CALL_METHOD 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_self(self):
+        self.assertCompiles(
+            "self",
+            """
+            LOAD_SELF 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+
+class TestClasses(TestCase, CompilerTestMixin):
+
+    optimize = False
+
+    def test_class(self):
+        source = dedent("""
+        class Foo < Bar
+            @a
+        end
+        """)
+        self.assertCompiles(
+            source,
+            """
+            LOAD_NAMED_CONSTANT 0
+            DEFINE_CLASS 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+        bytecode = compile_ast(parse(source), optimize=False)
+        self.assertEqual(bytecode.constant_names, ["Bar"])
+        w_body = bytecode.constants[0]
+        self.assertEqual(w_body.w_name.name, "Foo")
+        self.assertEqual(
+            w_body.bytecode.dump().splitlines(),
+            ["LOAD_INSTANCE_VARIABLE 0", "RETURN_VALUE 0"],
+        )
+
+    def test_instance_variables(self):
+        self.assertCompiles(
+            "@a = 1\n@b = @a\n@a",
+            """
+            LOAD_CONSTANT 0
+            STORE_INSTANCE_VARIABLE 0
+            LOAD_INSTANCE_VARIABLE 1
+            STORE_INSTANCE_VARIABLE 2
+            LOAD_INSTANCE_VARIABLE 3
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_each_access_has_its_own_site(self):
+        bytecode = compile_ast(parse("@a = 1\n@b = @a\n@a"))
+        self.assertEqual(
+            [site.w_name.name for site in bytecode.attribute_sites],
+            ["@a", "@a", "@b", "@a"],
+        )
+
+
+class TestArrays(TestCase, CompilerTestMixin):
+
+    optimize = False
+
+    def test_array(self):
+        self.assertCompiles(
+            "[1, [], a]",
+            """
+            LOAD_CONSTANT 0
+            BUILD_ARRAY 0
+            LOAD_VARIABLE 0
+            BUILD_ARRAY 3
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_index(self):
+        self.assertCompiles(
+            "a[1] = a[0]",
+            """
+            LOAD_VARIABLE 0
+            LOAD_CONSTANT 0
+            LOAD_VARIABLE 0
+            LOAD_CONSTANT 1
+            INDEX_LOAD 0
+            INDEX_STORE 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+
+class TestRanges(TestCase, CompilerTestMixin):
+
+    optimize = False
+
+    def test_range(self):
+        self.assertCompiles(
+            "1..2\n1...2",
+            """
+            LOAD_CONSTANT 0
+            LOAD_CONSTANT 1
+            BUILD_RANGE 0
+            DISCARD_TOP 0
+            LOAD_CONSTANT 0
+            LOAD_CONSTANT 1
+            BUILD_RANGE 1
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_each(self):
+        self.assertCompiles(
+            """
+            a.each do |i|
+                puts i
+            end
+            """,
+            """
+            LOAD_VARIABLE 0
+            GET_ITER 0
+            FOR_ITER 7
+            ASSIGN 1
+            LOAD_VARIABLE 1
+            PUTS 0
+            JUMP_BACKWARD 2
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+
+class TestStrings(TestCase, CompilerTestMixin):
+
+    optimize = False
+
+    def test_strings(self):
+        self.assertCompiles(
+            """
+            'foo' + "bar"
+            a << 'foo'
+            """,
+            """
+            LOAD_STRING 0
+            LOAD_STRING 1
+            BINARY_ADD 0
+            DISCARD_TOP 0
+            LOAD_VARIABLE 0
+            LOAD_STRING 0
+            CALL_METHOD 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_interpolation(self):
+        self.assertCompiles(
+            r"""
+            "a#{b}\n#{1}"
+            "#{b}"
+            """,
+            """
+            LOAD_CONSTANT 0
+            LOAD_VARIABLE 0
+            LOAD_CONSTANT 1
+            LOAD_CONSTANT 2
+            BUILD_STRING 4
+            DISCARD_TOP 0
+            LOAD_VARIABLE 0
+            BUILD_STRING 1
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_escapes(self):
+        bytecode = compile_ast(parse(r"""'\n'""" + "\n" + r'"\n"'))
+        self.assertEqual(
+            [w_string.str_w() for w_string in bytecode.constants],
+            ["\\n", "\n"],
+        )
+
+
+class TestCompareAndBranch(TestCase, CompilerTestMixin):
+
+    optimize = False
+
+    def test_while_not_equal(self):
+        self.assertCompiles(
+            """
+            while a != 1
+                b = 2
+            end
+            """,
+            """
+            LOAD_VARIABLE 0
+            LOAD_CONSTANT 0
+            JUMP_IF_EQ 6
+            LOAD_CONSTANT 1
+            ASSIGN 1
+            JUMP_BACKWARD 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_until_equal(self):
+        self.assertCompiles(
+            """
+            until a == 1
+                b = 2
+            end
+            """,
+            """
+            LOAD_VARIABLE 0
+            LOAD_CONSTANT 0
+            JUMP_IF_EQ 6
+            LOAD_CONSTANT 1
+            ASSIGN 1
+            JUMP_BACKWARD 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_if_equal(self):
+        self.assertCompiles(
+            """
+            if a == b
+                1
+            end
+            """,
+            """
+            LOAD_VARIABLE 0
+            LOAD_VARIABLE 1
+            JUMP_IF_NOT_EQ 4
+            LOAD_CONSTANT 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_unless_not_equal(self):
+        self.assertCompiles(
+            """
+            unless a != b
+                1
+            end
+            """,
+            """
+            LOAD_VARIABLE 0
+            LOAD_VARIABLE 1
+            JUMP_IF_NOT_EQ 4
+            LOAD_CONSTANT 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_other_conditions(self):
+        self.assertCompiles(
+            """
+            if a + 1
+                1
+            end
+            """,
+            """
+            LOAD_VARIABLE 0
+            LOAD_CONSTANT 0
+            BINARY_ADD 0
+            JUMP_IF_FALSE 5
             LOAD_CONSTANT 0
             DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+
+class TestConstants(TestCase, CompilerTestMixin):
+
+    optimize = False
+
+    def test_repeated_integers_are_shared(self):
+        self.assertCompiles(
+            """
+            a = 1
+            b = 2
+            c = a + 1
+            """,
+            """
+            LOAD_CONSTANT 0
+            ASSIGN 0
+            LOAD_CONSTANT 1
+            ASSIGN 1
+            LOAD_VARIABLE 0
+            LOAD_CONSTANT 0
+            BINARY_ADD 0
+            ASSIGN 2
+            RETURN 0
+            """
+        )
+
+    def test_pseudo_variables(self):
+        source = "a = true\nb = false\nc = nil\nd = true"
+        bytecode = compile_ast(parse(source))
+        self.assertEqual(bytecode.constants, [w_true, w_false, w_nil])
+
+    def test_fold_arithmetic(self):
+        bytecode = compile_ast(parse("a = 1 + 2 - 10"))
+        self.assertEqual(
+            [w_constant.value for w_constant in bytecode.constants], [-7],
+        )
+
+    def test_fold_equality(self):
+        bytecode = compile_ast(parse("a = 1 + 1 == 2\nb = 1 != 1"))
+        self.assertEqual(bytecode.constants, [w_true, w_false])
+
+    def test_does_not_fold_overflow(self):
+        source = "a = %s + 1" % (sys.maxint,)
+        self.assertIn("BINARY_ADD", compile_ast(parse(source)).dump())
+
+    def test_fold_if_true(self):
+        self.assertCompiles(
+            """
+            if 1 == 1
+                a = 2
+            end
+            """,
+            """
+            LOAD_CONSTANT 0
+            ASSIGN 0
+            RETURN 0
+            """
+        )
+
+    def test_fold_if_false(self):
+        self.assertCompiles(
+            """
+            if 1 == 2
+                a = 2
+            end
+            """,
+            """
+            RETURN 0
+            """
+        )
+
+    def test_fold_unless(self):
+        self.assertCompiles(
+            """
+            unless nil
+                a = 2
+            end
+            unless true
+                a = 3
+            end
+            """,
+            """
+            LOAD_CONSTANT 0
+            ASSIGN 0
+            RETURN 0
+            """
+        )
+
+    def test_fold_while_false(self):
+        self.assertCompiles(
+            """
+            while false
+                a = 2
+            end
+            """,
+            """
+            RETURN 0
+            """
+        )
+
+    def test_fold_while_true(self):
+        self.assertCompiles(
+            """
+            while 1
+                a = 2
+            end
+            """,
+            """
+            LOAD_CONSTANT 0
+            ASSIGN 0
+            JUMP_BACKWARD 0
             DISCARD_TOP 0
             RETURN 0
             """
         )
+
+    def test_fold_until(self):
+        self.assertCompiles(
+            """
+            until 2 == 1 + 1
+                a = 2
+            end
+            """,
+            """
+            RETURN 0
+            """
+        )
+
+
+class TestOptimizer(TestCase, CompilerTestMixin):
+    def test_load_var_load_const(self):
+        self.assertCompiles(
+            "puts a - 1",
+            """
+            LOAD_VAR_LOAD_CONST 0 0
+            BINARY_SUB 0
+            PUTS 0
+            RETURN 0
+            """
+        )
+
+    def test_increment(self):
+        self.assertCompiles(
+            """
+            n = 0
+            while n != 10
+                n = n + 1
+            end
+            """,
+            """
+            LOAD_CONSTANT 0
+            ASSIGN 0
+            LOAD_VAR_LOAD_CONST 0 1
+            JUMP_IF_EQ 8
+            INCR_VARIABLE_BY_CONST 0 2
+            JUMP_BACKWARD 2
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_increment_other_variable(self):
+        self.assertCompiles(
+            "m = n + 1",
+            """
+            LOAD_VAR_LOAD_CONST 0 0
+            BINARY_ADD 0
+            ASSIGN 1
+            RETURN 0
+            """
+        )
+
+    def test_no_fusing_across_jump_targets(self):
+        self.assertCompiles(
+            """
+            while a
+                b
+            end
+            1
+            """,
+            """
+            LOAD_VARIABLE 0
+            JUMP_IF_FALSE 5
+            LOAD_VARIABLE 1
+            DISCARD_TOP 0
+            JUMP_BACKWARD 0
+            DISCARD_TOP 0
+            LOAD_CONSTANT 0
+            DISCARD_TOP 0
+            RETURN 0
+            """
+        )
+
+    def test_unreachable_after_infinite_loop(self):
+        self.assertCompiles(
+            """
+            while true
+                a = 2
+            end
+            puts a
+            """,
+            """
+            LOAD_CONSTANT 0
+            ASSIGN 0
+            JUMP_BACKWARD 0
+            """
+        )
+
+    def test_thread_jumps(self):
+        instructions = [
+            compiler.Instruction(compiler.JUMP_IF_FALSE, 2),
+            compiler.Instruction(compiler.RETURN, 0),
+            compiler.Instruction(compiler.JUMP_BACKWARD, 3),
+            compiler.Instruction(compiler.JUMP_BACKWARD, 1),
+        ]
+        compiler.thread_jumps(instructions)
+        self.assertEqual(
+            [instruction.arg for instruction in instructions], [1, 0, 1, 1],
+        )
+
+    def test_jump_to_self(self):
+        instructions = [compiler.Instruction(compiler.JUMP_BACKWARD, 0)]
+        compiler.thread_jumps(instructions)
+        self.assertEqual(instructions[0].arg, 0)
+
+
+class TestWideArguments(TestCase):
+    def test_many_constants(self):
+        source = "".join("a%d = %d\n" % (i, i) for i in range(300))
+        bytecode = compile_ast(parse(source))
+        lines = bytecode.dump().splitlines()
+        self.assertEqual(
+            lines[-3:], ["LOAD_CONSTANT 299", "ASSIGN 299", "RETURN 0"],
+        )
+
+    def test_very_wide(self):
+        word = compiler.encode_instruction(compiler.LOAD_CONSTANT, 0x123456)
+        self.assertEqual(
+            compiler.decode_instruction(word),
+            (compiler.LOAD_CONSTANT, 0x123456),
+        )
+
+    def test_long_jump(self):
+        body = "".join("a = %d\n" % (i,) for i in range(200))
+        bytecode = compile_ast(parse("while b\n%send" % (body,)))
+        lines = bytecode.dump().splitlines()
+        self.assertEqual(
+            lines[1], "JUMP_IF_FALSE %d" % (len(bytecode.code) - 2),
+        )
+
+    def test_wide_constants_are_fused(self):
+        source = "".join("a%d = %d\n" % (i, i) for i in range(300))
+        bytecode = compile_ast(parse(source + "a0 = a0 + 299"))
+        lines = bytecode.dump().splitlines()
+        self.assertEqual(
+            lines[-2:], ["INCR_VARIABLE_BY_CONST 0 299", "RETURN 0"],
+        )
+
+
+class TestStackDepth(TestCase):
+    def assertStackDepth(self, source, depth):
+        for optimize in False, True:
+            bytecode = compile_ast(parse(dedent(source)), optimize=optimize)
+            self.assertEqual(bytecode.max_stack_depth, depth)
+
+    def test_empty(self):
+        self.assertStackDepth("", 0)
+
+    def test_interpolation(self):
+        self.assertStackDepth('puts "#{a}, #{[1, 2]}!"', 4)
+
+    def test_statements_do_not_accumulate(self):
+        self.assertStackDepth("a = 1\nb = 2\nputs a + b", 2)
+
+    def test_nested(self):
+        self.assertStackDepth("a + (b - (a + (b - (a + b))))", 6)
+
+    def test_left_associative(self):
+        self.assertStackDepth("a + b - a + b - a + b", 2)
+
+    def test_branches(self):
+        self.assertStackDepth(
+            """
+            if a == b
+                puts a + (b + (a + b))
+            end
+            while a != b
+                a = a + 1
+            end
+            """,
+            4,
+        )
+
+    def test_calls(self):
+        self.assertStackDepth("foo(1, 2)\na.bar(a + 1).baz", 3)
+
+    def test_arrays(self):
+        self.assertStackDepth("[1, 2, [3, 4]]", 4)
+        self.assertStackDepth("[1, 2, 3][a[0]] = 1", 3)
+
+    def test_each(self):
+        self.assertStackDepth("(1..2).each do |i|\n    puts i + 1\nend", 3)
+
+    def test_superinstruction(self):
+        bytecode = compile_ast(parse("a + 1"))
+        self.assertIn("LOAD_VAR_LOAD_CONST", bytecode.dump())
+        self.assertEqual(bytecode.max_stack_depth, 2)
+
+
+class TestLineTable(TestCase):
+    def lines(self, bytecode):
+        return [bytecode.line_for(pc) for pc in range(len(bytecode.code))]
+
+    def test_lines(self):
+        bytecode = compile_ast(parse("a = 1\n\nb = 2\nputs a"))
+        self.assertEqual(self.lines(bytecode), [1, 1, 3, 3, 4, 4, 4])
+
+    def test_loop(self):
+        bytecode = compile_ast(
+            parse(
+                dedent(
+                    """
+                    i = 0
+                    while i != 3
+                        i = i + 1
+                    end
+                    """
+                )
+            ),
+            optimize=False,
+        )
+        self.assertEqual(
+            self.lines(bytecode), [2, 2, 3, 3, 3, 4, 4, 4, 4, 4, 4, 4],
+        )
+
+    def test_long_lines(self):
+        expression = " + ".join(["a"] * 300)
+        source = "a = 1\n" + expression + "\n" * 500 + "puts a"
+        bytecode = compile_ast(parse(source))
+        lines = self.lines(bytecode)
+        self.assertEqual(lines[:2], [1, 1])
+        self.assertEqual(set(lines[2:-3]), set([2]))
+        self.assertEqual(lines[-3:], [502] * 3)
+
+    def test_line_table_deltas(self):
+        instructions = [
+            compiler.Instruction(compiler.LOAD_CONSTANT, 0, lineno=lineno)
+            for lineno in [1] * 600 + [300, 2, 2]
+        ]
+        lnotab = compiler.line_table(instructions)
+        self.assertEqual(
+            compiler.decode_line_table(lnotab), ([0, 600, 601], [1, 300, 2]),
+        )
+
+    def test_unknown(self):
+        bytecode = compiler.ByteCode([0], [], 0, 0)
+        self.assertEqual(bytecode.line_for(0), 0)
+
+    def test_position(self):
+        context = compiler.CompilerContext("foo.rb")
+        bytecode = compile_ast(parse("a = 1\nputs a"), context)
+        self.assertEqual(bytecode.position(3), "foo.rb:2")
+
+
+class TestSerialization(TestCase):
+    def setUp(self):
+        self.bytecode = compile_ast(parse("a = 12\nb = a + -3"))
+        self.data = compiler.dump_bytecode(self.bytecode, "hash")
+
+    def test_round_trip(self):
+        loaded = compiler.load_bytecode(self.data, "hash")
+        self.assertEqual(loaded.dump(), self.bytecode.dump())
+        self.assertEqual(loaded.num_vars, self.bytecode.num_vars)
+        self.assertEqual(
+            loaded.max_stack_depth, self.bytecode.max_stack_depth,
+        )
+        self.assertEqual(loaded.lnotab, self.bytecode.lnotab)
+        self.assertEqual(
+            [w_constant.value for w_constant in loaded.constants], [12, -3],
+        )
+
+    def test_round_trip_big_integer(self):
+        bytecode = compile_ast(parse("puts %d" % (sys.maxint * 4,)))
+        data = compiler.dump_bytecode(bytecode, "hash")
+        loaded = compiler.load_bytecode(data, "hash")
+        [w_constant] = loaded.constants
+        self.assertEqual(w_constant.inspect(), str(sys.maxint * 4))
+
+    def test_round_trip_methods(self):
+        bytecode = compile_ast(
+            parse("def foo(a, b)\n    a + b\nend\nputs foo(1, 2)"),
+        )
+        data = compiler.dump_bytecode(bytecode, "hash")
+        loaded = compiler.load_bytecode(data, "hash")
+        self.assertEqual(loaded.dump(), bytecode.dump())
+        w_method, w_loaded = bytecode.constants[0], loaded.constants[0]
+        self.assertIs(w_loaded.w_name, w_method.w_name)
+        self.assertEqual(w_loaded.num_params, 2)
+        self.assertEqual(w_loaded.bytecode.dump(), w_method.bytecode.dump())
+        [call_site] = loaded.call_sites
+        self.assertIs(call_site.w_name, w_loaded.w_name)
+        self.assertEqual(call_site.num_args, 2)
+
+    def test_round_trip_classes(self):
+        bytecode = compile_ast(parse("class Foo < Bar\n    @a = 1\nend"))
+        data = compiler.dump_bytecode(bytecode, "hash")
+        loaded = compiler.load_bytecode(data, "hash")
+        self.assertEqual(loaded.constant_names, ["Bar"])
+        w_body = loaded.constants[0]
+        self.assertEqual(
+            [site.w_name.name for site in w_body.bytecode.attribute_sites],
+            ["@a", "@a"],
+        )
+
+    def test_round_trip_strings(self):
+        bytecode = compile_ast(parse("puts 'foo\\n'"))
+        data = compiler.dump_bytecode(bytecode, "hash")
+        loaded = compiler.load_bytecode(data, "hash")
+        [w_string] = loaded.constants
+        self.assertEqual(w_string.str_w(), "foo\\n")
+
+    def test_round_trip_symbols(self):
+        bytecode = compile_ast(parse("puts :foo == :foo"))
+        data = compiler.dump_bytecode(bytecode, "hash")
+        loaded = compiler.load_bytecode(data, "hash")
+        self.assertEqual(loaded.dump(), bytecode.dump())
+        self.assertEqual(loaded.constants, [symbols.intern("foo")])
+
+    def test_stale_source(self):
+        self.assertIsNone(compiler.load_bytecode(self.data, "other"))
+
+    def test_other_version(self):
+        version = compiler.BYTECODE_VERSION
+        self.addCleanup(setattr, compiler, "BYTECODE_VERSION", version)
+        compiler.BYTECODE_VERSION += 1
+        self.assertIsNone(compiler.load_bytecode(self.data, "hash"))
+
+    def test_truncated(self):
+        self.assertIsNone(compiler.load_bytecode(self.data[:-1], "hash"))
+
+    def test_garbage(self):
+        self.assertIsNone(compiler.load_bytecode("garbage", "hash"))
+
+    def test_garbled_big_integer(self):
+        digits = str(sys.maxint * 4)
+        bytecode = compile_ast(parse("puts %s" % (digits,)))
+        data = compiler.dump_bytecode(bytecode, "hash")
+        garbled = digits[:2] + "x" + digits[3:]
+        self.assertIsNone(
+            compiler.load_bytecode(data.replace(digits, garbled), "hash"),
+        )
+
+    def test_truncated_big_integer(self):
+        digits = str(-sys.maxint * 4)
+        bytecode = compile_ast(parse("puts %s" % (digits,)))
+        data = compiler.dump_bytecode(bytecode, "hash")
+        whole, truncated = [], []
+        compiler._write_str(whole, digits)
+        compiler._write_str(truncated, digits[:1])
+        data = data.replace("".join(whole), "".join(truncated))
+        self.assertIsNone(compiler.load_bytecode(data, "hash"))
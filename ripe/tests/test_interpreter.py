@@ -1,19 +1,35 @@
 from StringIO import StringIO
 from textwrap import dedent
 from unittest import TestCase
+import os
+import shutil
 import sys
+import tempfile
 
-from ripe.interpreter import interpret
+from ripe import compiler, interpreter, objects, output
+from ripe.compiler import compile_ast
+from ripe.interpreter import interpret, interpret_file, interpret_stream
+from ripe.objects import W_BigInteger, W_Integer
+from ripe.parser import parse
 
 
-class TestInterpreter(TestCase):
+class InterpreterTestMixin(object):
+    """
+    Capture what programs print, and forget what they define afterwards.
+
+    """
+
     def setUp(self):
-        self.stdout = sys.stdout = StringIO()
-        self.addCleanup(lambda : setattr(sys, "stdout", sys.__stdout__))
+        self.stdout = StringIO()
+        output.stdout.redirect(self.stdout)
+        self.addCleanup(output.stdout.redirect, None)
+        self.addCleanup(forget_definitions)
 
     def interpret(self, source):
         return interpret(dedent(source))
 
+
+class TestInterpreter(InterpreterTestMixin, TestCase):
     def test_interpret(self):
         interpret("1 + 2")
 
@@ -32,6 +48,13 @@ class TestInterpreter(TestCase):
         """)
         self.assertEqual(self.stdout.getvalue(), "12\n")
 
+    def test_sub(self):
+        self.interpret("""
+        i = 12
+        puts 3 - i
+        """)
+        self.assertEqual(self.stdout.getvalue(), "-9\n")
+
     def test_eq(self):
         self.interpret("puts 1 == 1")
         self.assertEqual(self.stdout.getvalue(), "true\n")
@@ -49,3 +72,838 @@ class TestInterpreter(TestCase):
         end
         """)
         self.assertEqual(self.stdout.getvalue(), "0\n1\n2\n3\n")
+
+    def test_many_variables_and_constants(self):
+        source = "".join("a%d = %d\n" % (i, i * 3) for i in range(300))
+        self.interpret(source + "puts a299 + a298")
+        self.assertEqual(self.stdout.getvalue(), "1791\n")
+
+    def test_overflow(self):
+        self.interpret("puts %d + 1" % (sys.maxint,))
+        self.assertEqual(self.stdout.getvalue(), "%d\n" % (sys.maxint + 1,))
+
+    def test_negative_overflow(self):
+        self.interpret("puts 0 - %d - 2" % (sys.maxint,))
+        self.assertEqual(
+            self.stdout.getvalue(), "%d\n" % (-sys.maxint - 2,),
+        )
+
+    def test_big_literal(self):
+        self.interpret("puts 100000000000000000000000000000 - 1")
+        self.assertEqual(
+            self.stdout.getvalue(), "99999999999999999999999999999\n",
+        )
+
+    def test_big_integers_are_demoted(self):
+        frame = self.interpret("""
+        a = %d + 1
+        b = a - 1
+        puts b == a - 1
+        """ % (sys.maxint,))
+        self.assertEqual(self.stdout.getvalue(), "true\n")
+        self.assertIsInstance(frame.vars[0], W_BigInteger)
+        self.assertIsInstance(frame.vars[1], W_Integer)
+        self.assertEqual(frame.vars[1].value, sys.maxint)
+
+    def test_comparing_integers_with_other_objects(self):
+        self.interpret("""
+        big = %d + 1
+        puts [1 == nil, 1 == :a, 1 != "1", big == nil, 1 == big]
+        x = nil
+        if 1 == x
+            puts 1
+        end
+        """ % (sys.maxint,))
+        self.assertEqual(
+            self.stdout.getvalue(), "[false, false, true, false, false]\n",
+        )
+
+    def test_arithmetic_with_other_objects(self):
+        for source in "1 + nil", "1 - 'a'", "%d + 1 + nil" % (sys.maxint,):
+            with self.assertRaises(objects.RubyTypeError) as e:
+                self.interpret(source)
+            self.assertIn("can't be coerced into Integer", e.exception.message)
+
+    def test_smallest_integer_literal(self):
+        frame = self.interpret("a = -%d" % (sys.maxint + 1,))
+        self.assertIsInstance(frame.vars[0], W_Integer)
+        self.assertEqual(frame.vars[0].value, -sys.maxint - 1)
+
+    def test_printable_location(self):
+        bytecode = compile_ast(
+            parse("a = 1\nputs a"), compiler.CompilerContext("foo.rb"),
+        )
+        self.assertEqual(
+            interpreter.get_printable_location(3, bytecode.code, bytecode),
+            "foo.rb:2 PUTS 0",
+        )
+
+    def test_deeply_nested_arithmetic(self):
+        self.interpret("""
+        a = 1
+        puts a + (a + (a + (a + (a + (a - (a + (a + a)))))))
+        """)
+        self.assertEqual(self.stdout.getvalue(), "3\n")
+
+    def test_long_loop(self):
+        body = "".join("j = %d\n" % (i,) for i in range(200))
+        self.interpret("""
+        i = 0
+        while i != 3
+            %s
+            i = i + 1
+        end
+        puts i + j
+        """ % (body,))
+        self.assertEqual(self.stdout.getvalue(), "202\n")
+
+    def test_until(self):
+        self.interpret("""
+        i = 3
+        until i == 0
+            puts i
+            i = i - 1
+        end
+        """)
+        self.assertEqual(self.stdout.getvalue(), "3\n2\n1\n")
+
+    def test_if(self):
+        self.interpret("""
+        i = 3
+        if i == 3
+            puts 1
+        end
+        if i != 3
+            puts 2
+        end
+        """)
+        self.assertEqual(self.stdout.getvalue(), "1\n")
+
+    def test_unless(self):
+        self.interpret("""
+        i = nil
+        unless i
+            puts 1
+        end
+        unless 3
+            puts 2
+        end
+        """)
+        self.assertEqual(self.stdout.getvalue(), "1\n")
+
+    def test_conditional_values(self):
+        self.interpret("""
+        i = 3
+        a = if i == 3
+            i + 2
+        end
+        b = if i != 3
+            1
+        end
+        c = unless i == 3
+            1
+        end
+        d = unless i == 4
+            2
+        end
+        puts [a, b, c, d]
+        """)
+        self.assertEqual(self.stdout.getvalue(), "[5, nil, nil, 2]\n")
+
+
+BUILTIN_CONSTANTS = dict(objects.constants.values)
+
+
+def forget_definitions():
+    """
+    Forget the methods, classes and variables programs have defined.
+
+    """
+
+    objects.w_object_class.methods.clear()
+    objects.w_object_class.changed()
+    objects.constants.values.clear()
+    objects.constants.values.update(BUILTIN_CONSTANTS)
+    objects.constants.version = objects.VersionTag()
+    objects.w_main.map = objects.w_object_class.instance_map
+    objects.w_main.storage = []
+
+
+class TestMethods(InterpreterTestMixin, TestCase):
+    def test_call(self):
+        self.interpret("""
+        def add(a, b)
+            a + b
+        end
+        puts add(1, 2)
+        puts add(add(1, 2), 3)
+        """)
+        self.assertEqual(self.stdout.getvalue(), "3\n6\n")
+
+    def test_call_on_receiver(self):
+        self.interpret("""
+        def plus(n)
+            self + n
+        end
+        puts 2.plus(3)
+        puts (2 + 3).plus(1).plus(1)
+        """)
+        self.assertEqual(self.stdout.getvalue(), "5\n7\n")
+
+    def test_value_of_last_statement(self):
+        self.interpret("""
+        def assigns
+            a = 12
+        end
+        def expression(n)
+            n + 1
+            n + 2
+        end
+        def nothing
+        end
+        puts assigns()
+        puts expression(1)
+        puts nothing()
+        """)
+        self.assertEqual(self.stdout.getvalue(), "12\n3\n\n")
+
+    def test_return(self):
+        self.interpret("""
+        def count_to(n)
+            i = 0
+            while true
+                if i == n
+                    return i
+                end
+                i = i + 1
+            end
+        end
+        puts count_to(5)
+        """)
+        self.assertEqual(self.stdout.getvalue(), "5\n")
+
+    def test_recursion(self):
+        self.interpret("""
+        def sum_to(n)
+            if n == 0
+                return 0
+            end
+            n + sum_to(n - 1)
+        end
+        puts sum_to(100)
+        """)
+        self.assertEqual(self.stdout.getvalue(), "5050\n")
+
+    def test_value_of_conditional(self):
+        self.interpret("""
+        def f(a)
+            if a == 1
+                5
+            end
+        end
+        puts [f(1), f(2)]
+        """)
+        self.assertEqual(self.stdout.getvalue(), "[5, nil]\n")
+
+    def test_methods_have_their_own_variables(self):
+        self.interpret("""
+        a = 1
+        def foo(a)
+            b = a + 1
+        end
+        puts foo(10)
+        puts a
+        """)
+        self.assertEqual(self.stdout.getvalue(), "11\n1\n")
+
+    def test_inline_cache(self):
+        bytecode = compile_ast(parse(dedent("""
+        def foo
+            1
+        end
+        i = 0
+        while i != 3
+            1.foo
+            nil.foo
+            i = i + 1
+        end
+        """)))
+        interpreter.run(bytecode)
+        call_site, other = bytecode.call_sites
+        self.assertEqual(call_site.classes, [objects.w_integer_class])
+        self.assertEqual(other.classes, [objects.w_nil_class])
+        self.assertEqual(call_site.methods, [bytecode.constants[0]])
+
+    def test_redefinition_invalidates_cache(self):
+        self.interpret("""
+        def foo
+            1
+        end
+        i = 0
+        while i != 2
+            puts foo()
+            def foo
+                2
+            end
+            i = i + 1
+        end
+        """)
+        self.assertEqual(self.stdout.getvalue(), "1\n2\n")
+
+    def test_polymorphic_call_site(self):
+        call_site = compiler.CallSite(objects.symbols.intern("foo"), 0)
+        for i in range(compiler.INLINE_CACHE_SIZE + 1):
+            call_site.lookup(objects.W_Class("C%d" % (i,), None))
+        self.assertEqual(
+            len(call_site.classes), compiler.INLINE_CACHE_SIZE,
+        )
+
+    def test_no_method(self):
+        with self.assertRaises(objects.NoMethodError) as e:
+            self.interpret("puts 1\n1.missing")
+        self.assertEqual(
+            str(e.exception),
+            "undefined method 'missing' for an instance of Integer "
+            "at <string>:2",
+        )
+
+    def test_wrong_number_of_arguments(self):
+        with self.assertRaises(objects.ArgumentError) as e:
+            self.interpret("""
+            def foo(a)
+                a
+            end
+            foo(1, 2)
+            """)
+        self.assertEqual(
+            str(e.exception),
+            "wrong number of arguments (given 2, expected 1) at <string>:5",
+        )
+
+
+class TestClasses(InterpreterTestMixin, TestCase):
+    def test_new(self):
+        self.interpret("""
+        class Foo
+        end
+        puts Foo.new
+        puts Foo
+        """)
+        self.assertEqual(self.stdout.getvalue(), "#<Foo>\nFoo\n")
+
+    def test_instance_variables(self):
+        self.interpret("""
+        class Point
+            def initialize(x, y)
+                @x = x
+                @y = y
+            end
+
+            def x
+                @x
+            end
+
+            def sum
+                @x + @y
+            end
+
+            def z
+                @z
+            end
+        end
+        point = Point.new(1, 2)
+        puts point.x
+        puts point.sum
+        puts point.z
+        """)
+        self.assertEqual(self.stdout.getvalue(), "1\n3\n\n")
+
+    def test_inheritance(self):
+        self.interpret("""
+        class Animal
+            def legs
+                4
+            end
+            def describe
+                legs()
+            end
+        end
+        class Bird < Animal
+            def legs
+                2
+            end
+        end
+        puts Animal.new.describe
+        puts Bird.new.describe
+        """)
+        self.assertEqual(self.stdout.getvalue(), "4\n2\n")
+
+    def test_reopen(self):
+        self.interpret("""
+        class Foo
+            def a
+                1
+            end
+        end
+        foo = Foo.new
+        class Foo
+            def b
+                2
+            end
+        end
+        puts foo.a + foo.b
+        """)
+        self.assertEqual(self.stdout.getvalue(), "3\n")
+
+    def test_body_value(self):
+        self.interpret("""
+        puts class Foo
+            12
+        end
+        """)
+        self.assertEqual(self.stdout.getvalue(), "12\n")
+
+    def test_top_level_instance_variables(self):
+        self.interpret("""
+        @a = 1
+        puts @a
+        puts @b
+        """)
+        self.assertEqual(self.stdout.getvalue(), "1\n\n")
+
+    def test_attribute_sites(self):
+        bytecode = compile_ast(parse(dedent("""
+        class Foo
+            def initialize
+                @a = 1
+                @b = 2
+            end
+            def b
+                @b
+            end
+        end
+        Foo.new.b
+        Foo.new.b
+        """)))
+        interpreter.run(bytecode)
+        w_class = objects.constants.lookup("Foo")
+        w_method = w_class.lookup(objects.symbols.intern("b"))
+        [site] = w_method.bytecode.attribute_sites
+        self.assertIsNot(site.map, w_class.instance_map)
+        self.assertEqual(site.index, 1)
+
+    def test_uninitialized_constant(self):
+        with self.assertRaises(objects.RubyNameError) as e:
+            self.interpret("Foo.new")
+        self.assertEqual(
+            e.exception.nice_error_message(),
+            "NameError: uninitialized constant Foo at <string>:1",
+        )
+
+    def test_superclass_mismatch(self):
+        with self.assertRaises(objects.RubyTypeError) as e:
+            self.interpret("""
+            class Foo
+            end
+            class Bar
+            end
+            class Foo < Bar
+            end
+            """)
+        self.assertEqual(
+            str(e.exception),
+            "superclass mismatch for class Foo at <string>:6",
+        )
+
+    def test_initialize_arguments(self):
+        with self.assertRaises(objects.ArgumentError):
+            self.interpret("""
+            class Foo
+            end
+            Foo.new(1)
+            """)
+
+    def test_frozen(self):
+        with self.assertRaises(objects.FrozenError):
+            self.interpret("""
+            def set
+                @a = 1
+            end
+            1.set
+            """)
+
+
+class TestArrays(InterpreterTestMixin, TestCase):
+    def test_array(self):
+        self.interpret("""
+        a = [1, nil, [2]]
+        puts a
+        puts a[2][0]
+        puts a[3]
+        """)
+        self.assertEqual(self.stdout.getvalue(), "[1, nil, [2]]\n2\n\n")
+
+    def test_index_assign(self):
+        self.interpret("""
+        a = [1, 2]
+        a[0] = a[1] + 1
+        puts a
+        a[3] = true
+        puts a
+        """)
+        self.assertEqual(
+            self.stdout.getvalue(), "[3, 2]\n[3, 2, nil, true]\n",
+        )
+
+    def test_methods(self):
+        self.interpret("""
+        a = [1, 2]
+        b = a.dup
+        b[0] = 3
+        puts a
+        puts [nil].concat(b)
+        puts a.length + b.size
+        """)
+        self.assertEqual(
+            self.stdout.getvalue(), "[1, 2]\n[nil, 3, 2]\n4\n",
+        )
+
+    def test_integers_stay_unboxed(self):
+        frame = self.interpret("""
+        a = [1, 2].dup
+        a[1] = a[0] + 5
+        a.concat([3])
+        """)
+        [w_array] = frame.vars
+        self.assertIs(w_array.strategy, objects.integer_strategy)
+        self.assertEqual(w_array.storage, [1, 6, 3])
+
+    def test_not_an_array(self):
+        with self.assertRaises(objects.NoMethodError):
+            self.interpret("1[0]")
+        with self.assertRaises(objects.RubyTypeError):
+            self.interpret("[1][nil]")
+        with self.assertRaises(objects.RubyTypeError):
+            self.interpret("[1].concat(2)")
+
+    def test_primitive_arguments(self):
+        with self.assertRaises(objects.ArgumentError):
+            self.interpret("[1].dup(2)")
+
+
+class TestRanges(InterpreterTestMixin, TestCase):
+    def test_to_a(self):
+        self.interpret("""
+        n = 3
+        puts (1..n).to_a
+        puts (1...n).to_a
+        puts [nil].concat((1..n).to_a)
+        puts (1..n).size
+        """)
+        self.assertEqual(
+            self.stdout.getvalue(),
+            "[1, 2, 3]\n[1, 2]\n[nil, 1, 2, 3]\n3\n",
+        )
+
+    def test_each(self):
+        self.interpret("""
+        total = 0
+        (1..100).each do |i|
+            total = total + i
+        end
+        puts total
+        """)
+        self.assertEqual(self.stdout.getvalue(), "5050\n")
+
+    def test_nested_each(self):
+        self.interpret("""
+        (1..2).each do |i|
+            [10, 20].each do |j|
+                puts i + j
+            end
+        end
+        """)
+        self.assertEqual(self.stdout.getvalue(), "11\n21\n12\n22\n")
+
+    def test_each_in_method(self):
+        self.interpret("""
+        def sum(items)
+            total = 0
+            items.each do |item|
+                total = total + item
+            end
+            total
+        end
+        puts sum(1...4)
+        puts sum([4, 5])
+        """)
+        self.assertEqual(self.stdout.getvalue(), "6\n9\n")
+
+    def test_bad_range(self):
+        with self.assertRaises(objects.RubyTypeError):
+            self.interpret("1..nil")
+
+    def test_each_on_non_iterable(self):
+        with self.assertRaises(objects.NoMethodError):
+            self.interpret("1.each do\nend")
+
+
+class TestStrings(InterpreterTestMixin, TestCase):
+    def test_puts(self):
+        self.interpret("""
+        puts "foo"
+        puts ['foo', 1]
+        """)
+        self.assertEqual(self.stdout.getvalue(), 'foo\n["foo", 1]\n')
+
+    def test_concatenate(self):
+        self.interpret("""
+        s = "a"
+        (1..3).each do |i|
+            s = s + "b"
+        end
+        puts s
+        puts s.length
+        """)
+        self.assertEqual(self.stdout.getvalue(), "abbb\n4\n")
+
+    def test_append(self):
+        self.interpret("""
+        s = "a"
+        s << "b" << "c"
+        puts s
+        """)
+        self.assertEqual(self.stdout.getvalue(), "abc\n")
+
+    def test_literals_are_fresh_each_time(self):
+        self.interpret("""
+        def greeting
+            "hi"
+        end
+        g = greeting()
+        g << "!"
+        puts greeting()
+        puts g
+        """)
+        self.assertEqual(self.stdout.getvalue(), "hi\nhi!\n")
+
+    def test_dup(self):
+        self.interpret("""
+        a = "foo"
+        b = a.dup
+        b << "bar"
+        puts a
+        puts b
+        """)
+        self.assertEqual(self.stdout.getvalue(), "foo\nfoobar\n")
+
+    def test_equality(self):
+        self.interpret("""
+        puts "a" == "a"
+        puts "a" != "a" + ""
+        puts "1" == 1
+        """)
+        self.assertEqual(self.stdout.getvalue(), "true\nfalse\nfalse\n")
+
+    def test_add_non_string(self):
+        with self.assertRaises(objects.RubyTypeError):
+            self.interpret('"a" + 1')
+
+    def test_interpolation(self):
+        self.interpret("""
+        a = 1
+        s = "x"
+        puts "#{a} + #{a} = #{a + a}, #{s + "y"}, #{[s, nil]}."
+        """)
+        self.assertEqual(
+            self.stdout.getvalue(), '1 + 1 = 2, xy, ["x", nil].\n',
+        )
+
+    def test_interpolating_nil(self):
+        self.interpret("""
+        x = nil
+        puts "a#{x}b"
+        puts "a#{nil}b"
+        """)
+        self.assertEqual(self.stdout.getvalue(), "ab\nab\n")
+
+    def test_interpolated_strings_are_new(self):
+        self.interpret("""
+        s = "a"
+        t = "#{s}"
+        t << "b"
+        puts s
+        puts t
+        """)
+        self.assertEqual(self.stdout.getvalue(), "a\nab\n")
+
+
+class TestSymbols(InterpreterTestMixin, TestCase):
+    def test_symbols(self):
+        self.interpret("""
+        a = :foo
+        puts a
+        puts [a, :bar]
+        puts "#{a}!"
+        """)
+        self.assertEqual(self.stdout.getvalue(), "foo\n[:foo, :bar]\nfoo!\n")
+
+    def test_equality(self):
+        self.interpret("""
+        a = :foo
+        puts a == :foo
+        puts a == :bar
+        puts a != :foo
+        puts a == "foo"
+        """)
+        self.assertEqual(
+            self.stdout.getvalue(), "true\nfalse\nfalse\nfalse\n",
+        )
+
+
+class TestAllocations(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, objects, "COUNT_ALLOCATIONS", False)
+        objects.COUNT_ALLOCATIONS = True
+
+    def allocations(self, source):
+        bytecode = compile_ast(parse(dedent(source)))
+        objects.allocations.reset()
+        interpreter.run(bytecode)
+        return objects.allocations
+
+    def test_small_integers_are_cached(self):
+        allocations = self.allocations("""
+        n = 0
+        while n != 200
+            n = n + 1
+        end
+        """)
+        self.assertEqual(allocations.integers, 0)
+
+    def test_larger_integers_are_not(self):
+        allocations = self.allocations("""
+        n = 0
+        while n != 300
+            n = n + 1
+        end
+        """)
+        self.assertEqual(allocations.integers, 300 - 255)
+
+    def test_comparisons_do_not_allocate(self):
+        allocations = self.allocations("""
+        a = 1000
+        b = a == a
+        if a != a
+            b = 1000
+        end
+        while a == 0
+        end
+        """)
+        self.assertEqual(allocations.integers, 0)
+
+    def test_big_integers(self):
+        allocations = self.allocations("a = %d + 1" % (sys.maxint,))
+        self.assertEqual(allocations.big_integers, 1)
+
+
+class TestStreaming(InterpreterTestMixin, TestCase):
+    def test_shares_variables_between_statements(self):
+        interpret_stream(StringIO(dedent("""
+        i = 0
+        while i != 3
+            i = i + 1
+        end
+        puts i + 2
+        """)))
+        self.assertEqual(self.stdout.getvalue(), "5\n")
+
+    def test_runs_statements_as_they_are_read(self):
+        stdout = self.stdout
+
+        class Stream(object):
+            lines = ["puts 1\n", "puts 2\n"]
+            seen = []
+
+            def readline(self):
+                self.seen.append(stdout.getvalue())
+                return self.lines.pop(0) if self.lines else ""
+
+        interpret_stream(Stream())
+        self.assertEqual(Stream.seen, ["", "1\n", "1\n2\n"])
+        self.assertEqual(self.stdout.getvalue(), "1\n2\n")
+
+    def test_frame_grows_with_the_variables(self):
+        source = "".join("v%d = %d\n" % (i, i) for i in range(100))
+        frame = interpret_stream(StringIO(source + "puts v0 + v99"))
+        self.assertEqual(self.stdout.getvalue(), "99\n")
+        self.assertEqual(
+            [w_var.value for w_var in frame.vars[:100]], range(100),
+        )
+        self.assertLess(len(frame.vars), 200)
+
+    def test_empty(self):
+        interpret_stream(StringIO(""))
+        self.assertEqual(self.stdout.getvalue(), "")
+
+
+class TestBytecodeCache(InterpreterTestMixin, TestCase):
+    def setUp(self):
+        InterpreterTestMixin.setUp(self)
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, "script.rb")
+        self.write("puts 1 + 2")
+
+    def write(self, source):
+        with open(self.path, "w") as script:
+            script.write(source)
+
+    def test_cache_path(self):
+        self.assertEqual(
+            interpreter.cache_path_for("foo/bar.rb"), "foo/bar.ripec",
+        )
+        self.assertEqual(
+            interpreter.cache_path_for("foo/bar"), "foo/bar.ripec",
+        )
+        self.assertEqual(
+            interpreter.cache_path_for("foo.d/bar"), "foo.d/bar.ripec",
+        )
+
+    def test_writes_cache(self):
+        interpret_file(self.path)
+        cache = os.path.join(self.tempdir, "script.ripec")
+        self.assertTrue(os.path.exists(cache))
+        self.assertEqual(self.stdout.getvalue(), "3\n")
+
+    def test_uses_cache(self):
+        interpret_file(self.path)
+
+        def parse(source):
+            self.fail("Parsed even though the cache was fresh.")
+        interpreter.parse, original = parse, interpreter.parse
+        self.addCleanup(setattr, interpreter, "parse", original)
+
+        interpret_file(self.path)
+        self.assertEqual(self.stdout.getvalue(), "3\n3\n")
+
+    def test_source_named_like_a_cache(self):
+        self.path = os.path.join(self.tempdir, "script.ripec")
+        self.write("puts 1 + 2")
+        interpret_file(self.path)
+        interpret_file(self.path)
+        with open(self.path) as script:
+            self.assertEqual(script.read(), "puts 1 + 2")
+        self.assertEqual(self.stdout.getvalue(), "3\n3\n")
+
+    def test_stale_cache(self):
+        interpret_file(self.path)
+        self.write("puts 4")
+        interpret_file(self.path)
+        self.assertEqual(self.stdout.getvalue(), "3\n4\n")
+
+    def test_positions(self):
+        self.write("\nputs 1 + 2")
+        for _ in range(2):
+            bytecode = interpreter.compile_file(self.path, "\nputs 1 + 2")
+            self.assertEqual(bytecode.position(0), self.path + ":2")
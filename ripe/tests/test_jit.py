@@ -21,3 +21,105 @@ class TestJit(TestCase, LLJitMixin):
             interpret(codes[i])
 
         self.meta_interp(main, [1], listops=True)
+        self.check_trace_count(1)
+        self.check_simple_loop(
+            int_add_ovf=1, guard_no_overflow=1, int_eq=1, guard_false=1,
+            jump=1,
+        )
+
+    def test_method_call(self):
+        code = dedent("""
+        def incr(n)
+            n + 1
+        end
+        n = 0
+        while n != 10 do
+            n = incr(n)
+        end
+        """)
+
+        def main():
+            interpret(code)
+
+        self.meta_interp(main, [], listops=True)
+        self.check_trace_count(1)
+        # The method is found by promoting the receiver's class, so no
+        # lookup is left in the loop.
+        self.check_resops(call=0)
+
+    def test_instance_variables(self):
+        code = dedent("""
+        class Counter
+            def initialize
+                @n = 0
+            end
+
+            def count_to(limit)
+                while @n != limit do
+                    @n = @n + 1
+                end
+            end
+        end
+        Counter.new.count_to(10)
+        """)
+
+        def main():
+            interpret(code)
+
+        self.meta_interp(main, [], listops=True)
+        self.check_trace_count(1)
+        # The counter's map is promoted, so finding where @n is stored is
+        # constant folded.
+        self.check_resops(call=0)
+
+    def test_integer_array(self):
+        code = dedent("""
+        a = [0, 0]
+        while a[0] != 10 do
+            a[0] = a[0] + a[1] + 1
+        end
+        """)
+
+        def main():
+            interpret(code)
+
+        self.meta_interp(main, [], listops=True)
+        self.check_trace_count(1)
+        # Items are read and written unboxed, without any calls.
+        self.check_resops(call=0, new_with_vtable=0)
+
+    def test_symbol_comparison(self):
+        code = dedent("""
+        kind = :int
+        total = 0
+        (1..100).each do |i|
+            if kind == :int then
+                total = total + i
+            end
+        end
+        """)
+
+        def main():
+            interpret(code)
+
+        self.meta_interp(main, [], listops=True)
+        self.check_trace_count(1)
+        # Comparing symbols is just comparing pointers, without any calls.
+        self.check_resops(call=0, new_with_vtable=0)
+
+    def test_range_each(self):
+        code = dedent("""
+        total = 0
+        (1..100).each do |i|
+            total = total + i
+        end
+        """)
+
+        def main():
+            interpret(code)
+
+        self.meta_interp(main, [], listops=True)
+        self.check_trace_count(1)
+        # Each iterator is replaced by the next, so none of them survive and
+        # the loop is just a counter.
+        self.check_resops(call=0, new_with_vtable=0)
@@ -0,0 +1,120 @@
+from textwrap import dedent
+from unittest import TestCase
+
+from ripe.jitstats import JitStats, UNKNOWN_LOCATION, parse_log
+
+
+LOG = dedent("""\
+[1a2b] {jit-log-opt-loop
+# Loop 0 (t.rb:2 LOAD_VAR_LOAD_CONST 0) : loop with 12 ops
+[p0, i1]
++10: i3 = int_eq(i1, 10)
+guard_false(i3, descr=<Guard3>) [p0, i1]
++20: i4 = int_add_ovf(i1, 1)
+guard_no_overflow(, descr=<Guard4>) [p0, i1]
+jump(p0, i4, descr=<Loop0>)
+[1a3c] jit-log-opt-loop}
+[1a4d] {jit-log-opt-bridge
+# bridge out of Guard 4 with 3 ops
+[p0, i1]
+guard_true(i1, descr=<Guard7>) [p0]
+jump(p0, i1, descr=<Loop0>)
+[1a5e] jit-log-opt-bridge}
+[1a6f] {jit-log-opt-bridge
+# bridge out of Guard 7 with 1 ops
+[1a7f] jit-log-opt-bridge}
+[1a8f] {jit-log-opt-bridge
+# bridge out of Guard 99 with 1 ops
+[1a9f] jit-log-opt-bridge}
+[1b00] {jit-summary
+Tracing:      \t1\t0.001
+abort: trace too long:\t2
+abort: compiling:\t0
+abort: vable escape:\t1
+Total # of loops:\t1
+[1b11] jit-summary}
+[1b22] {jit-backend-counts
+entry 0:1
+TargetToken(140234):10
+bridge 4:3
+bridge 7:2
+bridge 99:5
+bridge 8:0
+entry 5:4
+[1b33] jit-backend-counts}
+""")
+
+
+class TestJitStats(TestCase):
+    def test_report(self):
+        stats = JitStats()
+        stats.loop_compiled("a.rb:1")
+        stats.loop_compiled("a.rb:3")
+        stats.loop_compiled("a.rb:3")
+        stats.bridge_compiled("a.rb:3")
+        stats.aborted("trace too long", "a.rb:5")
+        self.assertEqual(
+            stats.report().splitlines(),
+            [
+                "Loops compiled: 3",
+                "Bridges compiled: 1",
+                "Traces aborted: 1",
+                "           1  trace too long",
+                "Loops by location:",
+                "           2  a.rb:3",
+                "           1  a.rb:1",
+                "Bridges (guards failing often) by location:",
+                "           1  a.rb:3",
+                "Aborted traces by location:",
+                "           1  a.rb:5",
+            ],
+        )
+
+    def test_report_entries(self):
+        stats = JitStats()
+        stats.loop_compiled("a.rb:1")
+        stats.loop_entered("a.rb:1", 3)
+        stats.bridge_entered("a.rb:1", 2)
+        self.assertEqual(
+            stats.report().splitlines()[-4:],
+            [
+                "Loop entries by location:",
+                "           3  a.rb:1",
+                "Bridge entries by location:",
+                "           2  a.rb:1",
+            ],
+        )
+
+
+class TestParseLog(TestCase):
+    def setUp(self):
+        self.stats = parse_log(LOG.splitlines(True))
+
+    def test_loops(self):
+        self.assertEqual(
+            self.stats.loops, {"t.rb:2 LOAD_VAR_LOAD_CONST 0" : 1},
+        )
+
+    def test_bridges(self):
+        self.assertEqual(
+            self.stats.bridges,
+            {"t.rb:2 LOAD_VAR_LOAD_CONST 0" : 2, UNKNOWN_LOCATION : 1},
+        )
+
+    def test_aborts(self):
+        self.assertEqual(
+            self.stats.aborts, {"trace too long" : 2, "vable escape" : 1},
+        )
+        self.assertEqual(self.stats.abort_locations, {UNKNOWN_LOCATION : 3})
+
+    def test_loop_entries(self):
+        self.assertEqual(
+            self.stats.loop_entries,
+            {"t.rb:2 LOAD_VAR_LOAD_CONST 0" : 1, UNKNOWN_LOCATION : 4},
+        )
+
+    def test_bridge_entries(self):
+        self.assertEqual(
+            self.stats.bridge_entries,
+            {"t.rb:2 LOAD_VAR_LOAD_CONST 0" : 5, UNKNOWN_LOCATION : 5},
+        )
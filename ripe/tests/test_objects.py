@@ -0,0 +1,319 @@
+from unittest import TestCase
+
+from ripe import compiler
+from ripe import objects
+from ripe.objects import (
+    FrozenError,
+    RubyIndexError,
+    W_Class,
+    W_Instance,
+    W_Range,
+    W_String,
+    build_string,
+    symbols,
+    w_integer_class,
+    w_nil,
+    w_object_class,
+    w_true,
+    wrap_array,
+    wrap_int,
+    wrap_string,
+)
+
+
+w_a, w_b = symbols.intern("@a"), symbols.intern("@b")
+
+
+class TestMaps(TestCase):
+    def setUp(self):
+        self.w_class = W_Class("Foo", w_object_class)
+
+    def test_instance_variables(self):
+        w_instance = W_Instance(self.w_class)
+        self.assertIs(w_instance.getivar(w_a), w_nil)
+        w_instance.setivar(w_a, wrap_int(1))
+        w_instance.setivar(w_b, wrap_int(2))
+        w_instance.setivar(w_a, wrap_int(3))
+        self.assertEqual(w_instance.getivar(w_a).value, 3)
+        self.assertEqual(w_instance.getivar(w_b).value, 2)
+        self.assertEqual(len(w_instance.storage), 2)
+
+    def test_same_variables_share_a_map(self):
+        w_first, w_second = W_Instance(self.w_class), W_Instance(self.w_class)
+        for w_instance in w_first, w_second:
+            w_instance.setivar(w_a, wrap_int(1))
+            w_instance.setivar(w_b, wrap_int(2))
+        self.assertIs(w_first.map, w_second.map)
+        self.assertEqual(w_first.map.find(w_b), 1)
+
+    def test_different_order_different_maps(self):
+        w_first, w_second = W_Instance(self.w_class), W_Instance(self.w_class)
+        w_first.setivar(w_a, wrap_int(1))
+        w_first.setivar(w_b, wrap_int(2))
+        w_second.setivar(w_b, wrap_int(2))
+        w_second.setivar(w_a, wrap_int(1))
+        self.assertIsNot(w_first.map, w_second.map)
+
+    def test_maps_know_their_class(self):
+        w_instance = W_Instance(self.w_class)
+        w_instance.setivar(w_a, wrap_int(1))
+        self.assertIs(w_instance.getclass(), self.w_class)
+        other = W_Instance(W_Class("Bar", w_object_class))
+        other.setivar(w_a, wrap_int(1))
+        self.assertIsNot(other.map, w_instance.map)
+
+    def test_other_objects_have_no_variables(self):
+        w_integer = wrap_int(1)
+        self.assertIs(w_integer.getivar(w_a), w_nil)
+        with self.assertRaises(FrozenError):
+            w_integer.setivar(w_a, w_nil)
+        self.assertIs(w_integer.getclass(), w_integer_class)
+
+
+class TestAttributeSite(TestCase):
+    def setUp(self):
+        self.w_class = W_Class("Foo", w_object_class)
+
+    def test_load_and_store(self):
+        load = compiler.AttributeSite(w_a)
+        store = compiler.AttributeSite(w_a)
+        w_instance = W_Instance(self.w_class)
+        self.assertIs(load.load(w_instance), w_nil)
+        store.store(w_instance, wrap_int(1))
+        self.assertEqual(load.load(w_instance).value, 1)
+        self.assertIs(load.map, w_instance.map)
+        self.assertEqual(load.index, 0)
+
+    def test_store_transitions_like_setivar(self):
+        site = compiler.AttributeSite(w_b)
+        w_first, w_second = W_Instance(self.w_class), W_Instance(self.w_class)
+        w_first.setivar(w_a, wrap_int(1))
+        w_first.setivar(w_b, wrap_int(2))
+        w_second.setivar(w_a, wrap_int(1))
+        site.store(w_second, wrap_int(2))
+        self.assertIs(w_second.map, w_first.map)
+        site.store(w_second, wrap_int(3))
+        self.assertEqual(w_second.getivar(w_b).value, 3)
+        self.assertEqual(len(w_second.storage), 2)
+
+
+def ints(*values):
+    return wrap_array([wrap_int(value) for value in values])
+
+
+def inspected(w_array):
+    return [w_item.inspect() for w_item in w_array.strategy.items(w_array)]
+
+
+class TestArrayStrategies(TestCase):
+    def test_integers_are_unboxed(self):
+        w_array = ints(1, 2, 3)
+        self.assertIs(w_array.strategy, objects.integer_strategy)
+        self.assertEqual(w_array.storage, [1, 2, 3])
+        self.assertEqual(w_array.getitem(1).value, 2)
+
+    def test_empty_arrays_store_integers(self):
+        self.assertIs(wrap_array([]).strategy, objects.integer_strategy)
+
+    def test_anything_else_is_stored_as_objects(self):
+        w_array = wrap_array([wrap_int(1), w_nil])
+        self.assertIs(w_array.strategy, objects.object_strategy)
+        self.assertEqual(inspected(w_array), ["1", "nil"])
+
+    def test_storing_integers_stays_unboxed(self):
+        w_array = ints(1, 2)
+        w_array.setitem(0, wrap_int(3))
+        w_array.append(wrap_int(4))
+        self.assertIs(w_array.strategy, objects.integer_strategy)
+        self.assertEqual(w_array.storage, [3, 2, 4])
+
+    def test_storing_anything_else_switches(self):
+        w_array = ints(1, 2)
+        w_array.setitem(1, w_true)
+        self.assertIs(w_array.strategy, objects.object_strategy)
+        self.assertEqual(inspected(w_array), ["1", "true"])
+
+    def test_index_out_of_range(self):
+        w_array = ints(1, 2)
+        self.assertEqual(w_array.getitem(-1).value, 2)
+        self.assertIs(w_array.getitem(2), w_nil)
+        self.assertIs(w_array.getitem(-3), w_nil)
+        with self.assertRaises(RubyIndexError):
+            w_array.setitem(-3, wrap_int(0))
+
+    def test_storing_past_the_end_pads_with_nil(self):
+        w_array = ints(1)
+        w_array.setitem(2, wrap_int(3))
+        self.assertEqual(inspected(w_array), ["1", "nil", "3"])
+
+    def test_dup(self):
+        w_array = ints(1, 2)
+        w_copy = w_array.dup()
+        w_copy.setitem(0, wrap_int(5))
+        self.assertIs(w_copy.strategy, objects.integer_strategy)
+        self.assertEqual(w_array.storage, [1, 2])
+        self.assertEqual(w_copy.storage, [5, 2])
+
+    def test_concat_integers(self):
+        w_array = ints(1)
+        w_array.concat(ints(2, 3))
+        self.assertIs(w_array.strategy, objects.integer_strategy)
+        self.assertEqual(w_array.storage, [1, 2, 3])
+
+    def test_concat_objects(self):
+        w_array = ints(1)
+        w_array.concat(wrap_array([w_nil]))
+        self.assertIs(w_array.strategy, objects.object_strategy)
+        self.assertEqual(inspected(w_array), ["1", "nil"])
+
+        w_objects = wrap_array([w_nil])
+        w_objects.concat(ints(1))
+        self.assertEqual(inspected(w_objects), ["nil", "1"])
+
+
+def iterated(w_iterable):
+    values = []
+    w_iterator = w_iterable.iter()
+    while not w_iterator.done():
+        values.append(w_iterator.value().inspect())
+        w_iterator = w_iterator.next()
+    return values
+
+
+class TestRange(TestCase):
+    def test_inclusive(self):
+        w_range = W_Range(1, 3, False)
+        self.assertEqual(w_range.length(), 3)
+        self.assertEqual(iterated(w_range), ["1", "2", "3"])
+
+    def test_exclusive(self):
+        w_range = W_Range(1, 3, True)
+        self.assertEqual(w_range.length(), 2)
+        self.assertEqual(iterated(w_range), ["1", "2"])
+
+    def test_empty(self):
+        w_range = W_Range(3, 1, False)
+        self.assertEqual(w_range.length(), 0)
+        self.assertEqual(iterated(w_range), [])
+        self.assertEqual(inspected(w_range.to_array()), [])
+
+    def test_to_array_is_unboxed(self):
+        w_array = W_Range(-1, 2, False).to_array()
+        self.assertIs(w_array.strategy, objects.integer_strategy)
+        self.assertEqual(w_array.storage, [-1, 0, 1, 2])
+
+    def test_iterators_do_not_change(self):
+        w_iterator = W_Range(1, 3, False).iter()
+        w_next = w_iterator.next()
+        self.assertEqual(w_iterator.value().value, 1)
+        self.assertEqual(w_next.value().value, 2)
+
+    def test_array_iterator(self):
+        self.assertEqual(iterated(ints(1, 2)), ["1", "2"])
+        self.assertIsNone(wrap_int(1).iter())
+
+
+class TestString(TestCase):
+    def test_str_w(self):
+        w_string = wrap_string("foo")
+        self.assertEqual(w_string.str_w(), "foo")
+        self.assertEqual(w_string.length(), 3)
+        self.assertEqual(w_string.inspect(), '"foo"')
+        self.assertEqual(w_string.to_s(), "foo")
+
+    def test_inspect_escapes(self):
+        self.assertEqual(wrap_string('a"\\\n').inspect(), '"a\\"\\\\\\n"')
+
+    def test_eq(self):
+        self.assertTrue(wrap_string("a").eq(wrap_string("a")))
+        self.assertFalse(wrap_string("a").eq(wrap_string("ab")))
+        self.assertFalse(wrap_string("1").eq(wrap_int(1)))
+
+    def test_share_is_copy_on_write(self):
+        w_string = wrap_string("foo")
+        w_copy = w_string.share()
+        self.assertIs(w_copy.chars(), w_string.chars())
+        w_copy.append(wrap_string("!"))
+        self.assertEqual(w_string.str_w(), "foo")
+        self.assertEqual(w_copy.str_w(), "foo!")
+        self.assertIsNot(w_copy.chars(), w_string.chars())
+
+    def test_unshared_append_is_in_place(self):
+        w_string = wrap_string("foo")
+        chars = w_string.chars()
+        w_string.append(wrap_string("bar"))
+        self.assertIs(w_string.chars(), chars)
+        self.assertEqual(w_string.str_w(), "foobar")
+
+    def test_add_builds_a_rope(self):
+        w_string = wrap_string("")
+        for c in "abcde":
+            w_string = w_string.add(wrap_string(c))
+        self.assertIsInstance(w_string.node, objects.ConcatNode)
+        self.assertEqual(w_string.length(), 5)
+        self.assertEqual(w_string.str_w(), "abcde")
+        self.assertIsInstance(w_string.node, objects.FlatNode)
+
+    def test_deep_rope(self):
+        w_string = wrap_string("")
+        for _ in range(10000):
+            w_string = w_string.add(wrap_string("x"))
+        self.assertEqual(w_string.str_w(), "x" * 10000)
+
+    def test_operands_of_a_rope_are_not_mutated(self):
+        w_left, w_right = wrap_string("a"), wrap_string("b")
+        w_both = w_left.add(w_right)
+        w_left.append(wrap_string("!"))
+        w_both.append(wrap_string("?"))
+        self.assertEqual(w_left.str_w(), "a!")
+        self.assertEqual(w_right.str_w(), "b")
+        self.assertEqual(w_both.str_w(), "ab?")
+
+    def test_add_non_string(self):
+        with self.assertRaises(objects.RubyTypeError):
+            wrap_string("a").add(wrap_int(1))
+
+
+class TestBuildString(TestCase):
+    def test_build_string(self):
+        w_rope = wrap_string("b").add(wrap_string("c"))
+        w_string = build_string(
+            [wrap_string("a"), w_rope, wrap_int(12), objects.w_nil],
+        )
+        self.assertEqual(w_string.str_w(), "abc12")
+        self.assertFalse(w_string.shared)
+
+    def test_parts_are_copied(self):
+        w_part = wrap_string("a")
+        w_string = build_string([w_part])
+        w_string.append(wrap_string("b"))
+        self.assertEqual(w_part.str_w(), "a")
+
+    def test_empty(self):
+        self.assertEqual(build_string([]).str_w(), "")
+
+
+class TestSymbols(TestCase):
+    def test_interned(self):
+        self.assertIs(symbols.intern("foo"), symbols.intern("foo"))
+        self.assertIsNot(symbols.intern("foo"), symbols.intern("bar"))
+
+    def test_eq_is_identity(self):
+        w_foo = symbols.intern("foo")
+        self.assertTrue(w_foo.eq(symbols.intern("foo")))
+        self.assertFalse(w_foo.eq(symbols.intern("bar")))
+        self.assertFalse(w_foo.eq(wrap_string("foo")))
+
+    def test_inspect(self):
+        w_foo = symbols.intern("foo")
+        self.assertEqual(w_foo.inspect(), ":foo")
+        self.assertEqual(w_foo.to_s(), "foo")
+        self.assertIs(w_foo.getclass(), objects.w_symbol_class)
+
+    def test_methods_are_keyed_by_symbol(self):
+        w_class = W_Class("Foo", w_object_class)
+        w_name = symbols.intern("foo")
+        w_method = objects.W_Primitive(w_name)
+        w_class.define_method(w_name, w_method)
+        self.assertIs(w_class.lookup(symbols.intern("foo")), w_method)
+        self.assertIsNone(w_class.lookup(symbols.intern("bar")))
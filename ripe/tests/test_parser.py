@@ -1,19 +1,36 @@
+from StringIO import StringIO
 from textwrap import dedent
 from unittest import TestCase
 
-from pypy.rlib.parsing.parsing import ParseError
-from pypy.rlib.parsing.deterministic import LexerError
-
 from ripe import parser
+from ripe.lexer import (
+    LexerError,
+    StreamLexer,
+    double_quoted_value,
+    interpolation_bounds,
+    single_quoted_value,
+)
+from ripe.parser import ParseError, Parser
 from ripe.parser import (
+    Array,
     Assign,
     BinOp,
+    Call,
+    Class,
     Compound,
     DoubleQString,
+    Each,
     Expression,
     If,
+    Index,
+    IndexAssign,
     Int,
+    Interpolation,
     Method,
+    Puts,
+    Range,
+    Return,
+    Symbol,
     Unless,
     Until,
     Variable,
@@ -111,6 +128,105 @@ class TestString(TestCase, ParserTestMixin):
     def test_foo_double(self):
         self.assertParses('"foo"', DoubleQString("foo"))
 
+    def test_append(self):
+        self.assertParses(
+            "a << 'b' + 'c'",
+            Call(
+                Variable("a"),
+                "<<",
+                [BinOp(SingleQString("b"), "+", SingleQString("c"))],
+            ),
+        )
+
+
+class TestInterpolation(TestCase, ParserTestMixin):
+
+    surround = Expression
+
+    def test_interpolation(self):
+        self.assertParses(
+            '"a #{b} c"',
+            Interpolation(
+                ["a ", " c"], [Compound([Expression(Variable("b"))])],
+            ),
+        )
+
+    def test_only_code(self):
+        self.assertParses(
+            '"#{1}#{b + 2}"',
+            Interpolation(
+                ["", "", ""],
+                [
+                    Compound([Expression(Int(1))]),
+                    Compound([Expression(BinOp(Variable("b"), "+", Int(2)))]),
+                ],
+            ),
+        )
+
+    def test_nested_quotes(self):
+        self.assertParses(
+            r'''"#{"x#{'y'}"}"''',
+            Interpolation(
+                ["", ""],
+                [
+                    Compound([
+                        Expression(
+                            Interpolation(
+                                ["x", ""],
+                                [Compound([Expression(SingleQString("y"))])],
+                            ),
+                        ),
+                    ]),
+                ],
+            ),
+        )
+
+    def test_escaped(self):
+        self.assertParses(r'"\#{b}"', DoubleQString(r"\#{b}"))
+
+    def test_single_quoted_strings_are_not_interpolated(self):
+        self.assertParses("'#{b}'", SingleQString("#{b}"))
+
+    def test_error_position(self):
+        with self.assertRaises(ParseError) as e:
+            parser.parse('a = 1\nputs "x#{)}"')
+        self.assertEqual((e.exception.lineno, e.exception.column), (2, 10))
+
+    def test_unterminated(self):
+        with self.assertRaises(LexerError):
+            parser.parse('"#{"}"')
+
+
+class TestStringValues(TestCase):
+    def test_single_quoted(self):
+        self.assertEqual(single_quoted_value(r"it\'s \\ \n"), "it's \\ \\n")
+
+    def test_double_quoted(self):
+        self.assertEqual(
+            double_quoted_value(r'a\tb\n\"\\\q'), 'a\tb\n"\\q',
+        )
+
+    def test_interpolation_bounds(self):
+        self.assertEqual(interpolation_bounds("a#{b}#{{}}"), [3, 4, 7, 9])
+        self.assertEqual(interpolation_bounds(r"\#{b}#c{}"), [])
+
+
+class TestSymbol(TestCase, ParserTestMixin):
+
+    surround = Expression
+
+    def test_symbol(self):
+        self.assertParses(":foo_1", Symbol("foo_1"))
+
+    def test_comparison(self):
+        self.assertParses(
+            "a == :Foo", BinOp(Variable("a"), "==", Symbol("Foo")),
+        )
+
+    def test_missing_name(self):
+        with self.assertRaises(LexerError):
+            parser.parse(": foo")
+
 
 class TestPseudoVariables(TestCase, ParserTestMixin):
 
@@ -162,6 +278,29 @@ class TestBinOp(TestCase, ParserTestMixin):
     def test_subtract_int_and_var(self):
         self.assertParses("1 - foo", BinOp(Int(1), "-", Variable("foo")))
 
+    def test_left_associative(self):
+        self.assertParses(
+            "1 - 2 + 3", BinOp(BinOp(Int(1), "-", Int(2)), "+", Int(3)),
+        )
+
+    def test_precedence(self):
+        self.assertParses(
+            "a + 1 == 2 - b",
+            BinOp(
+                BinOp(Variable("a"), "+", Int(1)),
+                "==",
+                BinOp(Int(2), "-", Variable("b")),
+            ),
+        )
+
+    def test_parentheses(self):
+        self.assertParses(
+            "1 - (2 + 3)", BinOp(Int(1), "-", BinOp(Int(2), "+", Int(3))),
+        )
+
+    def test_continued_on_next_line(self):
+        self.assertParses("2 +\n6", BinOp(Int(2), "+", Int(6)))
+
 
 class TestConditional(TestCase, ParserTestMixin):
 
@@ -290,9 +429,286 @@ class TestMethodDefinition(TestCase, ParserTestMixin):
         )
 
 
+class TestReturn(TestCase, ParserTestMixin):
+    def test_return(self):
+        self.assertParses("return 1 + 2", Return(BinOp(Int(1), "+", Int(2))))
+
+    def test_return_nothing(self):
+        source = dedent("""
+        def foo
+            return
+        end
+        """)
+
+        self.assertParses(
+            source,
+            Expression(
+                Method("foo", [], Compound([Return(Variable("nil").fold())])),
+            ),
+        )
+
+
+class TestCall(TestCase, ParserTestMixin):
+
+    surround = Expression
+
+    def test_call_on_self(self):
+        self.assertParses("foo()", Call(None, "foo", []))
+
+    def test_call_on_self_with_args(self):
+        self.assertParses(
+            "foo(1, a + 2)",
+            Call(None, "foo", [Int(1), BinOp(Variable("a"), "+", Int(2))]),
+        )
+
+    def test_call_on_receiver(self):
+        self.assertParses("a.foo", Call(Variable("a"), "foo", []))
+
+    def test_chained_calls(self):
+        self.assertParses(
+            "a.foo(1).bar",
+            Call(Call(Variable("a"), "foo", [Int(1)]), "bar", []),
+        )
+
+    def test_call_on_parenthesized(self):
+        self.assertParses(
+            "(1 + 2).foo(3)",
+            Call(BinOp(Int(1), "+", Int(2)), "foo", [Int(3)]),
+        )
+
+    def test_calls_bind_tighter_than_operators(self):
+        self.assertParses(
+            "1 + a.foo",
+            BinOp(Int(1), "+", Call(Variable("a"), "foo", [])),
+        )
+
+    def test_args_across_lines(self):
+        source = dedent("""
+        foo(
+            1,
+            2
+        )
+        """)
+
+        self.assertParses(source, Call(None, "foo", [Int(1), Int(2)]))
+
+
+class TestArray(TestCase, ParserTestMixin):
+
+    surround = Expression
+
+    def test_empty(self):
+        self.assertParses("[]", Array([]))
+
+    def test_array(self):
+        self.assertParses(
+            "[1, a, [nil]]",
+            Array([Int(1), Variable("a"), Array([Variable("nil")])]),
+        )
+
+    def test_index(self):
+        self.assertParses(
+            "a[1][b + 1]",
+            Index(
+                Index(Variable("a"), Int(1)),
+                BinOp(Variable("b"), "+", Int(1)),
+            ),
+        )
+
+    def test_index_literal_and_call(self):
+        self.assertParses(
+            "[1, 2][0].foo",
+            Call(Index(Array([Int(1), Int(2)]), Int(0)), "foo", []),
+        )
+
+    def test_index_assign(self):
+        self.assertParses(
+            "a[0][1] = 2",
+            IndexAssign(Index(Variable("a"), Int(0)), Int(1), Int(2)),
+        )
+
+
+class TestRange(TestCase, ParserTestMixin):
+
+    surround = Expression
+
+    def test_inclusive(self):
+        self.assertParses("1..2", Range(Int(1), Int(2), False))
+
+    def test_exclusive(self):
+        self.assertParses("1...a", Range(Int(1), Variable("a"), True))
+
+    def test_binds_loosest(self):
+        self.assertParses(
+            "a + 1..b - 1",
+            Range(
+                BinOp(Variable("a"), "+", Int(1)),
+                BinOp(Variable("b"), "-", Int(1)),
+                False,
+            ),
+        )
+
+    def test_method_call(self):
+        self.assertParses(
+            "(1..n).to_a",
+            Call(Range(Int(1), Variable("n"), False), "to_a", []),
+        )
+
+
+class TestEach(TestCase, ParserTestMixin):
+
+    surround = Expression
+
+    def test_each(self):
+        source = dedent("""
+        (1..3).each do |i|
+            puts i
+        end
+        """)
+
+        self.assertParses(
+            source,
+            Each(
+                Range(Int(1), Int(3), False),
+                "i",
+                Compound([Puts(Variable("i"))]),
+            ),
+        )
+
+    def test_no_param(self):
+        self.assertParses(
+            "a.each do\nend", Each(Variable("a"), None, Compound()),
+        )
+
+    def test_each_without_block(self):
+        self.assertParses("a.each", Call(Variable("a"), "each", []))
+
+
 class TestClass(TestCase, ParserTestMixin):
 
     surround = Expression
 
     def test_instance_variable(self):
         self.assertParses("@foo", Variable("@foo"))
+
+    def test_empty_class(self):
+        self.assertParses("class Foo\nend", Class("Foo", None, Compound()))
+
+    def test_class(self):
+        source = dedent("""
+        class Foo < Bar
+            def foo
+                @foo
+            end
+        end
+        """)
+
+        self.assertParses(
+            source,
+            Class(
+                "Foo",
+                Variable("Bar"),
+                Compound(
+                    [
+                        Expression(
+                            Method(
+                                "foo",
+                                [],
+                                Compound([Expression(Variable("@foo"))]),
+                            ),
+                        ),
+                    ],
+                ),
+            ),
+        )
+
+    def test_class_name_must_be_constant(self):
+        with self.assertRaises(ParseError):
+            parser.parse("class foo\nend")
+
+
+class TestStatementAtATime(TestCase):
+    def test_statements_from_stream(self):
+        source = StringIO(dedent("""
+        x = 12
+
+        while x != 1 do
+            x = x - 1
+        end; puts x
+        """))
+        statements = Parser(StreamLexer(source))
+        self.assertEqual(
+            [
+                statements.parse_next_statement(),
+                statements.parse_next_statement(),
+                statements.parse_next_statement(),
+                statements.parse_next_statement(),
+            ],
+            [
+                Assign("x", Int(12)),
+                Expression(
+                    While(
+                        BinOp(Variable("x"), "!=", Int(1)),
+                        Compound([
+                            Assign("x", BinOp(Variable("x"), "-", Int(1))),
+                        ])
+                    ),
+                ),
+                Puts(Variable("x")),
+                None,
+            ],
+        )
+
+    def test_junk_after_statement(self):
+        statements = Parser(StreamLexer(StringIO("x = 12 13")))
+        with self.assertRaises(ParseError):
+            statements.parse_next_statement()
+
+
+class TestPositions(TestCase):
+    def test_statements(self):
+        program = parser.parse("a = 1\n\n  puts a\nb")
+        self.assertEqual(
+            [
+                (statement.lineno, statement.column)
+                for statement in program.statements
+            ],
+            [(1, 1), (3, 3), (4, 1)],
+        )
+
+    def test_expressions(self):
+        [statement] = parser.parse("x = (a +\n  -1) - b").statements
+        subtract = statement.expr
+        add = subtract.left
+        self.assertEqual((subtract.lineno, subtract.column), (2, 7))
+        self.assertEqual((add.lineno, add.column), (1, 8))
+        self.assertEqual((add.left.lineno, add.left.column), (1, 6))
+        self.assertEqual((add.right.lineno, add.right.column), (2, 3))
+
+    def test_positions_do_not_affect_equality(self):
+        self.assertEqual(parser.parse("\n\n  a"), parser.parse("a"))
+
+    def test_folding_keeps_statement_positions(self):
+        program = parser.parse("a = 1\nif true\n  b = 1 + 1\nend").fold()
+        self.assertEqual(
+            [statement.lineno for statement in program.statements], [1, 3],
+        )
+
+
+class TestErrors(TestCase):
+    def test_unexpected_token(self):
+        with self.assertRaises(ParseError) as e:
+            parser.parse("a = 1\nb = )")
+        self.assertEqual((e.exception.lineno, e.exception.column), (2, 5))
+
+    def test_missing_end(self):
+        with self.assertRaises(ParseError):
+            parser.parse("while 1 do\n  a = 2\n")
+
+    def test_unterminated_string(self):
+        with self.assertRaises(LexerError):
+            parser.parse("'foo")
+
+    def test_invalid_digit(self):
+        with self.assertRaises(LexerError):
+            parser.parse("0b102")
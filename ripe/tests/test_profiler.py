@@ -0,0 +1,88 @@
+from textwrap import dedent
+from unittest import TestCase
+
+from ripe import compiler, interpreter, profiler
+from ripe.compiler import compile_ast
+from ripe.parser import parse
+
+
+LOOP = dedent("""
+n = 0
+while n != 10
+    n = n + 1
+end
+""")
+
+
+class TestProfiler(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, profiler, "ENABLED", profiler.ENABLED)
+        self.addCleanup(profiler.profile.reset)
+        self.addCleanup(setattr, profiler.profile, "active", False)
+        profiler.ENABLED = True
+        profiler.profile.reset()
+        profiler.profile.active = True
+
+        self.bytecode = compile_ast(parse(LOOP))
+
+    def test_opcode_counts(self):
+        interpreter.run(self.bytecode)
+        counts = profiler.profile.opcode_counts
+        self.assertEqual(counts[compiler.JUMP_BACKWARD], 10)
+        self.assertEqual(counts[compiler.INCR_VARIABLE_BY_CONST], 10)
+        self.assertEqual(counts[compiler.LOAD_VAR_LOAD_CONST], 11)
+        self.assertEqual(counts[compiler.RETURN], 1)
+
+    def test_location_counts(self):
+        interpreter.run(self.bytecode)
+        code_profile = profiler.profile.codes[self.bytecode]
+        self.assertEqual(max(code_profile.counts), 11)
+        self.assertEqual(code_profile.counts[0], 1)
+
+    def test_loops(self):
+        interpreter.run(self.bytecode)
+        code_profile = profiler.profile.codes[self.bytecode]
+        [loop] = code_profile.loops.values()
+        self.assertEqual(loop.iterations, 10)
+        self.assertGreaterEqual(loop.elapsed, 0)
+
+    def test_inactive(self):
+        profiler.profile.active = False
+        interpreter.run(self.bytecode)
+        self.assertEqual(profiler.profile.codes, {})
+        self.assertEqual(sum(profiler.profile.opcode_counts), 0)
+
+    def test_disabled(self):
+        profiler.ENABLED = False
+        interpreter.run(self.bytecode)
+        self.assertEqual(profiler.profile.codes, {})
+
+    def test_disabled_makes_no_calls(self):
+        def called(*args):
+            self.fail("the profiler was called while disabled")
+
+        for name in ["code_profile", "instruction", "loop_iteration"]:
+            setattr(profiler.profile, name, called)
+            self.addCleanup(delattr, profiler.profile, name)
+        profiler.ENABLED = False
+        interpreter.run(self.bytecode)
+
+    def test_report(self):
+        interpreter.run(self.bytecode)
+        report = profiler.profile.report(interpreter.get_printable_location)
+        lines = report.splitlines()
+        self.assertEqual(lines[0], "Instructions by opcode:")
+        self.assertEqual(lines[1].split()[0], "11")
+
+        loops = lines.index("Loops by iterations:")
+        self.assertEqual(lines[loops + 1].split()[0], "10")
+        self.assertEqual(len(lines), loops + 2)
+
+    def test_report_entries(self):
+        lines = []
+        profiler.report_entries(
+            lines,
+            [profiler.Entry(7, "a"), profiler.Entry(1234, "b")],
+            limit=2,
+        )
+        self.assertEqual(lines, ["        1234  b", "           7  a"])
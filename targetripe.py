@@ -1,33 +1,146 @@
 """
-Execute ./ripe-c <filename>
+Execute ./ripe-c [options] <filename>
+
+    --stream    run each top-level statement as soon as it has been read,
+                rather than compiling the whole file first
+    --jit <params>
+                set JIT parameters, e.g.
+                threshold=1000,function_threshold=1500,trace_limit=6000
+    --jit-stats print how many loops and bridges the JIT compiled and how many
+                traces it aborted, by location, when finished
+    --profile   count the instructions run and time each loop, then print the
+                hottest ones (only if translated with --profile)
 
 """
 
+import os
 import sys
 
+from pypy.rlib import jit
 from pypy.rlib.streamio import open_file_as_stream
+from pypy.rpython.annlowlevel import cast_base_ptr_to_instance
 from pypy.jit.codewriter.policy import JitPolicy
+from pypy.jit.metainterp.jitprof import counter_names
 
-from ripe.interpreter import interpret
+from ripe import jitstats, output, profiler
+from ripe.compiler import ByteCode
+from ripe.interpreter import (
+    driver,
+    get_printable_location,
+    interpret_file,
+    interpret_stream,
+)
+from ripe.lexer import SourceError
+from ripe.objects import RubyError
 
 
 def main(argv):
-    if not len(argv) == 2:
+    stream = False
+    show_jit_stats = False
+    paths = []
+    i = 1
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "--stream":
+            stream = True
+        elif arg == "--jit-stats":
+            show_jit_stats = True
+        elif arg == "--profile":
+            if not profiler.ENABLED:
+                print "Profiling was not enabled when translating."
+                return 1
+            profiler.profile.active = True
+        elif arg == "--jit":
+            i += 1
+            if i >= len(argv):
+                print __doc__
+                return 1
+            try:
+                jit.set_user_param(driver, argv[i])
+            except ValueError:
+                print "Invalid JIT parameters: %s" % (argv[i],)
+                return 1
+        else:
+            paths.append(arg)
+        i += 1
+
+    if not len(paths) == 1:
         print __doc__
         return 1
-    f = open_file_as_stream(argv[1])
-    data = f.readall()
-    f.close()
-    interpret(data)
+    path = paths[0]
+
+    try:
+        try:
+            if stream:
+                f = open_file_as_stream(path)
+                try:
+                    interpret_stream(f, path)
+                finally:
+                    f.close()
+            else:
+                interpret_file(path)
+        finally:
+            output.stdout.flush()
+    except SourceError as e:
+        os.write(2, e.nice_error_message(path) + "\n")
+        return 1
+    except RubyError as e:
+        os.write(2, e.nice_error_message() + "\n")
+        return 1
+
+    if profiler.ENABLED and profiler.profile.active:
+        os.write(2, profiler.profile.report(get_printable_location))
+    if show_jit_stats:
+        os.write(2, jitstats.stats.report())
     return 0
 
 
+def greenkey_location(greenkey):
+    pc = greenkey[0].getint()
+    bc = cast_base_ptr_to_instance(ByteCode, greenkey[2].getref_base())
+    return get_printable_location(pc, bc.code, bc)
+
+
+class JitHooks(jit.JitHookInterface):
+    """
+    Record what the JIT compiles and aborts in :data:`jitstats.stats`.
+
+    """
+
+    def __init__(self):
+        self.loop_locations = {}
+
+    def on_abort(self, reason, jitdriver, greenkey, greenkey_repr):
+        name = counter_names[reason]
+        jitstats.stats.aborted(
+            jitstats.ABORT_REASONS.get(name, name), greenkey_repr,
+        )
+
+    def after_compile(self, debug_info):
+        location = greenkey_location(debug_info.greenkey)
+        self.loop_locations[debug_info.looptoken.number] = location
+        jitstats.stats.loop_compiled(location)
+
+    def after_compile_bridge(self, debug_info):
+        # a bridge's looptoken is that of the loop it's attached to
+        jitstats.stats.bridge_compiled(
+            self.loop_locations.get(
+                debug_info.looptoken.number, jitstats.UNKNOWN_LOCATION,
+            )
+        )
+
+
+jit_hooks = JitHooks()
+
+
 def target(driver, args):
+    if "--profile" in args:
+        profiler.ENABLED = True
     return main, None
 
 
 def jitpolicy(driver):
-    return JitPolicy()
+    return JitPolicy(jit_hooks)
 
 
 if __name__ == '__main__':